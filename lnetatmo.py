@@ -15,23 +15,30 @@ import warnings
 if __name__ == "__main__": warnings.filterwarnings("ignore") # For installation test only
 
 from sys import version_info
+import os
 from os import getenv
 from os.path import expanduser, exists
-import platform
 import json, time
-import imghdr
-import warnings
 import logging
+import threading
+import heapq, itertools, random, bisect
+from array import array
+from collections import deque, OrderedDict
 
 # Just in case method could change
 PYTHON3 = (version_info.major > 2)
 
 # HTTP libraries depends upon Python 2 or 3
 if PYTHON3 :
-    import urllib.parse, urllib.request
+    import urllib.parse
+    import select
+    import queue
+    # http.client and ssl are loaded with the first connection (see _loadHttp)
+    http = ssl = None
 else:
     from urllib import urlencode
     import urllib2
+    import Queue as queue
 
 
 ######################## AUTHENTICATION INFORMATION ######################
@@ -64,26 +71,34 @@ cred = {                           # You can hard code authentication informatio
 
 CREDENTIALS = expanduser("~/.netatmo.credentials")
 
+# Levels 2 and 3 are only read when credentials are first needed (see _credential), not at import
+_CREDENTIALS = None
+
 def getParameter(key, default):
     return getenv(key, default[key])
 
-# 2 : Override hard coded values with credentials file if any
-if exists(CREDENTIALS) :
-    with open(CREDENTIALS, "r") as f:
-        cred.update({k.upper():v for k,v in json.loads(f.read()).items()})
-
-# 3 : Override final value with content of env variables if defined
-#     Warning, for Windows user, USERNAME contains by default the windows logged user name
-#     This usually lead to an authentication error
-if platform.system() == "Windows" and getenv("USERNAME", None):
-    warnings.warn("You are running on Windows and the USERNAME env var is set. " \
-                  "Be sure this env var contains Your Netatmo username " \
-                  "or clear it with <SET USERNAME=> before running your program\n", RuntimeWarning, stacklevel=3)
-
-_CLIENT_ID     = getParameter("CLIENT_ID", cred)
-_CLIENT_SECRET = getParameter("CLIENT_SECRET", cred)
-_USERNAME      = getParameter("USERNAME", cred)
-_PASSWORD      = getParameter("PASSWORD", cred)
+def _credential(key):
+    """
+    Return an authentication parameter : CLIENT_ID, CLIENT_SECRET, USERNAME or PASSWORD
+    """
+    global _CREDENTIALS
+    if _CREDENTIALS is None:
+        values = dict(cred)
+        # 2 : Override hard coded values with credentials file if any
+        if exists(CREDENTIALS) :
+            with open(CREDENTIALS, "r") as f:
+                values.update({k.upper():v for k,v in json.loads(f.read()).items()})
+
+        # 3 : Override final value with content of env variables if defined
+        #     Warning, for Windows user, USERNAME contains by default the windows logged user name
+        #     This usually lead to an authentication error
+        if os.name == "nt" and getenv("USERNAME", None):
+            warnings.warn("You are running on Windows and the USERNAME env var is set. " \
+                          "Be sure this env var contains Your Netatmo username " \
+                          "or clear it with <SET USERNAME=> before running your program\n", RuntimeWarning, stacklevel=3)
+
+        _CREDENTIALS = { k : getParameter(k, values) for k in ("CLIENT_ID", "CLIENT_SECRET", "USERNAME", "PASSWORD") }
+    return _CREDENTIALS[key]
 
 #########################################################################
 
@@ -131,6 +146,84 @@ _CAM_CHANGE_STATUS     = "/command/changestatus?status=%s"            # "on"|"of
 # Not working yet
 #_CAM_FTP_ACTIVE        = "/command/ftp_set_config?config=on_off:%s"   # "on"|"off"
 
+# HTTP connection pool settings (see ConnectionPool and configurePool)
+_POOL_MAXSIZE          = 4         # Idle connections kept per host
+_POOL_IDLE_TIMEOUT     = 60        # Seconds an idle connection is kept before being closed
+_READ_CHUNK            = 65536     # Buffer size used to stream response bodies
+_MAX_REDIRECTS         = 10        # Redirects followed by the connection pool, as urllib does
+
+# Response cache settings (see ResponseCache)
+_CACHE_CADENCE         = 600       # Netatmo weather stations upload their measures every 10 minutes
+_CACHE_MIN_TTL         = 60        # Minimum lifetime of a cached answer when an upload is overdue
+_CACHE_SECRETS         = ("access_token", "refresh_token", "client_secret", "password")
+
+# Request priorities (see RateLimiter), lower value is served first
+PRIORITY_POLL          = 0         # Interactive requests and realtime polling
+PRIORITY_DISCOVERY     = 1         # Devices discovery
+PRIORITY_BACKFILL      = 2         # History backfill and other background work
+
+# Netatmo API request limits per user : (window in seconds, maximum requests in the window)
+_RATE_LIMITS           = ( (10, 50), (3600, 500) )
+# Share of each window that a priority class can't use, kept for more urgent requests
+_RATE_RESERVE          = { PRIORITY_POLL : 0, PRIORITY_DISCOVERY : 0.1, PRIORITY_BACKFILL : 0.3 }
+_LIMITER_POLL          = 0.1       # Seconds between two polls of a queued non blocking request
+
+# Resilience settings for Netatmo API requests (see postRequest and CircuitBreaker)
+_RETRIES               = 3         # Retries of a request failing with a 5xx error or a timeout
+_BACKOFF_BASE          = 1         # Seconds before the first retry, doubled at each attempt (plus jitter)
+_BACKOFF_MAX           = 30
+_BREAKER_THRESHOLD     = 5         # Consecutive failures suspending the API calls
+_BREAKER_COOLDOWN      = 300       # Seconds before calling the API again after the circuit opened
+_QUOTA_HOLD_OFF        = 600       # Seconds without any request after a quota error
+_TOKEN_ERRORS          = (2, 3)    # Netatmo error codes : invalid and expired access token
+_QUOTA_ERRORS          = (26,)     # Netatmo error codes : user usage reached
+_RANDOM                = random.Random()    # Backoff jitter, can be seeded for reproducible tests
+
+# Access token management (see ClientAuth)
+_TOKEN_REFRESH_AHEAD   = 300       # Seconds before expiration at which the access token is renewed in background
+_TOKEN_RETRY_DELAY     = 60        # Seconds before trying again a failed background renewal
+
+# JSON decoding (see configureJson)
+_JSON_LOADS            = None      # orjson.loads when available, json.loads otherwise, chosen on first use
+_PROJECTION            = False     # Keep only the fields used by lnetatmo in getstationsdata and gethomedata answers
+_STATION_FIELDS        = ('_id', 'type', 'station_name', 'module_name', 'home_id', 'home_name', 'dashboard_data',
+                          'wifi_status', 'reachable', 'modules')
+_MODULE_FIELDS         = ('_id', 'type', 'module_name', 'dashboard_data', 'battery_percent', 'battery_vp',
+                          'rf_status', 'reachable')
+_HOME_FIELDS           = ('id', 'name', 'persons', 'events', 'cameras')
+_CAMERA_FIELDS         = ('id', 'type', 'name', 'status', 'vpn_url', 'is_local', 'light_mode_status')
+_EVENT_FIELDS          = ('id', 'type', 'time', 'camera_id', 'device_id', 'person_id', 'message', 'snapshot',
+                          'vignette', 'video_id', 'video_status', 'is_arrival', 'sub_type', 'event_list')
+_PERSON_FIELDS         = ('id', 'pseudo', 'out_of_sight', 'last_seen', 'face')
+
+# Cameras events (see CameraEvents)
+_EVENTS_KEPT           = 500       # Events kept per camera, the oldest are dropped first
+_EVENTS_RETENTION      = 7 * 24 * 3600     # Seconds of events kept before the latest event of a camera
+_EVENTS_SYNC_INTERVAL  = 30        # Seconds between two background fetches of the new events (see EventSync)
+_EVENTS_SYNC_SIZE      = 30        # Events asked with gethomedata for a home without any known event
+
+# Cameras urls (see HomeData.cameraUrls)
+_CAMERA_URLS_TTL       = 600       # Seconds the vpn and local urls of a camera are used before being checked again
+
+# Images (see ImageCache and HomeData.getLiveSnapshots)
+_IMAGE_CACHE_BYTES     = 50 * 1024 * 1024  # Size of the images kept on disk before the least recently used are deleted
+_SNAPSHOT_WORKERS      = 4         # Cameras asked concurrently for a live snapshot
+_IMAGE_MAGIC           = ( (b"\xff\xd8\xff", "jpeg"), (b"\x89PNG\r\n\x1a\n", "png"), (b"GIF87a", "gif"),
+                           (b"GIF89a", "gif"), (b"BM", "bmp") )
+
+# Measures history (see WeatherStationData.iterMeasure)
+_MEASURE_PAGE          = 1024      # Maximum points in a getmeasure answer
+_MEASURE_WORKERS       = 4         # Series fetched concurrently by iterMeasures
+_TIME_TYPECODE         = "q" if PYTHON3 else "l"     # array type of the measures timestamps
+_NAN                   = float("nan")
+# Measures available for each module type
+_MODULE_MEASURES       = { "NAMain" : "Temperature,CO2,Humidity,Noise,Pressure",
+                           "NAModule1" : "Temperature,Humidity",
+                           "NAModule2" : "WindStrength,WindAngle,GustStrength,GustAngle",
+                           "NAModule3" : "Rain",
+                           "NAModule4" : "Temperature,CO2,Humidity" }
+_TH_MODULES            = ("NAMain", "NAModule1", "NAModule4")    # Module types measuring temperature and humidity
+
 # UNITS used by Netatmo services
 UNITS = {
     "unit" : {
@@ -167,62 +260,203 @@ class AuthFailure( Exception ):
     pass
 
 
+class ApiError( Exception ):
+    """
+    HTTP error answered by a server. code is the HTTP status, error the Netatmo error code if any
+    """
+    def __init__(self, code, reason, error=None):
+        Exception.__init__(self, "code=%s, reason=%s" % (code, reason))
+        self.code = code
+        self.reason = reason
+        self.error = error
+
+
+class ApiUnavailable( Exception ):
+    """
+    The Netatmo API failed repeatedly, calls are suspended for a while
+    """
+    pass
+
+
 class ClientAuth:
     """
     Request authentication and keep access token available through token method. Renew it automatically if necessary
 
+    The access token is renewed in background shortly before it expires, and only one renewal is
+    in flight at a time (concurrent callers wait for it). When a tokenCache file is given, tokens
+    are saved in it (readable by the owner only) and reused by the next instances for the same
+    client and user, skipping the password authentication.
+    Requests of the account wait for its rate limiter (see accountLimiter).
+
     Args:
-        clientId (str): Application clientId delivered by Netatmo on dev.netatmo.com
-        clientSecret (str): Application Secret key delivered by Netatmo on dev.netatmo.com
-        username (str)
-        password (str)
+        clientId (Optional[str]): Application clientId delivered by Netatmo on dev.netatmo.com
+        clientSecret (Optional[str]): Application Secret key delivered by Netatmo on dev.netatmo.com
+        username (Optional[str])
+        password (Optional[str])
+            When None, the value is taken from the library, ~/.netatmo.credentials or the environment
         scope (Optional[str]): Default value is 'read_station'
             read_station: to retrieve weather station data (Getstationsdata, Getmeasure)
             read_camera: to retrieve Welcome data (Gethomedata, Getcamerapicture)
             access_camera: to access the camera, the videos and the live stream.
             Several value can be used at the same time, ie: 'read_station read_camera'
+        tokenCache (Optional[str]): Path of the file where tokens are kept between runs
+        refreshAhead (Optional[int]): Seconds before expiration at which the token is renewed in
+            background, None to only renew it when used after expiration
     """
 
-    def __init__(self, clientId=_CLIENT_ID,
-                       clientSecret=_CLIENT_SECRET,
-                       username=_USERNAME,
-                       password=_PASSWORD,
+    def __init__(self, clientId=None,
+                       clientSecret=None,
+                       username=None,
+                       password=None,
                        scope="read_station read_camera access_camera write_camera " \
-                                 "read_presence access_presence write_presence read_thermostat write_thermostat"):
-        
-        postParams = {
-                "grant_type" : "password",
-                "client_id" : clientId,
-                "client_secret" : clientSecret,
-                "username" : username,
-                "password" : password,
-                "scope" : scope
-                }
-        resp = postRequest(_AUTH_REQ, postParams)
-        if not resp: raise AuthFailure("Authentication request rejected")
-
+                                 "read_presence access_presence write_presence read_thermostat write_thermostat",
+                       tokenCache=None,
+                       refreshAhead=_TOKEN_REFRESH_AHEAD):
+
+        # Defaults from the library, the credentials file or the environment
+        if clientId is None : clientId = _credential("CLIENT_ID")
+        if clientSecret is None : clientSecret = _credential("CLIENT_SECRET")
+        if username is None : username = _credential("USERNAME")
+        if password is None : password = _credential("PASSWORD")
         self._clientId = clientId
         self._clientSecret = clientSecret
-        self._accessToken = resp['access_token']
-        self.refreshToken = resp['refresh_token']
-        self._scope = resp['scope']
-        self.expiration = int(resp['expire_in'] + time.time())
+        self._username = username
+        self._requestedScope = scope
+        self._tokenCache = tokenCache
+        self.refreshAhead = refreshAhead
+        self.cache = ResponseCache()
+        self.limiter = accountLimiter(clientId, username)
+        self._lock = threading.Lock()
+        self._timer = None
+        self._closed = False
+
+        if not self._loadTokens():
+            postParams = {
+                    "grant_type" : "password",
+                    "client_id" : clientId,
+                    "client_secret" : clientSecret,
+                    "username" : username,
+                    "password" : password,
+                    "scope" : scope
+                    }
+            resp = postRequest(_AUTH_REQ, postParams, auth=self)
+            if not resp: raise AuthFailure("Authentication request rejected")
+            self._setTokens(resp)
 
     @property
     def accessToken(self):
 
         if self.expiration < time.time(): # Token should be renewed
+            self.renewToken(self._accessToken)
+        return self._accessToken
+
+    def renewToken(self, rejected=None):
+        """
+        Get a new access token with the refresh token, whether the current one expired or not
+        If rejected is given and the current token already differs from it, another caller renewed
+        it in the meantime and the current token is returned without any request
+        """
+        with self._lock:
+            if rejected and rejected != self._accessToken : return self._accessToken
             postParams = {
                     "grant_type" : "refresh_token",
                     "refresh_token" : self.refreshToken,
                     "client_id" : self._clientId,
                     "client_secret" : self._clientSecret
                     }
-            resp = postRequest(_AUTH_REQ, postParams)
-            self._accessToken = resp['access_token']
-            self.refreshToken = resp['refresh_token']
-            self.expiration = int(resp['expire_in'] + time.time())
-        return self._accessToken
+            resp = postRequest(_AUTH_REQ, postParams, auth=self)
+            if not resp:
+                # Next instances must authenticate again instead of reusing these tokens
+                self._saveTokens(forget=True)
+                raise AuthFailure("Token refresh rejected")
+            self._setTokens(resp)
+            return self._accessToken
+
+    def close(self):
+        """
+        Stop the background token renewal
+        """
+        self._closed = True
+        if self._timer : self._timer.cancel()
+
+    def _setTokens(self, resp):
+        self._accessToken = resp['access_token']
+        self.refreshToken = resp['refresh_token']
+        self._scope = resp.get('scope', getattr(self, '_scope', None))
+        self.expiration = int(resp['expire_in'] + time.time())
+        self._saveTokens()
+        self._schedule(self.expiration - self.refreshAhead - time.time() if self.refreshAhead is not None else None)
+
+    def _schedule(self, delay):
+        if self._timer : self._timer.cancel()
+        if delay is None or self._closed : return
+        self._timer = threading.Timer(max(0, delay), self._backgroundRenew)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _backgroundRenew(self):
+        try:
+            self.renewToken(self._accessToken)
+        except AuthFailure as e:
+            # Refresh token revoked or invalid, retrying won't help : the next use of accessToken raises
+            logger.error("Background token renewal rejected (%s), not retried" % e)
+        except Exception as e:
+            logger.warning("Background token renewal failed (%s), retrying in %d s" % (e, _TOKEN_RETRY_DELAY))
+            self._schedule(_TOKEN_RETRY_DELAY)
+
+    def _tokenKey(self):
+        return "%s:%s" % (self._clientId, self._username)
+
+    def _loadTokens(self):
+        if not self._tokenCache or not exists(self._tokenCache) : return False
+        try:
+            with open(self._tokenCache, "r") as f:
+                tokens = json.load(f).get(self._tokenKey())
+        except (IOError, ValueError) as e:
+            logger.warning("Unreadable token cache %s: %s" % (self._tokenCache, e))
+            return False
+        if not tokens or tokens.get('requested_scope') != self._requestedScope : return False
+        self._accessToken = tokens['access_token']
+        self.refreshToken = tokens['refresh_token']
+        self._scope = tokens.get('scope')
+        self.expiration = tokens['expiration']
+        if self.expiration - (self.refreshAhead or 0) > time.time():
+            self._schedule(self.expiration - (self.refreshAhead or 0) - time.time() if self.refreshAhead is not None else None)
+            return True
+        # Access token is too old, the refresh token still spares the password authentication
+        try:
+            self.renewToken()
+            return True
+        except (AuthFailure, ApiUnavailable) + _TRANSIENT_ERRORS as e:
+            logger.info("Cached refresh token unusable (%s)" % e)
+            return False
+
+    def _saveTokens(self, forget=False):
+        if not self._tokenCache : return
+        tokens = dict()
+        if exists(self._tokenCache):
+            try:
+                with open(self._tokenCache, "r") as f:
+                    tokens = json.load(f)
+            except (IOError, ValueError):
+                pass
+        if forget:
+            if tokens.pop(self._tokenKey(), None) is None : return
+        else:
+            tokens[self._tokenKey()] = { 'access_token' : self._accessToken,
+                                         'refresh_token' : self.refreshToken,
+                                         'scope' : self._scope,
+                                         'requested_scope' : self._requestedScope,
+                                         'expiration' : self.expiration }
+        # Write a private file then move it in place, so that the cache is never seen partially written
+        tmp = self._tokenCache + ".tmp"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(tokens, f)
+            getattr(os, "replace", os.rename)(tmp, self._tokenCache)
+        except (IOError, OSError) as e:
+            logger.warning("Unable to save tokens in %s: %s" % (self._tokenCache, e))
 
 
 class User:
@@ -232,9 +466,9 @@ class User:
     Args:
         authData (ClientAuth): Authentication information with a working access Token
     """
-    warnings.warn("The 'User' class is no longer maintained by Netatmo",
-            DeprecationWarning )
     def __init__(self, authData):
+        warnings.warn("The 'User' class is no longer maintained by Netatmo",
+                DeprecationWarning, stacklevel=2 )
         postParams = {
                 "access_token" : authData.accessToken
                 }
@@ -306,31 +540,149 @@ class WeatherStationData:
 
     Args:
         authData (ClientAuth): Authentication information with a working access Token
+        home (Optional[str]): Name of the default home
+        station (Optional[str]): Name of the default station
+        useCache (bool): Reuse the answer cached in authData until Netatmo is expected to have new data.
+            When False, the request is always sent and its answer refreshes the cache
+        priority (int): Rate limiter priority of the requests (PRIORITY_POLL, PRIORITY_DISCOVERY, PRIORITY_BACKFILL)
+        store (Optional[lnetatmo_store.MeasureStore]): Measures history synchronized incrementally (see
+            syncStore), then consulted instead of the API by getMeasure, MinMaxTH and the range queries
+            it covers
     """
-    def __init__(self, authData, home=None, station=None):
+    _revision = 0           # Incremented by each refresh with changes
+    _changed = None         # Station or module id : revision of its last change
+    store = None
+
+    def __init__(self, authData, home=None, station=None, useCache=True, priority=PRIORITY_POLL, store=None):
+        self._authData = authData
         self.getAuthToken = authData.accessToken
+        self.priority = priority
+        self.store = store
+        self._storeSynced = dict()      # station id : time of its last store synchronization
+        self._storeLock = threading.Lock()
         postParams = {
                 "access_token" : self.getAuthToken
                 }
-        resp = postRequest(_GETSTATIONDATA_REQ, postParams)
-        self.rawData = resp['body']['devices']
-        # Weather data
-        if not self.rawData : raise NoDevice("No weather station in any homes")
+        resp = postRequest(_GETSTATIONDATA_REQ, postParams, cache=getattr(authData, "cache", None), bypassCache=not useCache,
+                           priority=priority, auth=authData)
+        self._parse(resp, home, station)
+
+    def refresh(self, useCache=True):
+        """
+        Update the data in place with a new getstationsdata answer and return the RefreshChanges.
+        When no station or module was added or removed, the existing devices dictionaries are updated
+        and the lookup tables kept as is, otherwise everything is rebuilt
+        """
+        self.getAuthToken = self._authData.accessToken
+        postParams = {
+                "access_token" : self.getAuthToken
+                }
+        resp = postRequest(_GETSTATIONDATA_REQ, postParams, cache=getattr(self._authData, "cache", None), bypassCache=not useCache,
+                           priority=self.priority, auth=self._authData)
+        return self._update(resp)
+
+    def _update(self, resp):
+        changes = self._merge(resp)
+        if changes:
+            # Record when each station and module changed for lastDataChanges
+            self._revision += 1
+            for i in changes.added + changes.updated : self._changed[i] = self._revision
+            for i in changes.removed : self._changed.pop(i, None)
+        return changes
+
+    def _merge(self, resp):
+        # Same (cached) answer as the current one, nothing can have changed
+        if resp is self._resp : return RefreshChanges()
+        devices = resp['body']['devices']
+        if _topology(devices) != _topology(self.rawData):
+            before = _modulesById(self.rawData)
+            self._parse(resp, self._home, self._station)
+            after = _modulesById(self.rawData)
+            return RefreshChanges(added = [i for i in after if i not in before],
+                                  removed = [i for i in before if i not in after],
+                                  updated = [i for i in after if i in before and _measuresChanged(before[i], after[i])])
+        current = _modulesById(self.rawData)
+        updated = []
+        for i,m in _modulesById(devices).items():
+            old = current[i]
+            if _measuresChanged(old, m) : updated.append(i)
+            modules = old.get('modules')
+            old.clear()
+            old.update(m)
+            # Module dicts of a station are updated on their own, keep the known ones
+            if modules is not None : old['modules'] = modules
+        self._resp = resp
+        # Devices may have been renamed
+        self._index()
+        self.default_station = self.default_station_data['station_name']
+        self._parseUser(resp['body']['user'])
+        return RefreshChanges(updated=updated)
+
+    def _index(self):
+        """
+        Build the lookup tables of the stations and modules by name, id (MAC), type and home
+        """
         # Stations are no longer in the Netatmo API, keeping them for compatibility
         self.stations = { d['station_name'] : d for d in self.rawData }
         self.homes = { d['home_name'] : d["station_name"] for d in self.rawData }
+        self._stationsById = dict()
+        self._stationsByHome = dict()     # home name : [ stations ]
+        self._modulesById = dict()        # modules of all stations
+        self._stationOf = dict()          # station or module id : station
+        self._modulesByName = dict()      # station id : { module name : station or module }
+        self._modulesByType = dict()      # type : [ stations and modules ]
+        self._namesList = dict()          # station id : station and modules names
+        for s in self.rawData:
+            self._stationsById[ s['_id'] ] = s
+            self._stationsByHome.setdefault(s['home_name'], []).append(s)
+            byName = self._modulesByName[ s['_id'] ] = dict()
+            for m in [s] + s.get('modules', []):
+                if m is not s : self._modulesById[ m['_id'] ] = m
+                self._stationOf[ m['_id'] ] = s
+                byName.setdefault(m.get('module_name', m['_id']), m)
+                self._modulesByType.setdefault(m.get('type'), []).append(m)
+            self._namesList[ s['_id'] ] = [m.get('module_name', m['_id']) for m in s.get('modules', [])] + [s.get('module_name', s['_id'])]
+        # Time of the last measure of each station and module, sorted for staleness range queries.
+        # Lost devices (without dashboard data) were last seen at 0, those without time at indexing time
+        now = time.time()
+        seen = sorted( (m['dashboard_data'].get('time_utc', now) if 'dashboard_data' in m else 0, i)
+                       for i,m in _modulesById(self.rawData).items() )
+        self._seenTimes = [t for t,i in seen]
+        self._seenIds = [i for t,i in seen]
+        self._seenById = { i : t for t,i in seen }
+        # Compact records of the last data of each station and module, lost ones (without dashboard data) skipped
+        self.records = { i : moduleRecord(m, self._stationOf[i]) for i,m in _modulesById(self.rawData).items()
+                         if 'dashboard_data' in m }
+
+    def _parse(self, resp, home=None, station=None):
+        """
+        Build the stations, homes, modules and user information from a getstationsdata answer
+        """
+        self._resp = resp
+        self._home = home
+        self._station = station
+        # Dictionaries of our own, refresh updates them in place and the answer may be shared (cache)
+        self.rawData = _copyDevices(resp['body']['devices'])
+        # Weather data
+        if not self.rawData : raise NoDevice("No weather station in any homes")
+        self._index()
         # Keeping the old behavior for default station name
         if home and home not in self.homes : raise NoHome("No home with name %s" % home)
         self.default_home = home or list(self.homes.keys())[0]
         if station and station not in self.stations: raise NoDevice("No station with name %s" % station)
-        self.default_station = station or [v["station_name"] for k,v in self.stations.items() if v["home_name"] == self.default_home][0]
+        self.default_station = station or self._stationsByHome[self.default_home][0]["station_name"]
         self.modules = dict()
         self.default_station_data = self.stationByName(self.default_station)
         if 'modules' in self.default_station_data:
             for m in self.default_station_data['modules']:
                 self.modules[ m['_id'] ] = m
         # User data
-        userData = resp['body']['user']
+        self._parseUser(resp['body']['user'])
+        if self._changed is None:
+            self._revision = 1
+            self._changed = dict.fromkeys(self._stationOf, self._revision)
+
+    def _parseUser(self, userData):
         self.user = UserInfo()
         setattr(self.user, "mail", userData['mail'])
         for k,v in userData['administrative'].items():
@@ -341,72 +693,174 @@ class WeatherStationData:
 
 
     def modulesNamesList(self, station=None, home=None):
-        res = [m['module_name'] for m in self.modules.values()]
-        res.append(self.stationByName(station)['module_name'])
-        return res
+        if not station and home in self._stationsByHome : s = self._stationsByHome[home][0]
+        else : s = self.stationByName(station)
+        return list(self._namesList[ s['_id'] ])
 
     def stationByName(self, station=None):
         if not station : station = self.default_station
-        for i,s in self.stations.items():
-            if s['station_name'] == station :
-                return self.stations[i]
-        return None
+        return self.stations.get(station)
 
     def stationById(self, sid):
-        return self.stations.get(sid)
+        return self._stationsById.get(sid)
 
-    def moduleByName(self, module):
-        for m in self.modules:
-            mod = self.modules[m]
-            if mod['module_name'] == module :
-                return mod
-        return None
+    def stationsByHome(self, home=None):
+        """
+        Return the stations of a home (default home if None)
+        """
+        return list(self._stationsByHome.get(home or self.default_home, []))
+
+    def stationsIds(self, home=None):
+        """
+        Return the ids of the stations of a home, or of all homes
+        """
+        if home : return [s['_id'] for s in self._stationsByHome.get(home, [])]
+        return list(self._stationsById)
+
+    def moduleByName(self, module, station=None):
+        """
+        Return the module (or the station itself) with this name in a station (default station if None)
+        """
+        s = self.stationByName(station) or self.stationById(station)
+        if not s : return None
+        return self._modulesByName[ s['_id'] ].get(module)
 
     def moduleById(self, mid):
-        return self.modules.get(mid)
+        return self._modulesById.get(mid)
+
+    def modulesByType(self, mtype, home=None):
+        """
+        Return the stations or modules of a type (NAMain, NAModule1...), in all homes or in the given one
+        """
+        res = self._modulesByType.get(mtype, [])
+        if home : return [m for m in res if self._stationOf[ m['_id'] ]['home_name'] == home]
+        return list(res)
 
-    def lastData(self, exclude=0):
-        s = self.default_station_data
+    def lastData(self, exclude=0, station=None):
+        s = (self.stationByName(station) or self.stationById(station)) if station else self.default_station_data
         # Breaking change from Netatmo : dashboard_data no longer available if station lost
         if not s or 'dashboard_data' not in s : return None
         lastD = dict()
         # Define oldest acceptable sensor measure event
         limit = (time.time() - exclude) if exclude else 0
-        ds = s['dashboard_data']
-        if ds.get('time_utc',limit+10) > limit :
-            lastD[s['module_name']] = ds.copy()
-            lastD[s['module_name']]['When'] = lastD[s['module_name']].pop("time_utc") if 'time_utc' in lastD[s['module_name']] else time.time()
-            lastD[s['module_name']]['wifi_status'] = s['wifi_status']
-        if 'modules' in s:
-            for module in s["modules"]:
-                # Skip lost modules that no longer have dashboard data available
-                if 'dashboard_data' not in module : continue
-                ds = module['dashboard_data']
-                if ds.get('time_utc',limit+10) > limit :
-                    # If no module_name has been setup, use _id by default
-                    if "module_name" not in module : module['module_name'] = module["_id"]
-                    lastD[module['module_name']] = ds.copy()
-                    lastD[module['module_name']]['When'] = lastD[module['module_name']].pop("time_utc") if 'time_utc' in lastD[module['module_name']] else time.time()
-                    # For potential use, add battery and radio coverage information to module data if present
-                    for i in ('battery_vp', 'battery_percent', 'rf_status') :
-                        if i in module : lastD[module['module_name']][i] = module[i]
+        for module in [s] + s.get('modules', []):
+            data = self._moduleLastData(s, module, limit)
+            if data is not None : lastD[module['module_name']] = data
+        return lastD
+
+    def lastDataById(self, exclude=0, station=None):
+        """
+        Same as lastData, but for the stations of all homes (unless a station name or id is given)
+        and keyed by station or module id, as names are only unique within a station.
+        Each value also holds the module name and type, and the id and home of its station
+        """
+        stations = [ self.stationByName(station) or self.stationById(station) ] if station else self.rawData
+        return self._lastDataById(stations, exclude)
+
+    def lastDataChanges(self, since=0):
+        """
+        Return the lastDataById entries of the stations and modules whose measures, battery or radio
+        information changed after the cursor given, and the cursor for the next call : (data, cursor)
+        The cursor is an opaque integer, only valid for this object. With since=0, everything is returned
+        """
+        return self._lastDataById(self.rawData, since=since), self._revision
+
+    def recordChanges(self, since=0):
+        """
+        Same as lastDataChanges, returning the ModuleRecord of the stations and modules : (records, cursor)
+        """
+        if not since : return dict(self.records), self._revision
+        return { i : r for i,r in self.records.items() if self._changed.get(i, 0) > since }, self._revision
+
+    def _lastDataById(self, stations, exclude=0, since=0):
+        lastD = dict()
+        limit = (time.time() - exclude) if exclude else 0
+        for s in stations:
+            if not s or 'dashboard_data' not in s : continue
+            for module in [s] + s.get('modules', []):
+                if since and self._changed.get(module['_id'], 0) <= since : continue
+                data = self._moduleLastData(s, module, limit)
+                if data is None : continue
+                data['module_name'] = module['module_name']
+                data['type'] = module.get('type')
+                data['station_id'] = s['_id']
+                data['home_name'] = s.get('home_name')
+                lastD[module['_id']] = data
         return lastD
 
-    def checkNotUpdated(self, delay=3600):
-        res = self.lastData()
-        ret = []
-        for mn,v in res.items():
-            if time.time()-v['When'] > delay : ret.append(mn)
+    def _moduleLastData(self, station, module, limit):
+        # Skip lost modules that no longer have dashboard data available
+        if 'dashboard_data' not in module : return None
+        ds = module['dashboard_data']
+        if ds.get('time_utc',limit+10) <= limit : return None
+        # If no module_name has been setup, use _id by default
+        if "module_name" not in module : module['module_name'] = module["_id"]
+        data = ds.copy()
+        data['When'] = data.pop("time_utc") if 'time_utc' in data else time.time()
+        if module is station:
+            data['wifi_status'] = station.get('wifi_status')
+        else:
+            # For potential use, add battery and radio coverage information to module data if present
+            for i in ('battery_vp', 'battery_percent', 'rf_status') :
+                if i in module : data[i] = module[i]
+        return data
+
+    def lastSeen(self, mid):
+        """
+        Return the time of the last measure of a station or module (0 if lost), None if unknown
+        """
+        return self._seenById.get(mid)
+
+    def staleModules(self, delay=3600, station=None):
+        """
+        Return the ids of the stations and modules (of all stations unless a name or id is given)
+        without new measure in the last delay seconds, least recently seen first
+        """
+        end = bisect.bisect_left(self._seenTimes, time.time() - delay)
+        res = self._seenIds[:end]
+        if station:
+            s = self.stationByName(station) or self.stationById(station)
+            res = [i for i in res if self._stationOf[i] is s]
+        return res
+
+    def freshModules(self, delay=3600, station=None):
+        """
+        Return the ids of the stations and modules (of all stations unless a name or id is given)
+        with a new measure in the last delay seconds, least recently seen first
+        """
+        start = bisect.bisect_right(self._seenTimes, time.time() - delay)
+        res = self._seenIds[start:]
+        if station:
+            s = self.stationByName(station) or self.stationById(station)
+            res = [i for i in res if self._stationOf[i] is s]
+        return res
+
+    def checkNotUpdated(self, delay=3600, station=None):
+        ret = self._modulesNames(self.staleModules(delay, station or self.default_station))
         return ret if ret else None
 
-    def checkUpdated(self, delay=3600):
-        res = self.lastData()
-        ret = []
-        for mn,v in res.items():
-            if time.time()-v['When'] < delay : ret.append(mn)
+    def checkUpdated(self, delay=3600, station=None):
+        ret = self._modulesNames(self.freshModules(delay, station or self.default_station))
         return ret if ret else None
 
-    def getMeasure(self, device_id, scale, mtype, module_id=None, date_begin=None, date_end=None, limit=None, optimize=False, real_time=False):
+    def _modulesNames(self, ids):
+        return [self._modulesById.get(i, self._stationsById.get(i)).get('module_name', i) for i in ids]
+
+    def getMeasure(self, device_id, scale, mtype, module_id=None, date_begin=None, date_end=None, limit=None, optimize=False, real_time=False, priority=None,
+                   cancel=None, useStore=True):
+        """
+        Return the getmeasure answer for these parameters (see the Netatmo API). With a store covering
+        the request, the answer is built from the stored measures once synchronized
+        """
+        if useStore and self.store is not None:
+            resp = self._storedMeasure(device_id, scale, mtype, module_id, date_begin, date_end, limit, optimize, real_time)
+            if resp is not None : return resp
+        self.getAuthToken = self._authData.accessToken
+        postParams = self._measureParams(device_id, scale, mtype, module_id, date_begin, date_end, limit, optimize, real_time)
+        return postRequest(_GETMEASURE_REQ, postParams, priority=self.priority if priority is None else priority, auth=self._authData,
+                           cancel=cancel)
+
+    def _measureParams(self, device_id, scale, mtype, module_id=None, date_begin=None, date_end=None, limit=None, optimize=False, real_time=False):
         postParams = { "access_token" : self.getAuthToken }
         postParams['device_id']  = device_id
         if module_id : postParams['module_id'] = module_id
@@ -417,47 +871,535 @@ class WeatherStationData:
         if limit : postParams['limit'] = limit
         postParams['optimize'] = "true" if optimize else "false"
         postParams['real_time'] = "true" if real_time else "false"
-        return postRequest(_GETMEASURE_REQ, postParams)
+        return postParams
+
+    def iterMeasure(self, device_id, scale, mtype, module_id=None, date_begin=None, date_end=None, real_time=False,
+                    priority=PRIORITY_BACKFILL):
+        """
+        Generator over the measures of a module from date_begin to date_end (now if None), whatever the
+        number of points. Yield (timestamp, (values in mtype order)) in time order. Pages of up to 1024 points
+        are requested one at a time, when the previous one has been consumed
+        """
+        for times, columns in self.iterMeasureColumns(device_id, scale, mtype, module_id, date_begin, date_end,
+                                                      real_time, priority):
+            for point in zip(times, zip(*columns)):
+                yield point
+
+    def iterMeasureColumns(self, device_id, scale, mtype, module_id=None, date_begin=None, date_end=None,
+                           real_time=False, priority=PRIORITY_BACKFILL, cancel=None, useStore=True):
+        """
+        Same as iterMeasure, yielding each page as columns (see measureColumns) instead of points.
+        Stops before the next page once cancel (threading.Event) is set
+        """
+        while cancel is None or not cancel.is_set():
+            resp = self.getMeasure(device_id, scale, mtype, module_id, date_begin, date_end, _MEASURE_PAGE,
+                                   optimize=True, real_time=real_time, priority=priority, cancel=cancel, useStore=useStore)
+            if resp is None and cancel is not None and cancel.is_set() : return
+            times, columns = measureColumns(resp)
+            if not times : return
+            yield times, columns
+            date_begin = _nextPage(times, date_end)
+            if date_begin is None : return
+
+    def iterMeasures(self, queries, workers=_MEASURE_WORKERS, priority=PRIORITY_BACKFILL):
+        """
+        Fetch several measure series concurrently and yield (query index, timestamp, values) as pages arrive.
+        Each query is a dict of iterMeasure arguments (see measureQueries). Points of a query come in time order,
+        pages of different queries are interleaved. All requests go through the shared rate limiter
+        and at most workers pages wait in memory
+        """
+        queries = list(queries)
+        pending = iter(range(len(queries)))
+        lock = threading.Lock()
+        pages = queue.Queue(workers)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def work():
+            try:
+                while not stop.is_set():
+                    with lock : index = next(pending, None)
+                    if index is None : return
+                    kwargs = dict(queries[index])
+                    kwargs.setdefault('priority', priority)
+                    for page in self.iterMeasureColumns(cancel=stop, **kwargs):
+                        if not put((index, page, None)) : return
+            except Exception as e:
+                put((None, None, e))
+            finally:
+                put(None)
+
+        threads = [ threading.Thread(target=work) for _ in range(min(workers, len(queries))) ]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        running = len(threads)
+        try:
+            while running:
+                item = pages.get()
+                if item is None:
+                    running -= 1
+                    continue
+                index, page, error = item
+                if error : raise error
+                times, columns = page
+                for t,v in zip(times, zip(*columns)):
+                    yield index, t, v
+        finally:
+            # Consumer gone or failed : let the workers finish, even those waiting for the rate limiter
+            stop.set()
+            getattr(self._authData, "limiter", _LIMITER).wake()
+
+    def syncStore(self, station=None, force=False):
+        """
+        Synchronize the store with the new measures of a station (default station if None), unless
+        already done during the last upload cadence (or force is set). A failed synchronization is
+        logged and the stored data used meanwhile
+        """
+        s = self.stationByName(station) or self.stationById(station)
+        if not s : raise NoDevice("No station with name or id %s" % station)
+        with self._storeLock:
+            if not force and self._storeSynced.get(s['_id'], 0) > time.time() - _CACHE_CADENCE : return
+            self._storeSynced[ s['_id'] ] = time.time()
+        try:
+            self.store.sync(self, s['_id'], priority=self.priority)
+        except Exception as e:
+            logger.warning("Measures synchronization failed, using stored data: %s" % e)
+
+    def _storedMeasure(self, device_id, scale, mtype, module_id=None, date_begin=None, date_end=None, limit=None, optimize=False, real_time=False):
+        """
+        Build a getmeasure answer from the store, None if it doesn't cover the request : other scales
+        than the stored one, start before the history kept, measure types never synchronized
+        """
+        if scale != "max" or real_time or date_begin is None : return None
+        if float(date_begin) < time.time() - self.store.history : return None
+        module = module_id or device_id
+        types = mtype.split(",")
+        self.syncStore(device_id)
+        if self.store.last(module, types, scale) is None : return None
+        rows = dict()
+        for i, t in enumerate(types):
+            for ts, v in zip(*self.store.measures(module, t, date_begin, date_end, scale)):
+                rows.setdefault(ts, [None] * len(types))[i] = v
+        # Netatmo answers the first points after date_begin
+        times = sorted(rows)[:int(limit or _MEASURE_PAGE)]
+        if not optimize:
+            return { "status" : "ok", "body" : { str(ts) : rows[ts] for ts in times } }
+        body = []
+        for ts in times:
+            block = body[-1] if body else None
+            if block and (len(block['value']) == 1 or ts == block['beg_time'] + block['step_time'] * len(block['value'])):
+                if len(block['value']) == 1 : block['step_time'] = ts - block['beg_time']
+                block['value'].append(rows[ts])
+            else:
+                body.append({ "beg_time" : ts, "step_time" : 0, "value" : [ rows[ts] ] })
+        return { "status" : "ok", "body" : body }
+
+    def measureQueries(self, station=None, scale="max", date_begin=None, date_end=None):
+        """
+        Return the iterMeasures queries retrieving all the measures of a station (default station if None)
+        and of its modules
+        """
+        s = self.stationByName(station) or self.stationById(station)
+        if not s : raise NoDevice("No station with name or id %s" % station)
+        queries = []
+        for m in [s] + s.get('modules', []):
+            if m.get('type') not in _MODULE_MEASURES : continue
+            query = dict(device_id=s['_id'], scale=scale, mtype=_MODULE_MEASURES[m['type']],
+                         date_begin=date_begin, date_end=date_end)
+            if m is not s : query['module_id'] = m['_id']
+            queries.append(query)
+        return queries
 
     def MinMaxTH(self, module=None, frame="last24"):
-        s = self.default_station_data
-        if frame == "last24":
-            end = time.time()
-            start = end - 24*3600 # 24 hours ago
-        elif frame == "day":
-            start, end = todayStamps()
-        if module and module != s['module_name']:
-            m = self.moduleById(module) or self.moduleByName(module)
+        resp = self.getMeasure(**self._minMaxTHQuery(module, frame))
+        return self._minMaxTHResult(resp)
+
+    def _minMaxTHQuery(self, module=None, frame="last24"):
+        """
+        Return the getMeasure arguments retrieving the temperature and humidity of a module (station or
+        module id, or name, searched in the default station first) for a time frame
+        """
+        if not module : m = self.default_station_data
+        else : m = self.moduleById(module) or self.stationById(module) or self.moduleByName(module)
+        if not m:
+            m = next((byName[module] for byName in self._modulesByName.values() if module in byName), None)
             if not m : raise NoDevice("Can't find module %s" % module)
-            # retrieve module's data
-            resp = self.getMeasure(
-                    device_id  = s['_id'],
-                    module_id  = m['_id'],
-                    scale      = "max",
-                    mtype      = "Temperature,Humidity",
-                    date_begin = start,
-                    date_end   = end)
-        else : # retrieve station's data
-            resp = self.getMeasure(
-                    device_id  = s['_id'],
-                    scale      = "max",
-                    mtype      = "Temperature,Humidity",
-                    date_begin = start,
-                    date_end   = end)
-        if resp:
-            T = [v[0] for v in resp['body'].values()]
-            H = [v[1] for v in resp['body'].values()]
-            return min(T), max(T), min(H), max(H)
+        # Measures are requested from the station owning the module
+        s = self._stationOf[ m['_id'] ]
+        start, end = _frameRange(frame)
+        query = dict(device_id=s['_id'], scale="max", mtype="Temperature,Humidity", date_begin=start, date_end=end, optimize=True)
+        if m is not s : query['module_id'] = m['_id']
+        return query
+
+    def _minMaxTHResult(self, resp):
+        times, columns = measureColumns(resp)
+        # Temperature and humidity columns are expected, each with at least one value
+        if not times or len(columns) != 2 : return None
+        # Skip missing values (NaN)
+        T, H = [ [v for v in c if v == v] for c in columns ]
+        if not T or not H : return None
+        return min(T), max(T), min(H), max(H)
+
+    def allMinMaxTH(self, station=None, frames=("last24", "day"), store=None, workers=_MEASURE_WORKERS):
+        """
+        MinMaxTH of all the modules of a station (default station if None) measuring temperature and humidity,
+        for several frames at once : { module name : { frame : (minT, maxT, minH, maxH) or None } }
+        Without store, each module is requested once for all the frames, concurrently. With a
+        lnetatmo_store.MeasureStore (the one of this instance by default), the store is synchronized
+        then queried locally (stored data is used if the synchronization fails)
+        """
+        s, ranges, modules = self._allMinMaxTHPlan(station, frames)
+        if store is None and self.store is not None:
+            self.syncStore(s['_id'])
+            store = self.store
+        elif store is not None:
+            try:
+                store.sync(self, s['_id'], workers=workers)
+            except Exception as e:
+                logger.warning("Measures synchronization failed, using stored data: %s" % e)
+        if store is not None:
+            result = dict()
+            for m in modules:
+                result[ m['module_name'] ] = res = dict()
+                for f, start, end in ranges:
+                    T = store.minMax(m['_id'], "Temperature", start, end)
+                    H = store.minMax(m['_id'], "Humidity", start, end)
+                    res[f] = T + H if T and H else None
+            return result
+        queries = self._allMinMaxTHQueries(s, ranges, modules)
+        # [ query index ][ frame index ] : [minT, maxT, minH, maxH]
+        acc = [ [ None for r in ranges ] for q in queries ]
+        for index, t, (T, H) in self.iterMeasures(queries, workers, self.priority):
+            _addMinMaxTH(acc[index], ranges, t, T, H)
+        return self._allMinMaxTHResult(ranges, modules, acc)
+
+    def _allMinMaxTHPlan(self, station, frames):
+        """
+        Return the station (default station if None), the (frame, start, end) ranges and the modules
+        measuring temperature and humidity of allMinMaxTH
+        """
+        s = self.stationByName(station) or self.stationById(station)
+        if not s : raise NoDevice("No station with name or id %s" % station)
+        ranges = [ (f,) + _frameRange(f) for f in frames ]
+        modules = [ m for m in [s] + s.get('modules', []) if m.get('type') in _TH_MODULES ]
+        return s, ranges, modules
+
+    def _allMinMaxTHQueries(self, s, ranges, modules):
+        # One query per module covering all the frames
+        queries = []
+        for m in modules:
+            query = dict(device_id=s['_id'], scale="max", mtype="Temperature,Humidity",
+                         date_begin=min(r[1] for r in ranges), date_end=max(r[2] for r in ranges))
+            if m is not s : query['module_id'] = m['_id']
+            queries.append(query)
+        return queries
+
+    def _allMinMaxTHResult(self, ranges, modules, acc):
+        return { m['module_name'] : { f : tuple(a) if a else None for (f, start, end), a in zip(ranges, acc[i]) }
+                 for i, m in enumerate(modules) }
+
+class ModuleRecord(object):
+    """
+    Last data of a station or module, in slots named after the Netatmo fields, None when not reported.
+    The subclass of each module type adds its measures (see moduleRecord)
+    """
+    __slots__ = ('id', 'module_name', 'type', 'station_id', 'home_name', 'When',
+                 'battery_percent', 'battery_vp', 'rf_status', 'wifi_status', 'reachable')
+    _MEASURES = ()
+
+    def __init__(self, module, station):
+        ds = module.get('dashboard_data', {})
+        self.id = module['_id']
+        self.module_name = module.get('module_name', module['_id'])
+        self.type = module.get('type')
+        self.station_id = station['_id']
+        self.home_name = station.get('home_name')
+        self.When = ds.get('time_utc')
+        for f in ('battery_percent', 'battery_vp', 'rf_status', 'wifi_status', 'reachable'):
+            setattr(self, f, module.get(f))
+        for f in self._MEASURES:
+            setattr(self, f, ds.get(f))
+
+    def __repr__(self):
+        fields = ModuleRecord.__slots__ + self._MEASURES
+        return "%s(%s)" % (self.__class__.__name__, ", ".join("%s=%r" % (f, getattr(self, f)) for f in fields))
+
+class MainRecord(ModuleRecord):
+    _MEASURES = __slots__ = ('Temperature', 'CO2', 'Humidity', 'Noise', 'Pressure', 'AbsolutePressure',
+                             'min_temp', 'max_temp', 'temp_trend', 'pressure_trend')
+
+class IndoorRecord(ModuleRecord):
+    _MEASURES = __slots__ = ('Temperature', 'CO2', 'Humidity', 'min_temp', 'max_temp', 'temp_trend')
+
+class OutdoorRecord(ModuleRecord):
+    _MEASURES = __slots__ = ('Temperature', 'Humidity', 'min_temp', 'max_temp', 'temp_trend')
+
+class WindRecord(ModuleRecord):
+    _MEASURES = __slots__ = ('WindStrength', 'WindAngle', 'GustStrength', 'GustAngle', 'max_wind_str', 'max_wind_angle')
+
+class RainRecord(ModuleRecord):
+    _MEASURES = __slots__ = ('Rain', 'sum_rain_1', 'sum_rain_24')
+
+_RECORD_TYPES = { "NAMain" : MainRecord, "NAModule1" : OutdoorRecord, "NAModule2" : WindRecord,
+                  "NAModule3" : RainRecord, "NAModule4" : IndoorRecord }
+
+def moduleRecord(module, station):
+    """
+    Return the record of a station or module dictionary (from getstationsdata), of the class of its type
+    """
+    return _RECORD_TYPES.get(module.get('type'), ModuleRecord)(module, station)
+
+
+class RefreshChanges:
+    """
+    What changed in a WeatherStationData.refresh: ids of the stations and modules added, removed,
+    and with new measures, battery or radio information. False when nothing changed
+    """
+    def __init__(self, added=(), removed=(), updated=()):
+        self.added = list(added)
+        self.removed = list(removed)
+        self.updated = list(updated)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.updated)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return "RefreshChanges(added=%s, removed=%s, updated=%s)" % (self.added, self.removed, self.updated)
+
+
+# Device fields compared to detect a station or module update
+_UPDATE_FIELDS = ('dashboard_data', 'battery_percent', 'battery_vp', 'rf_status', 'wifi_status', 'reachable')
+
+def _topology(devices):
+    return [ (d['_id'], [m['_id'] for m in d.get('modules', [])]) for d in devices ]
+
+def _copyDevices(devices):
+    copies = []
+    for d in devices:
+        d = dict(d)
+        if 'modules' in d : d['modules'] = [ dict(m) for m in d['modules'] ]
+        copies.append(d)
+    return copies
+
+def _modulesById(devices):
+    res = dict()
+    for d in devices:
+        res[ d['_id'] ] = d
+        for m in d.get('modules', []):
+            res[ m['_id'] ] = m
+    return res
+
+def _frameRange(frame):
+    # (start, end) timestamps of a MinMaxTH frame
+    if frame == "last24":
+        end = time.time()
+        return end - 24*3600, end  # 24 hours ago
+    elif frame == "day":
+        return todayStamps()
+    raise ValueError("Unknown frame %s" % frame)
+
+def _nextPage(times, date_end=None):
+    """
+    Return the date_begin of the getmeasure page following the one of times, None after the last page
+    """
+    # Netatmo answers the first points after date_begin, up to the page size
+    if len(times) < _MEASURE_PAGE : return None
+    date_begin = times[-1] + 1
+    if date_end and date_begin > int(date_end) : return None
+    return date_begin
+
+def _addMinMaxTH(acc, ranges, t, T, H):
+    """
+    Account a temperature and humidity point in the [minT, maxT, minH, maxH] of each frame range holding t
+    """
+    if T != T or H != H : return
+    for i, (f, start, end) in enumerate(ranges):
+        if not start <= t <= end : continue
+        a = acc[i]
+        if a is None : acc[i] = [T, T, H, H]
         else:
-            return None
+            if T < a[0] : a[0] = T
+            elif T > a[1] : a[1] = T
+            if H < a[2] : a[2] = H
+            elif H > a[3] : a[3] = H
+
+def _measuresChanged(old, new):
+    return any(old.get(f) != new.get(f) for f in _UPDATE_FIELDS)
+
+def measureColumns(resp, asNumpy=False):
+    """
+    Decode a getmeasure answer, optimized or not, into columns : (timestamps, [values of each measure type])
+    Timestamps are an array of integers in time order, each measure type an array of floats (NaN when missing).
+    With asNumpy, int64 and float64 NumPy arrays are returned instead (NumPy is optional otherwise)
+    """
+    body = resp['body'] if resp else None
+    if not body:
+        rows = []
+        times = array(_TIME_TYPECODE)
+    elif isinstance(body, dict):
+        # { "timestamp" : [values], ... }, usually already in time order
+        times = array(_TIME_TYPECODE, map(int, body))
+        rows = list(body.values())
+        if list(times) != sorted(times):
+            order = sorted(range(len(rows)), key=times.__getitem__)
+            times = array(_TIME_TYPECODE, [times[i] for i in order])
+            rows = [rows[i] for i in order]
+    else:
+        # Optimized : [ { "beg_time" : t0, "step_time" : step, "value" : [[values], ...] }, ... ]
+        times = array(_TIME_TYPECODE)
+        rows = []
+        for block in body:
+            values = block['value']
+            step = block.get('step_time', 0)
+            times.extend(range(block['beg_time'], block['beg_time'] + step * len(values), step) if step else
+                         [block['beg_time']] * len(values))
+            rows.extend(values)
+    columns = []
+    for values in zip(*rows):
+        try:
+            columns.append(array("d", values))
+        except TypeError:
+            # Missing values
+            columns.append(array("d", [_NAN if v is None else v for v in values]))
+    if asNumpy:
+        import numpy
+        return numpy.frombuffer(times, dtype=numpy.int64), [ numpy.frombuffer(c, dtype=numpy.float64) for c in columns ]
+    return times, columns
+
 
 class DeviceList(WeatherStationData):
     """
     This class is now deprecated. Use WeatherStationData directly instead
     """
-    warnings.warn("The 'DeviceList' class was renamed 'WeatherStationData'",
-            DeprecationWarning )
-    pass
+    def __init__(self, *args, **kwargs):
+        warnings.warn("The 'DeviceList' class was renamed 'WeatherStationData'",
+                DeprecationWarning, stacklevel=2 )
+        WeatherStationData.__init__(self, *args, **kwargs)
+
+class CameraEvents(object):
+    """
+    Events of a camera ordered by time, without duplicate ids. The oldest are dropped beyond maxEvents
+    events or retention seconds before the latest one (None for no limit).
+    Reads like a { time : event } dictionary
+    """
+    def __init__(self, maxEvents=_EVENTS_KEPT, retention=_EVENTS_RETENTION):
+        self.maxEvents = maxEvents
+        self.retention = retention
+        self._times = []
+        self._events = []
+        self._byId = dict()
+        self._lastByType = dict()
+
+    def add(self, event):
+        """
+        Insert or replace (same id) an event, return False if it was already known or is too old to be kept
+        """
+        t = event['time']
+        old = self._byId.get(event.get('id'))
+        if old is not None:
+            i = self._position(old)
+            if old['time'] == t and old.get('type') == event.get('type'):
+                self._events[i] = event
+                self._byId[event.get('id')] = event
+                if self._lastByType.get(old.get('type')) is old : self._lastByType[old.get('type')] = event
+                return False
+        # Latest time of the other events, the replaced one is only dropped if the new one is kept
+        n = len(self._times) - (1 if old is not None and self._events[-1] is old else 0)
+        if self.retention is not None and n and t < self._times[n-1] - self.retention : return False
+        if old is not None : self._remove(i)
+        if not self._times or t >= self._times[-1]:
+            # Events mostly arrive in order
+            self._times.append(t)
+            self._events.append(event)
+        else:
+            i = bisect.bisect_right(self._times, t)
+            self._times.insert(i, t)
+            self._events.insert(i, event)
+        self._byId[event.get('id')] = event
+        last = self._lastByType.get(event.get('type'))
+        if last is None or t >= last['time'] : self._lastByType[event.get('type')] = event
+        self._trim()
+        return old is None
+
+    def last(self, etype=None):
+        """
+        Return the latest event, of a type (person, movement...) if given, None if none
+        """
+        if etype : return self._lastByType.get(etype)
+        return self._events[-1] if self._events else None
+
+    def between(self, begin=None, end=None, etype=None):
+        """
+        Return the events from begin to end (timestamps, included), of a type if given, in time order
+        """
+        lo = bisect.bisect_left(self._times, begin) if begin is not None else 0
+        hi = bisect.bisect_right(self._times, end) if end is not None else len(self._times)
+        if etype : return [e for e in self._events[lo:hi] if e.get('type') == etype]
+        return self._events[lo:hi]
+
+    def _position(self, event):
+        i = bisect.bisect_left(self._times, event['time'])
+        while self._events[i] is not event : i += 1
+        return i
+
+    def _remove(self, i):
+        e = self._events[i]
+        del self._times[i], self._events[i], self._byId[e.get('id')]
+        if self._lastByType.get(e.get('type')) is e:
+            del self._lastByType[e.get('type')]
+            for other in reversed(self._events):
+                if other.get('type') == e.get('type'):
+                    self._lastByType[e.get('type')] = other
+                    break
+
+    def _trim(self):
+        count = len(self._times) - self.maxEvents if self.maxEvents is not None else 0
+        if self.retention is not None:
+            count = max(count, bisect.bisect_left(self._times, self._times[-1] - self.retention))
+        if count <= 0 : return
+        for e in self._events[:count]:
+            del self._byId[e.get('id')]
+            if self._lastByType.get(e.get('type')) is e : del self._lastByType[e.get('type')]
+        del self._times[:count], self._events[:count]
+
+    def __len__(self):
+        return len(self._events)
+
+    def __iter__(self):
+        return iter(self._times)
+
+    def __contains__(self, t):
+        i = bisect.bisect_left(self._times, t)
+        return i < len(self._times) and self._times[i] == t
+
+    def __getitem__(self, t):
+        i = bisect.bisect_right(self._times, t) - 1
+        if i < 0 or self._times[i] != t : raise KeyError(t)
+        return self._events[i]
+
+    def get(self, t, default=None):
+        return self[t] if t in self else default
+
+    def keys(self):
+        return list(self._times)
+
+    def values(self):
+        return list(self._events)
+
+    def items(self):
+        return list(zip(self._times, self._events))
+
 
 class HomeData:
     """
@@ -465,18 +1407,39 @@ class HomeData:
 
     Args:
         authData (ClientAuth): Authentication information with a working access Token
+        home (Optional[str]): Name of the default home, the first one with cameras if None
+        maxEvents (int): Events kept per camera
+        retention (int): Seconds of events kept per camera before its latest event
+        imageCache (Optional[ImageCache]): Where pictures, faces and snapshots are kept, so that
+            an event picture or a face is only downloaded once
     """
-    def __init__(self, authData, home=None):
+    maxEvents = _EVENTS_KEPT
+    eventsRetention = _EVENTS_RETENTION
+    imageCache = None
+
+    def __init__(self, authData, home=None, maxEvents=_EVENTS_KEPT, retention=_EVENTS_RETENTION, imageCache=None):
+        self._authData = authData
+        self.maxEvents = maxEvents
+        self.eventsRetention = retention
+        self.imageCache = imageCache
         self.getAuthToken = authData.accessToken
         postParams = {
             "access_token" : self.getAuthToken
             }
-        resp = postRequest(_GETHOMEDATA_REQ, postParams)
+        resp = postRequest(_GETHOMEDATA_REQ, postParams, auth=authData)
+        self._parse(resp, home)
+
+    def _parse(self, resp, home=None):
+        """
+        Build the homes, cameras, persons and events indexes from a gethomedata answer
+        """
         self.rawData = resp['body']
+        self._urls = dict()       # camera id : (vpn url, local url, expiration)
+        self._probing = set()
+        self._urlsLock = threading.Lock()
         # Collect homes
         self.homes = { d['id'] : d for d in self.rawData['homes'] }
         if not self.homes : raise NoDevice("No home available")
-        self.default_home = home or list(self.homes.values())[0]['name']
         # Split homes data by category
         self.persons = dict()
         self.events = dict()
@@ -491,33 +1454,78 @@ class HomeData:
                 for p in curHome['persons']:
                     self.persons[ p['id'] ] = p
             if 'events' in curHome:
-                    for e in curHome['events']:
-                        if e['camera_id'] not in self.events:
-                            self.events[ e['camera_id'] ] = dict()
-                        self.events[ e['camera_id'] ][ e['time'] ] = e
+                self._mergeEvents(curHome['events'])
             if 'cameras' in curHome:
                 for c in curHome['cameras']:
                     self.cameras[nameHome][ c['id'] ] = c
                     c["home_id"] = curHome['id']
-        for camera in self.events:
-            self.lastEvent[camera] = self.events[camera][sorted(self.events[camera])[-1]]
+        self._index()
+        self._indexPersons()
+        # Default to the first home with cameras, homes of a thermostat only having none
+        self.default_home = home or (self.homesWithCameras() or [self.rawData['homes'][0]['name']])[0]
         if not self.cameras[self.default_home] : raise NoDevice("No camera available in default home")
         self.default_camera = list(self.cameras[self.default_home].values())[0]
 
+    def _index(self):
+        """
+        Build the lookup tables of the homes and cameras by name, id (MAC) and type
+        """
+        self._homesByName = dict()
+        self._camerasById = dict()
+        self._camerasByName = { None : dict() }   # home name (None for any home) : { camera name : camera }
+        self._camerasByType = dict()      # type : [ cameras ]
+        for h in self.homes.values():
+            self._homesByName.setdefault(h['name'], h)
+        for nameHome, cameras in self.cameras.items():
+            byName = self._camerasByName[nameHome] = dict()
+            for c in cameras.values():
+                self._camerasById.setdefault(c['id'], c)
+                byName.setdefault(c['name'], c)
+                self._camerasByName[None].setdefault(c['name'], c)
+                self._camerasByType.setdefault(c.get('type'), []).append(c)
+
+    def _indexPersons(self):
+        """
+        Build the known persons (with a pseudo) and at home indexes, kept up to date by the events
+        """
+        self._known = dict()              # person id : person, known persons only
+        self._personsByPseudo = dict()
+        self._personHome = dict()         # person id : home id
+        self._atHome = dict()             # home id : { known person id : person } not out of sight
+        for h in self.rawData['homes']:
+            atHome = self._atHome[h['id']] = dict()
+            for p in h.get('persons', []):
+                self._personHome[p['id']] = h['id']
+                if 'pseudo' not in p : continue
+                self._known[p['id']] = p
+                self._personsByPseudo.setdefault(p['pseudo'], p)
+                if not p.get('out_of_sight', True) : atHome[p['id']] = p
+
+    def _updatePresence(self, events):
+        """
+        Apply person arrivals (person events) and departures (person_away) newer than what is known
+        """
+        for e in sorted(events, key=lambda e: e['time']):
+            if e.get('type') not in ('person', 'person_away') : continue
+            p = self.persons.get(e.get('person_id'))
+            if p is None or e['time'] < p.get('last_seen', 0) : continue
+            p['last_seen'] = e['time']
+            p['out_of_sight'] = e['type'] == 'person_away'
+            atHome = self._atHome.get(self._personHome.get(p['id']))
+            if atHome is None or p['id'] not in self._known : continue
+            if p['out_of_sight'] : atHome.pop(p['id'], None)
+            else : atHome[p['id']] = p
+        return events
+
     def homeById(self, hid):
-        return None if hid not in self.homes else self.homes[hid]
+        return self.homes.get(hid)
 
     def homeByName(self, home=None):
         if not home: home = self.default_home
-        for key,value in self.homes.items():
-            if value['name'] == home:
-                return self.homes[key]
+        return self._homesByName.get(home)
 
     def cameraById(self, cid):
-        for home,cam in self.cameras.items():
-            if cid in self.cameras[home]:
-                return self.cameras[home][cid]
-        return None
+        return self._camerasById.get(cid)
 
     def cameraByName(self, camera=None, home=None):
         if not camera and not home:
@@ -525,43 +1533,114 @@ class HomeData:
         elif home and camera:
             if home not in self.cameras:
                 return None
-            for cam_id in self.cameras[home]:
-                if self.cameras[home][cam_id]['name'] == camera:
-                    return self.cameras[home][cam_id]
+            return self._camerasByName[home].get(camera)
         elif not home and camera:
-            for home, cam_ids in self.cameras.items():
-                for cam_id in cam_ids:
-                    if self.cameras[home][cam_id]['name'] == camera:
-                        return self.cameras[home][cam_id]
+            return self._camerasByName[None].get(camera)
         else:
             return list(self.cameras[home].values())[0]
         return None
 
-    def cameraUrls(self, camera=None, home=None, cid=None):
+    def homesWithCameras(self):
+        """
+        Return the names of the homes having cameras, the only ones reporting events and presence
+        """
+        return [h['name'] for h in self.rawData['homes'] if self.cameras.get(h['name'])]
+
+    def camerasByType(self, ctype, home=None):
+        """
+        Return the cameras of a type (NACamera, NOC...), in all homes or in the given one
+        """
+        if home : return [c for c in self._camerasByType.get(ctype, []) if c['id'] in self.cameras.get(home, {})]
+        return list(self._camerasByType.get(ctype, []))
+
+    def cameraUrls(self, camera=None, home=None, cid=None, refresh=False):
         """
         Return the vpn_url and the local_url (if available) of a given camera
         in order to access to its live feed
         Can't use the is_local property which is mostly false in case of operator
         dynamic IP change after presence start sequence
+        The urls found are reused during _CAMERA_URLS_TTL seconds, then still returned while they are
+        checked again in background. refresh checks them now
         """
-        local_url = None
-        vpn_url = None
         if cid:
             camera_data=self.cameraById(cid)
         else:
             camera_data=self.cameraByName(camera=camera, home=home)
-        if camera_data:
-            vpn_url = camera_data['vpn_url']
-            resp = postRequest(vpn_url + '/command/ping')
-            temp_local_url=resp['local_url']
-            try:
-                resp = postRequest(temp_local_url + '/command/ping',timeout=1)
-                if resp and temp_local_url == resp['local_url']:
-                    local_url = temp_local_url
-            except:  # On this particular request, vithout errors from previous requests, error is timeout
-                local_url = None
+        if not camera_data : return None, None
+        return self._resolveUrls(camera_data, refresh)
+
+    def invalidateUrls(self, cid=None):
+        """
+        Forget the urls found for a camera (all cameras if None), they are checked again on next use
+        """
+        with self._urlsLock:
+            if cid : self._urls.pop(cid, None)
+            else : self._urls.clear()
+
+    def _resolveUrls(self, camera, refresh=False):
+        with self._urlsLock:
+            known = self._urls.get(camera['id'])
+        if known and not refresh and known[0] == camera['vpn_url']:
+            if known[2] < time.time() : self._reprobe(camera)
+            return known[0], known[1]
+        return self._probeUrls(camera)
+
+    def _probeUrls(self, camera):
+        local_url = None
+        vpn_url = camera['vpn_url']
+        resp = postRequest(vpn_url + '/command/ping')
+        if not resp : return vpn_url, None      # Not kept, checked again on next use
+        temp_local_url=resp['local_url']
+        try:
+            resp = postRequest(temp_local_url + '/command/ping',timeout=1)
+            if resp and temp_local_url == resp['local_url']:
+                local_url = temp_local_url
+        except:  # On this particular request, vithout errors from previous requests, error is timeout
+            local_url = None
+        with self._urlsLock:
+            self._urls[camera['id']] = (vpn_url, local_url, time.time() + _CAMERA_URLS_TTL)
         return vpn_url, local_url
 
+    def _reprobe(self, camera):
+        with self._urlsLock:
+            if camera['id'] in self._probing : return
+            self._probing.add(camera['id'])
+        def probe():
+            try:
+                self._probeUrls(camera)
+            except Exception as e:
+                logger.warning("Camera %s unreachable (%s)" % (camera['id'], e))
+                self.invalidateUrls(camera['id'])
+            finally:
+                with self._urlsLock:
+                    self._probing.discard(camera['id'])
+        thread = threading.Thread(target=probe)
+        thread.daemon = True
+        thread.start()
+
+    def _command(self, camera, commande, parameters=None, timeout=3, sink=None, local=False):
+        """
+        Send a command to a camera through its known urls (the local one only if local is set). If it
+        fails, the urls are checked again and, unless the answer was being written to a sink, the
+        command is sent once more
+        """
+        for retry in (False, True):
+            vpn_url, local_url = self._resolveUrls(camera, refresh=retry)
+            url = local_url if local else local_url or vpn_url
+            if not url : return None
+            try:
+                resp = cameraCommand(url, commande, parameters, timeout, sink)
+            except _TRANSIENT_ERRORS as e:
+                if retry or sink is not None:
+                    self.invalidateUrls(camera['id'])
+                    raise
+                logger.info("Camera %s command failed (%s), checking its urls again" % (camera['id'], e))
+                continue
+            if resp is not None : return resp
+            self.invalidateUrls(camera['id'])
+            if sink is not None : return None
+        return None
+
     def url(self, camera=None, home=None, cid=None):
         vpn_url, local_url = self.cameraUrls(camera, home, cid)
         # Return local if available else vpn
@@ -573,63 +1652,176 @@ class HomeData:
         """
         if not home: home = self.default_home
         home_data = self.homeByName(home)
-        atHome = []
-        for p in home_data['persons']:
-            #Only check known persons
-            if 'pseudo' in p:
-                if not p["out_of_sight"]:
-                    atHome.append(p['pseudo'])
-        return atHome
+        return [p['pseudo'] for p in self._atHome.get(home_data['id'], {}).values()]
+
+    def occupancy(self, home=None):
+        """
+        Return the number of known persons currently at home
+        """
+        if not home: home = self.default_home
+        home_data = self.homeByName(home)
+        return len(self._atHome.get(home_data['id'], ())) if home_data else 0
 
-    def getCameraPicture(self, image_id, key):
+    def personByPseudo(self, name):
+        return self._personsByPseudo.get(name)
+
+    def personLastSeen(self, name):
+        """
+        Return the time a known person was last seen, None if unknown
+        """
+        p = self._personsByPseudo.get(name)
+        return p.get('last_seen') if p else None
+
+    def getCameraPicture(self, image_id, key, sink=None):
         """
         Download a specific image (of an event or user face) from the camera
+        If a file-like sink is given, the image is written to it and its size is returned instead of its content
+        With an imageCache, the image is read from it when already downloaded
         """
+        if self.imageCache is not None:
+            path, image_type = self.cameraPicturePath(image_id, key)
+            if path is None : return None, None
+            try:
+                f = open(path, "rb")
+            except (IOError, OSError):
+                # Evicted by another thread since, downloaded again
+                f = None
+            if f is not None:
+                with f:
+                    if sink is None : return f.read(), image_type
+                    size = 0
+                    for chunk in iter(lambda: f.read(_READ_CHUNK), b""):
+                        sink.write(chunk)
+                        size += len(chunk)
+                    return size, image_type
+        self.getAuthToken = self._authData.accessToken
         postParams = {
             "access_token" : self.getAuthToken,
             "image_id" : image_id,
             "key" : key
             }
-        resp = postRequest(_GETCAMERAPICTURE_REQ, postParams)
-        image_type = imghdr.what('NONE.FILE',resp)
+        if sink is None:
+            resp = postRequest(_GETCAMERAPICTURE_REQ, postParams, auth=self._authData)
+            image_type = _imageType(resp)
+            return resp, image_type
+        sink = _HeadSink(sink)
+        resp = postRequest(_GETCAMERAPICTURE_REQ, postParams, sink=sink, auth=self._authData)
+        image_type = _imageType(sink.head)
         return resp, image_type
 
-    def getProfileImage(self, name):
+    def cameraPicturePath(self, image_id, key):
+        """
+        Return the path of an image (of an event or user face) in the imageCache, downloaded only if
+        not already there, and its type. (None, None) if it can't be downloaded
+        """
+        cacheKey = "picture:%s:%s" % (image_id, key)
+        path = self.imageCache.get(cacheKey)
+        if path is None:
+            self.getAuthToken = self._authData.accessToken
+            postParams = {
+                "access_token" : self.getAuthToken,
+                "image_id" : image_id,
+                "key" : key
+                }
+            resp = postRequest(_GETCAMERAPICTURE_REQ, postParams, auth=self._authData)
+            if not resp or isinstance(resp, dict) : return None, None
+            path = self.imageCache.put(cacheKey, bytes(resp))
+        return path, _pathImageType(path)
+
+    def getProfileImage(self, name, sink=None):
         """
         Retrieve the face of a given person
         """
-        for p in self.persons:
-            if 'pseudo' in self.persons[p]:
-                if name == self.persons[p]['pseudo']:
-                    image_id = self.persons[p]['face']['id']
-                    key = self.persons[p]['face']['key']
-                    return self.getCameraPicture(image_id, key)
+        p = self._personsByPseudo.get(name)
+        if p:
+            image_id = p['face']['id']
+            key = p['face']['key']
+            return self.getCameraPicture(image_id, key, sink=sink)
         return None, None
 
     def updateEvent(self, event=None, home=None):
         """
         Update the list of event with the latest ones
         """
+        self.getAuthToken = self._authData.accessToken
+        resp = postRequest(_GETEVENTSUNTIL_REQ, self._eventsUntilParams(event, home), auth=self._authData)
+        self._updatePresence(self._mergeEvents(resp['body']['events_list']))
+
+    def _eventsUntilParams(self, event=None, home=None):
         if not home: home=self.default_home
         if not event:
             #If not event is provided we need to retrieve the oldest of the last event seen by each camera
-            listEvent = dict()
-            for cam_id in self.lastEvent:
-                listEvent[self.lastEvent[cam_id]['time']] = self.lastEvent[cam_id]
-            event = listEvent[sorted(listEvent)[0]]
+            event = min(self.lastEvent.values(), key=lambda e: e['time'])
 
         home_data = self.homeByName(home)
-        postParams = {
+        return {
             "access_token" : self.getAuthToken,
             "home_id" : home_data['id'],
             "event_id" : event['id']
         }
-        resp = postRequest(_GETEVENTSUNTIL_REQ, postParams)
-        eventList = resp['body']['events_list']
+
+    def eventCursor(self, home=None):
+        """
+        Return the latest event known of the cameras of a home (default home if None), None if none
+        """
+        if not home: home = self.default_home
+        events = [self.lastEvent[c] for c in self.cameras.get(home, {}) if c in self.lastEvent]
+        return max(events, key=lambda e: e['time']) if events else None
+
+    def syncEvents(self, home=None):
+        """
+        Fetch the events of a home (default home if None) newer than its latest known one, add them
+        to the events indexes and return the new ones in time order
+        """
+        self.getAuthToken = self._authData.accessToken
+        url, params = self._syncQuery(home)
+        resp = postRequest(url, params, auth=self._authData)
+        return self._syncMerge(params['home_id'], resp)
+
+    def _syncQuery(self, home=None):
+        if not home: home = self.default_home
+        params = {
+            "access_token" : self.getAuthToken,
+            "home_id" : self.homeByName(home)['id']
+        }
+        cursor = self.eventCursor(home)
+        if cursor is None:
+            # geteventsuntil needs a known event, only the last events of the home can be asked
+            params['size'] = _EVENTS_SYNC_SIZE
+            return _GETHOMEDATA_REQ, params
+        params['event_id'] = cursor['id']
+        return _GETEVENTSUNTIL_REQ, params
+
+    def _syncMerge(self, homeId, resp):
+        body = resp['body']
+        if 'events_list' in body:
+            events = body['events_list']
+        else:
+            events = [e for h in body.get('homes', []) if h['id'] == homeId for e in h.get('events', [])]
+        # Netatmo lists the latest events first
+        return self._updatePresence(sorted(self._mergeEvents(reversed(events)), key=lambda e: e['time']))
+
+    def _mergeEvents(self, eventList):
+        """
+        Add events to the index of their camera, return the ones not known before
+        """
+        added = []
         for e in eventList:
-            self.events[ e['camera_id'] ][ e['time'] ] = e
-        for camera in self.events:
-            self.lastEvent[camera]=self.events[camera][sorted(self.events[camera])[-1]]
+            events = self.events.get(e['camera_id'])
+            if events is None:
+                events = self.events[ e['camera_id'] ] = CameraEvents(self.maxEvents, self.eventsRetention)
+            if events.add(e) : added.append(e)
+            self.lastEvent[ e['camera_id'] ] = events.last()
+        return added
+
+    def cameraEvents(self, camera=None, home=None, begin=None, end=None, etype=None):
+        """
+        Return the events of a camera (default camera if None) from begin to end (timestamps, included),
+        of a type (person, movement...) if given, in time order
+        """
+        cam = self.cameraByName(camera=camera, home=home)
+        if not cam or cam['id'] not in self.events : return []
+        return self.events[ cam['id'] ].between(begin, end, etype)
 
     def personSeenByCamera(self, name, home=None, camera=None):
         """
@@ -649,11 +1841,7 @@ class HomeData:
         return False
 
     def _knownPersons(self):
-        known_persons = dict()
-        for p_id,p in self.persons.items():
-            if 'pseudo' in p:
-                known_persons[ p_id ] = p
-        return known_persons
+        return self._known
 
     def someoneKnownSeen(self, home=None, camera=None):
         """
@@ -705,19 +1893,19 @@ class HomeData:
         return localUrl
     
     def presenceLight(self, camera=None, home=None, cid=None, setting=None):
-        url = self.presenceUrl(home=home, camera=camera) or self.cameraById(cid=cid)
-        if not url or setting not in ("on", "off", "auto"): return None
+        camera = self.cameraByName(home=home, camera=camera) or self.cameraById(cid=cid)
+        if not camera or camera["type"] != "NOC" or setting not in ("on", "off", "auto"): return None
         if setting : return "Currently unsupported"
-        return cameraCommand(url, _PRES_CDE_GET_LIGHT)["mode"]
+        return self._command(camera, _PRES_CDE_GET_LIGHT, local=True)["mode"]
         # Not yet supported
         #if not setting: return cameraCommand(url, _PRES_CDE_GET_LIGHT)["mode"]
         #else: return cameraCommand(url, _PRES_CDE_SET_LIGHT, setting)
 
     def presenceStatus(self, mode, camera=None, home=None, cid=None):
-        url = self.presenceUrl(home=home, camera=camera) or self.cameraById(cid=cid)
-        if not url or mode not in ("on", "off") : return None
-        r = cameraCommand(url, _CAM_CHANGE_STATUS, mode)
-        return mode if r["status"] == "ok" else None
+        camera = self.cameraByName(home=home, camera=camera) or self.cameraById(cid=cid)
+        if not camera or camera["type"] != "NOC" or mode not in ("on", "off") : return None
+        r = self._command(camera, _CAM_CHANGE_STATUS, mode, local=True)
+        return mode if r and r["status"] == "ok" else None
 
     def presenceSetAction(self, camera=None, home=None, cid=None,
                           eventType=_PRES_DETECTION_KIND[0], action=2):
@@ -732,11 +1920,47 @@ class HomeData:
         resp = postRequest(_POST_UPDATE_HOME_REQ, postParams)
         self.rawData = resp['body']
 
-    def getLiveSnapshot(self, camera=None, home=None, cid=None):
+    def getLiveSnapshot(self, camera=None, home=None, cid=None, sink=None):
         camera = self.cameraByName(home=home, camera=camera) or self.cameraById(cid=cid)
-        vpnUrl, localUrl = self.cameraUrls(cid=camera["id"])
-        url = localUrl or vpnUrl
-        return cameraCommand(url, _PRES_CDE_GET_SNAP)
+        return self._command(camera, _PRES_CDE_GET_SNAP, sink=sink)
+
+    def getLiveSnapshots(self, cids=None, home=None, workers=_SNAPSHOT_WORKERS):
+        """
+        Take a live snapshot of several cameras (the given ids, else those of a home, else all of them)
+        concurrently. Return { camera id : (image, type) }, image being the path of the snapshot in the
+        imageCache if any, a memoryview of it otherwise, and (None, None) for a camera not answering
+        """
+        if cids : cameras = [self.cameraById(c) for c in cids if self.cameraById(c)]
+        elif home : cameras = list(self.cameras.get(home, {}).values())
+        else : cameras = list(self._camerasById.values())
+        pending = iter(cameras)
+        lock = threading.Lock()
+        results = dict()
+
+        def work():
+            while True:
+                with lock : camera = next(pending, None)
+                if camera is None : return
+                try:
+                    image = self._command(camera, _PRES_CDE_GET_SNAP)
+                except Exception as e:
+                    logger.warning("No snapshot of camera %s (%s)" % (camera['id'], e))
+                    image = None
+                if not image or isinstance(image, dict):
+                    results[camera['id']] = (None, None)
+                elif self.imageCache is not None:
+                    path = self.imageCache.put("snapshot:%s" % camera['id'], bytes(image))
+                    results[camera['id']] = (path, _pathImageType(path))
+                else:
+                    results[camera['id']] = (memoryview(image), _imageType(image))
+
+        threads = [ threading.Thread(target=work) for _ in range(min(workers, len(cameras))) ]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return results
 
 
 class WelcomeData(HomeData):
@@ -744,13 +1968,159 @@ class WelcomeData(HomeData):
     This class is now deprecated. Use HomeData instead
     Home can handle many devices, not only Welcome cameras
     """
-    warnings.warn("The 'WelcomeData' class was renamed 'HomeData' to handle new Netatmo Home capabilities",
-            DeprecationWarning )
-    pass
+    def __init__(self, *args, **kwargs):
+        warnings.warn("The 'WelcomeData' class was renamed 'HomeData' to handle new Netatmo Home capabilities",
+                DeprecationWarning, stacklevel=2 )
+        HomeData.__init__(self, *args, **kwargs)
+
+
+class EventSync(object):
+    """
+    Keep the events of a HomeData up to date in background : every interval seconds, the events of
+    each home newer than its latest known one are fetched (see HomeData.syncEvents) and passed, in time
+    order and once each, to the subscribers as callback(homeId, events)
+
+        sync = EventSync(homeData)
+        sync.subscribe(lambda homeId, events: print(homeId, [e['type'] for e in events]))
+        sync.start()
+
+    Args:
+        homeData (HomeData): Homes whose events are synchronized
+        interval (int): Seconds between two fetches
+        homes (Optional[list]): Names of the homes to synchronize, all of them if None
+    """
+    def __init__(self, homeData, interval=_EVENTS_SYNC_INTERVAL, homes=None):
+        self.homeData = homeData
+        self.interval = interval
+        self.homes = homes
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._timer = None
+        self._closed = True
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def start(self):
+        """
+        Fetch the new events now then every interval seconds
+        """
+        self._closed = False
+        self._schedule(0)
+        return self
+
+    def stop(self):
+        self._closed = True
+        if self._timer : self._timer.cancel()
+
+    def sync(self):
+        """
+        Fetch the new events of the homes now and notify the subscribers, return the number of new events.
+        A home failing to answer does not keep the next ones from being synchronized
+        """
+        count = 0
+        with self._lock:
+            for home in self.homes or [h['name'] for h in self.homeData.homes.values()]:
+                try:
+                    events = self.homeData.syncEvents(home)
+                except Exception as e:
+                    logger.warning("Events synchronization of home %s failed: %s" % (home, e))
+                    continue
+                count += len(events)
+                if events : self._notify(self.homeData.homeByName(home)['id'], events)
+        return count
+
+    def _notify(self, homeId, events):
+        for callback in list(self._subscribers):
+            try:
+                callback(homeId, events)
+            except Exception as e:
+                logger.warning("Event subscriber %r failed: %s" % (callback, e))
+
+    def _schedule(self, delay):
+        if self._timer : self._timer.cancel()
+        if self._closed : return
+        self._timer = threading.Timer(delay, self._run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run(self):
+        try:
+            self.sync()
+        except Exception as e:
+            logger.warning("Events synchronization failed (%s), retrying in %d s" % (e, self.interval))
+        self._schedule(self.interval)
 
 # Utilities routines
 
 
+def _loadUrllib():
+    # urllib.request is slow to import, it is only loaded with the first request
+    if PYTHON3:
+        _loadHttp()
+        import urllib.request, urllib.error
+
+def _loadHttp():
+    # http.client and ssl (with OpenSSL) are slow to import, they are only loaded with the first connection
+    global http, ssl, _HTTPSConnection, _TRANSIENT_ERRORS
+    if not PYTHON3 or _HTTPSConnection is not None : return
+    import http.client
+    import ssl
+
+    class HTTPSConnection(http.client.HTTPSConnection):
+        """
+        HTTPS connection resuming the last TLS session known by its pool for the same host
+        """
+        def __init__(self, pool, host, port, timeout):
+            http.client.HTTPSConnection.__init__(self, host, port, timeout=timeout, context=pool.context)
+            self._pool = pool
+
+        def connect(self):
+            http.client.HTTPConnection.connect(self)
+            server = self._tunnel_host or self.host
+            session = self._pool._sessions.get( (self.host, self.port) )
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=server, session=session)
+            if self.sock.session:
+                self._pool._sessions[ (self.host, self.port) ] = self.sock.session
+
+    _TRANSIENT_ERRORS = (IOError, OSError, http.client.HTTPException)
+    _HTTPSConnection = HTTPSConnection
+
+def _imageType(data):
+    # Same names as imghdr (no longer in Python 3.13), from the first bytes of the image
+    if not data : return None
+    head = bytes(data[:12])
+    for magic, name in _IMAGE_MAGIC:
+        if head.startswith(magic) : return name
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP" : return "webp"
+    return None
+
+
+def _pathImageType(path):
+    # ImageCache files are named after their type
+    ext = os.path.splitext(path)[1][1:]
+    return ext if ext != "bin" else None
+
+
+class _HeadSink:
+    """
+    File-like wrapper keeping the first bytes written to a sink (enough to identify an image type)
+    """
+    def __init__(self, sink, size=32):
+        self.sink = sink
+        self.size = size
+        self.head = b""
+
+    def write(self, data):
+        if len(self.head) < self.size:
+            self.head += bytes(data[:self.size - len(self.head)])
+        return self.sink.write(data)
+
+
 def filter_home_data(rawData, home):
     if home:
         # Find a home who's home id or name is the one requested
@@ -761,21 +2131,895 @@ def filter_home_data(rawData, home):
     # By default, the first home is returned
     return rawData[0]
 
-def cameraCommand(cameraUrl, commande, parameters=None, timeout=3):
+class ConnectionPool:
+    """
+    Keep HTTP(S) connections alive between requests, per host, so that successive calls
+    to the same server (api.netatmo.com, camera vpn/local urls) skip the TCP and TLS handshakes.
+    TLS sessions are remembered per host and resumed when a new connection has to be opened.
+
+    Args:
+        maxsize (int): Maximum number of idle connections kept per host
+        idleTimeout (float): Seconds after which an idle connection is closed instead of reused
+        context (Optional[ssl.SSLContext]): TLS context used for https connections
+    """
+    def __init__(self, maxsize=_POOL_MAXSIZE, idleTimeout=_POOL_IDLE_TIMEOUT, context=None):
+        self.maxsize = maxsize
+        self.idleTimeout = idleTimeout
+        self._context = context
+        self._idle = dict()         # (scheme, host, port) : [ (connection, last use time), ... ]
+        self._sessions = dict()     # (host, port) : ssl.SSLSession
+        self._lock = threading.Lock()
+        self._proxies = None
+
+    @property
+    def context(self):
+        # Created for the first https connection, loading the CA certificates is slow
+        if self._context is None:
+            _loadHttp()
+            self._context = ssl.create_default_context()
+        return self._context
+
+    def urlopen(self, url, body=None, headers=None, timeout=10):
+        """
+        Send a request (POST if a body is given, GET otherwise) and return a PooledResponse.
+        The connection goes back to the pool when the response is closed after being fully read
+        Redirects are followed as urllib does: all of them for a GET, 301, 302 and 303 for a POST,
+        which is then sent again as a GET without body. Other redirects are returned as is
+        """
+        _loadHttp()
+        headers = dict(headers or {})
+        for _ in range(_MAX_REDIRECTS):
+            resp = self._send(url, body, headers, timeout)
+            location = resp.getheader("Location")
+            if resp.status not in (301, 302, 303, 307, 308) or not location : return resp
+            if body is not None and resp.status not in (301, 302, 303) : return resp
+            readBody(resp)
+            resp.close()
+            url = urllib.parse.urljoin(url, location)
+            if body is not None:
+                body = None
+                headers = dict( (k,v) for k,v in headers.items() if k.lower() not in ("content-type", "content-length") )
+        return self._send(url, body, headers, timeout)
+
+    def _send(self, url, body, headers, timeout):
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query : path += "?" + parts.query
+        method = "POST" if body is not None else "GET"
+        headers = dict(headers)
+        headers.setdefault("Connection", "keep-alive")
+        while True:
+            conn, reused = self._acquire(key, timeout)
+            try:
+                conn.request(method, path, body, headers)
+            except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError) :
+                conn.close()
+                # The server dropped an idle connection before getting the whole request, nothing was processed
+                if reused : continue
+                raise
+            except Exception :
+                conn.close()
+                raise
+            try:
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, http.client.BadStatusLine) :
+                conn.close()
+                # The request may have been processed before the connection dropped: only a GET is sent again
+                if reused and method == "GET" : continue
+                raise
+            except Exception :
+                conn.close()
+                raise
+            return PooledResponse(self, key, conn, resp)
+
+    def clear(self):
+        """
+        Close all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, dict()
+        for conns in idle.values():
+            for conn,_ in conns: conn.close()
+
+    def usable(self, url):
+        """
+        Return False when the request must go through urllib (proxy configured for this url)
+        """
+        _loadUrllib()
+        if self._proxies is None:
+            self._proxies = urllib.request.getproxies()
+        parts = urllib.parse.urlsplit(url)
+        return parts.scheme.lower() not in self._proxies or urllib.request.proxy_bypass(parts.hostname)
+
+    def _acquire(self, key, timeout):
+        now = time.time()
+        with self._lock:
+            conns = self._idle.get(key, [])
+            while conns:
+                conn, lastUse = conns.pop()
+                if now - lastUse < self.idleTimeout and conn.sock and not _closedByPeer(conn.sock):
+                    conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+        scheme, host, port = key
+        if scheme == "https":
+            conn = _HTTPSConnection(self, host, port, timeout)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        return conn, False
+
+    def _release(self, key, conn, resp):
+        if resp.will_close or not conn.sock:
+            conn.close()
+            return
+        if isinstance(conn.sock, ssl.SSLSocket) and conn.sock.session:
+            # TLS 1.3 session tickets are only available once some data has been read
+            self._sessions[key[1:]] = conn.sock.session
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.maxsize:
+                conns.append( (conn, time.time()) )
+                return
+        conn.close()
+
+
+def _closedByPeer(sock):
+    # An idle connection has nothing to read, unless the server closed it
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+class ResponseCache:
+    """
+    Keep API answers until Netatmo is expected to have fresher data.
+    Entries are keyed by endpoint and request parameters, secrets (tokens, passwords) excluded, so
+    a cache must not be shared between accounts: each ClientAuth owns one.
+    Only endpoints with a known refresh cadence are cached: for station data, an answer expires at
+    the next expected upload following its most recent measure, rather than after a fixed delay.
+
+    Args:
+        cadence (int): Seconds between two uploads of a weather station
+        minTtl (int): Minimum lifetime of an answer, used when the next upload is already overdue
+    """
+    def __init__(self, cadence=_CACHE_CADENCE, minTtl=_CACHE_MIN_TTL):
+        self.cadence = cadence
+        self.minTtl = minTtl
+        self._entries = dict()      # key : (expiration time, answer)
+        self._lock = threading.Lock()
+        self._policies = { _GETSTATIONDATA_REQ : self._stationsExpiration }
+
+    def get(self, url, params=None, stale=False):
+        """
+        Return the cached answer for this request if still valid (or whatever its age if stale is set),
+        None otherwise
+        """
+        with self._lock:
+            entry = self._entries.get( self._key(url, params) )
+        if not entry : return None
+        return entry[1] if stale or entry[0] > time.time() else None
+
+    def put(self, url, params, resp):
+        policy = self._policies.get(url)
+        if not policy : return
+        expiration = policy(resp)
+        if expiration is None : return
+        with self._lock:
+            self._entries[ self._key(url, params) ] = (expiration, resp)
+
+    def invalidate(self, url=None):
+        """
+        Drop every cached answer, or only those of the given endpoint
+        """
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == url]:
+                    del self._entries[key]
+
+    def _key(self, url, params):
+        return (url, tuple(sorted( (k,str(v)) for k,v in (params or {}).items() if k not in _CACHE_SECRETS )))
+
+    def _stationsExpiration(self, resp):
+        newest = 0
+        for d in resp.get('body', {}).get('devices', []):
+            newest = max(newest, d.get('dashboard_data', {}).get('time_utc', 0))
+            for m in d.get('modules', []):
+                newest = max(newest, m.get('dashboard_data', {}).get('time_utc', 0))
+        now = time.time()
+        return max(newest + self.cadence, now + self.minTtl)
+
+
+class ImageCache:
+    """
+    Images kept in a directory, each file named after the hash of its content, so that an image
+    reached by several keys is stored once. Keys (eg a face id and key) are mapped to files in
+    index.json. When the files exceed maxBytes, the least recently used are deleted.
+
+    Args:
+        directory (str): Directory of the images, created if needed
+        maxBytes (int): Size of the images kept
+    """
+    def __init__(self, directory, maxBytes=_IMAGE_CACHE_BYTES):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self._keys = dict()             # key : file name
+        self._files = OrderedDict()     # file name : size, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        if not exists(directory) : os.makedirs(directory)
+        self._load()
+
+    def get(self, key):
+        """
+        Return the path of the image of key, None if not cached
+        """
+        with self._lock:
+            name = self._keys.get(key)
+            if name is None or name not in self._files : return None
+            self._files[name] = self._files.pop(name)
+        path = os.path.join(self.directory, name)
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Deleted behind our back
+            self.forget(key)
+            return None
+        return path
+
+    def put(self, key, data):
+        """
+        Store an image under key and return its path
+        """
+        import hashlib
+        name = "%s.%s" % (hashlib.sha1(data).hexdigest(), _imageType(data) or "bin")
+        path = os.path.join(self.directory, name)
+        tmp = self._write(data) if not exists(path) else None
+        with self._lock:
+            # Renamed with the bookkeeping, an eviction can't come in between
+            if tmp is not None or not exists(path):
+                if tmp is None : tmp = self._write(data)
+                try:
+                    getattr(os, "replace", os.rename)(tmp, path)
+                except (IOError, OSError):
+                    os.remove(tmp)
+                    raise
+            old = self._keys.get(key)
+            self._keys[key] = name
+            if name in self._files:
+                self._files[name] = self._files.pop(name)
+            else:
+                self._files[name] = len(data)
+                self._size += len(data)
+            if old and old != name and old not in self._keys.values() : self._delete(old)
+            while self._size > self.maxBytes and len(self._files) > 1:
+                self._delete(next(iter(self._files)))
+            self._save()
+        return path
+
+    def _write(self, data):
+        # A temporary file of its own, the same image may be put by several threads at once
+        import tempfile
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        except (IOError, OSError):
+            os.remove(tmp)
+            raise
+        return tmp
+
+    def forget(self, key):
+        with self._lock:
+            name = self._keys.pop(key, None)
+            if name and name not in self._keys.values() : self._delete(name)
+            self._save()
+
+    def size(self):
+        return self._size
+
+    def _delete(self, name):
+        self._size -= self._files.pop(name, 0)
+        for k in [k for k, n in self._keys.items() if n == name]:
+            del self._keys[k]
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def _load(self):
+        index = os.path.join(self.directory, "index.json")
+        try:
+            with open(index, "r") as f:
+                keys = json.load(f)
+        except (IOError, ValueError):
+            keys = dict()
+        files = []
+        for name in set(keys.values()):
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, name, st.st_size))
+        for mtime, name, size in sorted(files):
+            self._files[name] = size
+            self._size += size
+        self._keys = dict( (k, n) for k, n in keys.items() if n in self._files )
+
+    def _save(self):
+        index = os.path.join(self.directory, "index.json")
+        with open(index + ".tmp", "w") as f:
+            json.dump(self._keys, f)
+        getattr(os, "replace", os.rename)(index + ".tmp", index)
+
+
+class RateLimiter:
+    """
+    Token buckets enforcing the Netatmo request limits on the client side.
+    Requests over the limits wait for their turn instead of failing: waiting requests are served by
+    priority, then arrival order, and lower priorities can't use the share of each window reserved
+    to more urgent ones, so that background work doesn't starve realtime polling.
+
+    Args:
+        limits (tuple): (window in seconds, maximum requests in the window) pairs
+        reserve (dict): Priority : share of each window this priority class can't use
+    """
+    def __init__(self, limits=_RATE_LIMITS, reserve=_RATE_RESERVE):
+        now = time.time()
+        self.reserve = reserve
+        self._buckets = [ [window, maximum, float(maximum), now] for window,maximum in limits ]
+        self._history = deque()     # Time of the requests sent during the longest window
+        self._longest = max(window for window,_ in limits)
+        self._waiting = []          # Heap of (priority, arrival) tickets
+        self._arrival = itertools.count()
+        self._cond = threading.Condition()
+        self._holdUntil = 0
+
+    def acquire(self, priority=PRIORITY_POLL, timeout=None, cancel=None):
+        """
+        Wait until a request of this priority can be sent, return False if timeout expired first or
+        if cancel (threading.Event) was set, waiting requests noticing it when woken up (see wake)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            ticket = (priority, next(self._arrival))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if cancel is not None and cancel.is_set() : return False
+                    wait = self._take(priority) if self._waiting[0] == ticket else None
+                    if wait == 0:
+                        heapq.heappop(self._waiting)
+                        return True
+                    if deadline is not None:
+                        left = deadline - time.time()
+                        if left <= 0 : return False
+                        wait = left if wait is None else min(wait, left)
+                    self._cond.wait(wait)
+            finally:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def tryAcquire(self, priority=PRIORITY_POLL):
+        """
+        Consume a request if possible without waiting: return 0, otherwise the number of seconds
+        to wait before trying again. Unlike enqueue(), the request doesn't keep its place in the queue
+        """
+        with self._cond:
+            if self._waiting and self._waiting[0][0] <= priority:
+                return _LIMITER_POLL      # Leave the turn to queued requests
+            return self._take(priority)
+
+    def enqueue(self, priority=PRIORITY_POLL):
+        """
+        Queue a request for a non blocking caller (eg asyncio) and return its ticket, to be polled
+        until granted. Queued tickets are served in the same order as the blocking acquire() calls
+        """
+        with self._cond:
+            ticket = (priority, next(self._arrival))
+            heapq.heappush(self._waiting, ticket)
+            return ticket
+
+    def poll(self, ticket):
+        """
+        Return 0 and consume a request if the turn of ticket came, otherwise the number of
+        seconds to wait before polling again
+        """
+        with self._cond:
+            if self._waiting[0] != ticket : return _LIMITER_POLL
+            wait = self._take(ticket[0])
+            if wait == 0:
+                heapq.heappop(self._waiting)
+                self._cond.notify_all()
+            return wait
+
+    def cancel(self, ticket):
+        """
+        Give up a ticket not granted yet
+        """
+        with self._cond:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def wake(self):
+        """
+        Wake up the waiting requests, for them to check their cancel event
+        """
+        with self._cond:
+            self._cond.notify_all()
+
+    def holdOff(self, delay):
+        """
+        Don't let any request through for the next delay seconds (eg after a quota error)
+        """
+        with self._cond:
+            self._holdUntil = max(self._holdUntil, time.time() + delay)
+
+    def used(self, window):
+        """
+        Return the number of requests sent during the last window seconds
+        """
+        with self._cond:
+            limit = time.time() - window
+            return sum(1 for t in self._history if t > limit)
+
+    def _take(self, priority):
+        now = time.time()
+        wait = max(0, self._holdUntil - now)
+        floor = self.reserve.get(priority, 0)
+        for bucket in self._buckets:
+            window, maximum, tokens, last = bucket
+            tokens = min(maximum, tokens + (now - last) * maximum / window)
+            bucket[2], bucket[3] = tokens, now
+            needed = 1 + floor * maximum
+            if tokens < needed:
+                wait = max(wait, (needed - tokens) * window / maximum)
+        if wait : return wait
+        for bucket in self._buckets : bucket[2] -= 1
+        self._history.append(now)
+        while self._history[0] < now - self._longest : self._history.popleft()
+        return 0
+
+
+class CircuitBreaker:
+    """
+    Suspend the calls to a failing service: after threshold consecutive failures, the circuit opens
+    and no call is allowed during cooldown seconds. A single trial call is then let through, which
+    closes the circuit if it succeeds or opens it again if it fails.
+
+    Args:
+        threshold (int): Consecutive failures opening the circuit
+        cooldown (float): Seconds the circuit stays open
+    """
+    def __init__(self, threshold=_BREAKER_THRESHOLD, cooldown=_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self._openUntil = 0
+        self._trial = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enter(self):
+        """
+        Mark the current thread as attempting a call (see nested)
+        """
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+
+    def leave(self):
+        self._local.depth -= 1
+
+    def nested(self):
+        """
+        Return True if the current thread is attempting a call : calls it makes meanwhile are part of
+        that attempt, they are neither gated nor counted
+        """
+        return getattr(self._local, "depth", 0) > 0
+
+    def allow(self):
+        """
+        Return True if a call can be attempted. Once the circuit opened, the single trial call
+        allowed must report its outcome with success() or failure()
+        """
+        with self._lock:
+            if self.failures < self.threshold : return True
+            if time.time() < self._openUntil or self._trial : return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.threshold:
+                if self.failures == self.threshold or time.time() >= self._openUntil:
+                    logger.warning("Netatmo API failing, calls suspended for %d s" % self.cooldown)
+                self._openUntil = time.time() + self.cooldown
+
+    def abandon(self):
+        """
+        End a call without outcome (eg cancelled), letting another trial through if it was one
+        """
+        with self._lock:
+            self._trial = False
+
+    def remaining(self):
+        """
+        Return the number of seconds before calls are allowed again
+        """
+        return max(0, self._openUntil - time.time()) if self.failures >= self.threshold else 0
+
+
+class PooledResponse:
+    """
+    HTTP response bound to a pooled connection. Closing it returns the connection to its pool
+    """
+    def __init__(self, pool, key, conn, resp):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self.status = resp.status
+        self.reason = resp.reason
+
+    def getheader(self, name, default=None):
+        return self._resp.getheader(name, default)
+
+    def read(self, amt=None):
+        return self._resp.read(amt)
+
+    def readinto(self, b):
+        return self._resp.readinto(b)
+
+    def close(self):
+        if self._conn is None : return
+        if self._resp.isclosed():
+            self._pool._release(self._key, self._conn, self._resp)
+        else:   # Not fully read, the connection can't be reused
+            self._resp.close()
+            self._conn.close()
+        self._conn = None
+
+
+class BufferedResponse:
+    """
+    HTTP response whose body is already in memory, as served by replay or test transports
+    """
+    def __init__(self, status, reason, headers, body):
+        import io
+        self.status = status
+        self.reason = reason
+        self.headers = dict( (k.lower(),v) for k,v in headers.items() )
+        self._body = io.BytesIO(body)
+        self.headers.setdefault("content-length", str(len(body)))
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def read(self, amt=None):
+        return self._body.read(amt)
+
+    def readinto(self, b):
+        return self._body.readinto(b)
+
+    def close(self):
+        pass
+
+
+class RecordingTransport:
+    """
+    Transport sending requests through another one (the connection pool by default) and recording
+    every exchange, so that it can be saved and served again by a ReplayTransport.
+    Secrets (tokens, passwords) are scrubbed from the recorded requests and answers.
+
+    Args:
+        inner (Optional[transport]): Transport actually sending the requests
+    """
+    def __init__(self, inner=None):
+        self.inner = inner or _POOL
+        self.exchanges = []
+
+    def urlopen(self, url, body=None, headers=None, timeout=10):
+        resp = self.inner.urlopen(url, body, headers, timeout=timeout)
+        try:
+            data = bytes(readBody(resp))
+        finally:
+            resp.close()
+        contentType = resp.getheader("Content-Type") or ""
+        exchange = { "url" : _scrubUrl(url),
+                     "params" : _scrubParams(body),
+                     "status" : resp.status,
+                     "reason" : resp.reason,
+                     "contentType" : contentType }
+        if "application/json" in contentType:
+            exchange["json"] = _scrub(json.loads(data.decode("utf-8")))
+        else:
+            import base64
+            exchange["body"] = base64.b64encode(data).decode("ascii")
+        self.exchanges.append(exchange)
+        return BufferedResponse(resp.status, resp.reason, {"Content-Type" : contentType}, data)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.exchanges, f, indent=1)
+
+
+class ReplayTransport:
+    """
+    Transport answering requests with the exchanges saved by a RecordingTransport, without any network access.
+    Requests are matched on their url and parameters (secrets excluded), or on their url only if no recorded
+    request had the same parameters; when a request was recorded several times, answers are served in order
+    and the last one is repeated. Unknown requests get a 404.
+
+    Args:
+        exchanges (str or list): Path of a saved recording, or the recorded exchanges themselves
+    """
+    def __init__(self, exchanges):
+        if not isinstance(exchanges, list):
+            with open(exchanges, "r") as f:
+                exchanges = json.load(f)
+        self._answers = dict()
+        self._byUrl = dict()
+        for e in exchanges:
+            self._answers.setdefault(self._key(e["url"], e["params"]), []).append(e)
+            self._byUrl.setdefault(e["url"], []).append(e)
+
+    def urlopen(self, url, body=None, headers=None, timeout=10):
+        url = _scrubUrl(url)
+        # Parameters such as time ranges change from a run to another, fall back on the url only
+        answers = self._answers.get( self._key(url, _scrubParams(body)) ) or self._byUrl.get(url)
+        if not answers:
+            logger.warning("No recorded answer for %s" % url)
+            error = json.dumps({"error" : {"code" : 404, "message" : "Not recorded"}}).encode("utf-8")
+            return BufferedResponse(404, "Not Found", {"Content-Type" : "application/json"}, error)
+        e = answers.pop(0) if len(answers) > 1 else answers[0]
+        if "json" in e:
+            data = json.dumps(e["json"]).encode("utf-8")
+        else:
+            import base64
+            data = base64.b64decode(e["body"])
+        return BufferedResponse(e["status"], e["reason"], {"Content-Type" : e["contentType"]}, data)
+
+    def _key(self, url, params):
+        return (url, tuple(sorted( (k,v) for k,v in (params or {}).items() if k not in _CACHE_SECRETS )))
+
+
+def _scrubUrl(url):
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    query = urllib.parse.urlencode([ (k, "***" if k in _CACHE_SECRETS else v) for k,v in query ])
+    return urllib.parse.urlunsplit( (parts.scheme, parts.netloc, parts.path, query, parts.fragment) )
+
+def _scrubParams(body):
+    if not body : return None
+    params = dict(urllib.parse.parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+    return _scrub(params)
+
+def _scrub(data):
+    if isinstance(data, dict):
+        return dict( (k, "***" if k in _CACHE_SECRETS or k == "username" else _scrub(v)) for k,v in data.items() )
+    if isinstance(data, list):
+        return [_scrub(v) for v in data]
+    return data
+
+
+# HTTPS connection class of the pool, defined with the first connection (see _loadHttp)
+_HTTPSConnection = None
+
+if PYTHON3:
+    # Connection pool shared by every request of the library (auth, data, camera commands)
+    _POOL = ConnectionPool()
+
+    # Transport actually sending the requests (see setTransport)
+    _TRANSPORT = _POOL
+
+# Rate limiters of the Netatmo accounts, the limits being per user (see accountLimiter)
+_LIMITERS = dict()
+_LIMITERS_LOCK = threading.Lock()
+
+# Rate limiter of the requests sent without a ClientAuth, circuit breaker shared by every request
+# sent to the Netatmo API
+_LIMITER = RateLimiter()
+_BREAKER = CircuitBreaker()
+
+# Errors worth a retry : timeouts, connection failures, broken answers (http.client.HTTPException
+# being added when loaded, see _loadHttp)
+_TRANSIENT_ERRORS = (IOError, OSError)
+
+
+def accountLimiter(clientId, username):
+    """
+    Return the RateLimiter of a Netatmo account, shared by all its ClientAuth and AsyncClientAuth
+    so that a quota hold off or a burst of one account doesn't delay the others
+    """
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get( (clientId, username) )
+        if limiter is None:
+            limiter = _LIMITERS[ (clientId, username) ] = RateLimiter()
+        return limiter
+
+def requestsUsed(window, auth=None):
+    """
+    Return the number of Netatmo API requests sent during the last window seconds for the account
+    of auth (ClientAuth), or without any ClientAuth
+    """
+    return (auth.limiter if auth is not None else _LIMITER).used(window)
+
+
+def configurePool(maxsize=None, idleTimeout=None):
+    """
+    Change the size and idle timeout of the connection pool shared by all requests
+    """
+    if maxsize is not None : _POOL.maxsize = maxsize
+    if idleTimeout is not None : _POOL.idleTimeout = idleTimeout
+
+def closeConnections():
+    """
+    Close all idle connections of the shared connection pool
+    """
+    if PYTHON3 : _POOL.clear()
+
+def configureJson(projection=None, fast=None):
+    """
+    Change how json answers are decoded. With projection, getstationsdata and gethomedata answers
+    (including the ones cached) only keep the fields used by lnetatmo : identity, dashboard data, battery
+    and radio of the devices, user units, essentials of homes, cameras, events and persons.
+    fast=False decodes with the json module even if orjson is installed
+    """
+    global _PROJECTION, _JSON_LOADS
+    if projection is not None : _PROJECTION = projection
+    if fast is not None : _JSON_LOADS = None if fast else json.loads
+
+def setTransport(transport=None):
+    """
+    Send every request through transport instead of the connection pool (None restores the pool).
+    A transport is any object providing urlopen(url, body=None, headers=None, timeout=10) and returning
+    a response with status, reason, getheader(), read(), readinto() and close(), like ConnectionPool
+    (eg RecordingTransport, ReplayTransport)
+    """
+    global _TRANSPORT
+    _TRANSPORT = transport or _POOL
+
+def cameraCommand(cameraUrl, commande, parameters=None, timeout=3, sink=None):
     url = cameraUrl + ( commande % parameters if parameters else commande)
-    return postRequest(url, timeout=timeout)
+    return postRequest(url, timeout=timeout, sink=sink)
     
-def postRequest(url, params=None, timeout=10):
+def postRequest(url, params=None, timeout=10, sink=None, cache=None, bypassCache=False, priority=PRIORITY_POLL, auth=None,
+                cancel=None):
+    """
+    Send a request and return the decoded json answer, or the raw body (bytes) for other content types
+    If a file-like sink is given, non json bodies are written to it as they arrive and the number
+    of bytes written is returned instead
+    If a ResponseCache is given, a still valid cached answer is returned without any request
+    (unless bypassCache is set) and new answers are stored in it. Should the request fail, the
+    last cached answer, even expired, is returned
+    Requests to the Netatmo API wait for the rate limiter of the account of auth (ClientAuth), the
+    most urgent priority first. Server errors and timeouts are retried, and if auth is given, the
+    access token is renewed when rejected as invalid or expired. None is returned if cancel
+    (threading.Event) is set while the request waits for the rate limiter
+    """
+    if cache is not None:
+        resp = None if bypassCache else cache.get(url, params)
+        if resp is not None : return resp
+        try:
+            resp = postRequest(url, params, timeout, sink, priority=priority, auth=auth, cancel=cancel)
+        except _TRANSIENT_ERRORS + (ApiUnavailable,) as err:
+            resp = cache.get(url, params, stale=True)
+            if resp is None : raise
+            logger.warning("Request failed (%s), using cached data" % err)
+            return resp
+        if resp is not None:
+            cache.put(url, params, resp)
+            return resp
+        return cache.get(url, params, stale=True)
+    if not url.startswith(_BASE_URL):
+        try:
+            return sendRequest(url, params, timeout, sink)
+        except ApiError as err:
+            logger.error(str(err))
+            return None
+    # A request sent while another one is being attempted (token renewal) belongs to its attempt
+    guarded = not _BREAKER.nested()
+    if guarded and not _BREAKER.allow():
+        raise ApiUnavailable("Netatmo API calls suspended for %d s after repeated failures" % _BREAKER.remaining())
+    limiter = auth.limiter if auth is not None else _LIMITER
+    attempt = 0
+    renewed = False
+    while True:
+        if not limiter.acquire(priority, cancel=cancel):
+            if guarded : _BREAKER.abandon()
+            return None
+        # Every attempt ends with a success or a failure of the breaker, whatever happens
+        outcome = False
+        _BREAKER.enter()
+        try:
+            try:
+                resp = sendRequest(url, params, timeout, sink)
+            except ApiError as err:
+                if err.error not in _TOKEN_ERRORS or not auth or renewed or "access_token" not in (params or {}):
+                    raise
+                logger.info("Access token rejected, renewing it")
+                params = dict(params, access_token=auth.renewToken(params["access_token"]))
+                renewed = True
+                resp = sendRequest(url, params, timeout, sink)
+        except ApiError as err:
+            if err.code >= 500:
+                failure = err
+            else:
+                outcome = True
+                if err.error in _QUOTA_ERRORS or err.code == 429:
+                    # Requests would be rejected anyway, let the quota recover
+                    logger.warning("Netatmo request quota exceeded, requests deferred for %d s" % _QUOTA_HOLD_OFF)
+                    limiter.holdOff(_QUOTA_HOLD_OFF)
+                logger.error(str(err))
+                return None
+        except _TRANSIENT_ERRORS as err:
+            failure = err
+        except AuthFailure:
+            outcome = True      # The API answered, the refresh token was rejected
+            raise
+        else:
+            outcome = True
+            return resp
+        finally:
+            _BREAKER.leave()
+            if guarded and outcome : _BREAKER.success()
+            elif guarded : _BREAKER.failure()
+        if attempt >= _RETRIES or (guarded and not _BREAKER.allow()):
+            if isinstance(failure, ApiError):
+                logger.error(str(failure))
+                return None
+            raise failure
+        delay = backoffDelay(attempt)
+        attempt += 1
+        logger.warning("Request failed (%s), retry %d/%d in %.1f s" % (failure, attempt, _RETRIES, delay))
+        time.sleep(delay)
+
+def backoffDelay(attempt):
+    """
+    Exponential delay before retry number attempt (from 0), half of it being random jitter
+    """
+    delay = min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** attempt)
+    return delay / 2 + _RANDOM.uniform(0, delay / 2)
+
+def sendRequest(url, params=None, timeout=10, sink=None):
+    """
+    Send a single request, without retry, and decode its answer as postRequest does
+    Raise ApiError if the server answers with an HTTP error
+    """
     if PYTHON3:
-        req = urllib.request.Request(url)
+        _loadHttp()
+        headers = dict()
         if params:
-            req.add_header("Content-Type","application/x-www-form-urlencoded;charset=utf-8")
+            headers["Content-Type"] = "application/x-www-form-urlencoded;charset=utf-8"
             params = urllib.parse.urlencode(params).encode('utf-8')
-        try:
-            resp = urllib.request.urlopen(req, params, timeout=timeout) if params else urllib.request.urlopen(req, timeout=timeout)
-        except urllib.error.HTTPError as err:
-            logger.error("code=%s, reason=%s" % (err.code, err.reason))
-            return None
+        if _TRANSPORT is not _POOL or _POOL.usable(url):
+            resp = _TRANSPORT.urlopen(url, params or None, headers, timeout=timeout)
+            if resp.status >= 300:   # Redirects not followed, as urllib
+                body = readBody(resp)
+                resp.close()
+                raise ApiError(resp.status, resp.reason, _errorCode(body))
+        else:
+            _loadUrllib()
+            req = urllib.request.Request(url, headers=headers)
+            try:
+                resp = urllib.request.urlopen(req, params, timeout=timeout) if params else urllib.request.urlopen(req, timeout=timeout)
+            except urllib.error.HTTPError as err:
+                raise ApiError(err.code, err.reason, _errorCode(err.read()))
     else:
         if params:
             params = urlencode(params)
@@ -784,13 +3028,107 @@ def postRequest(url, params=None, timeout=10):
         try:
             resp = urllib2.urlopen(req, timeout=timeout)
         except urllib2.HTTPError as err:
-            logger.error("code=%s, reason=%s" % (err.code, err.reason))
-            return None
-    data = b""
-    for buff in iter(lambda: resp.read(65535), b''): data += buff
+            raise ApiError(err.code, err.reason, _errorCode(err.read()))
     # Return values in bytes if not json data to handle properly camera images
-    returnedContentType = resp.getheader("Content-Type") if PYTHON3 else resp.info()["Content-Type"]
-    return json.loads(data.decode("utf-8")) if "application/json" in returnedContentType else data
+    returnedContentType = (resp.getheader("Content-Type") if PYTHON3 else resp.info()["Content-Type"]) or ""
+    isJson = "application/json" in returnedContentType
+    try:
+        if sink is not None and not isJson:
+            return streamBody(resp, sink)
+        data = readBody(resp)
+    finally:
+        resp.close()
+    if not isJson : return bytes(data)
+    return _decodeJson(url, data)
+
+def _decodeJson(url, data):
+    global _JSON_LOADS
+    if not PYTHON3 : return json.loads(data.decode("utf-8"))
+    if _JSON_LOADS is None:
+        try:
+            import orjson
+            _JSON_LOADS = orjson.loads
+        except ImportError:
+            _JSON_LOADS = json.loads
+    try:
+        resp = _JSON_LOADS(data)
+    except ValueError:
+        # orjson is stricter than json (NaN, integers over 64 bits), json decides
+        if _JSON_LOADS is json.loads : raise
+        resp = json.loads(data)
+    if _PROJECTION and url in _PROJECTIONS and isinstance(resp, dict) and 'body' in resp:
+        resp['body'] = _PROJECTIONS[url](resp['body'])
+    return resp
+
+def _project(d, fields):
+    return { k : d[k] for k in fields if k in d }
+
+def _projectStations(body):
+    devices = []
+    for d in body.get('devices', []):
+        station = _project(d, _STATION_FIELDS)
+        if 'modules' in station : station['modules'] = [ _project(m, _MODULE_FIELDS) for m in station['modules'] ]
+        devices.append(station)
+    return dict(body, devices=devices)
+
+def _projectHomes(body):
+    homes = []
+    for h in body.get('homes', []):
+        home = _project(h, _HOME_FIELDS)
+        for key, fields in (('cameras', _CAMERA_FIELDS), ('events', _EVENT_FIELDS), ('persons', _PERSON_FIELDS)):
+            if key in home : home[key] = [ _project(i, fields) for i in home[key] ]
+        homes.append(home)
+    return dict(body, homes=homes)
+
+_PROJECTIONS = { _GETSTATIONDATA_REQ : _projectStations, _GETHOMEDATA_REQ : _projectHomes }
+
+def _errorCode(body):
+    # Netatmo error answers look like {"error": {"code": 3, "message": "Access token expired"}}
+    try:
+        error = json.loads(bytes(body).decode("utf-8"))["error"]
+        return error["code"] if isinstance(error, dict) else None
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def readBody(resp):
+    """
+    Read a whole response body in a single buffer (bytearray), preallocated from Content-Length when available
+    """
+    length = resp.getheader("Content-Length") if PYTHON3 else resp.info().get("Content-Length")
+    if not hasattr(resp, "readinto") or not length or not length.isdigit():
+        data = bytearray()
+        for buff in iter(lambda: resp.read(_READ_CHUNK), b''): data += buff
+        return data
+    data = bytearray(int(length))
+    view = memoryview(data)
+    pos = 0
+    while pos < len(data):
+        n = resp.readinto(view[pos:])
+        if not n : break
+        pos += n
+    view.release()
+    if pos < len(data): del data[pos:]   # Truncated body
+    return data
+
+def streamBody(resp, sink):
+    """
+    Copy a response body to a file-like sink through a fixed size buffer and return its size
+    """
+    if not hasattr(resp, "readinto"):
+        size = 0
+        for buff in iter(lambda: resp.read(_READ_CHUNK), b''):
+            sink.write(buff)
+            size += len(buff)
+        return size
+    buff = bytearray(_READ_CHUNK)
+    view = memoryview(buff)
+    size = 0
+    while True:
+        n = resp.readinto(view)
+        if not n : break
+        sink.write(view[:n])
+        size += n
+    return size
 
 def toTimeString(value):
     return time.strftime("%Y-%m-%d_%H:%M:%S", time.localtime(int(value)))
@@ -819,10 +3157,11 @@ def getStationMinMaxTH(station=None, module=None, home=None):
     lastD = devList.lastData()
     if module == "*":
         result = dict()
-        for m in lastD.keys():
-            if time.time()-lastD[m]['When'] > 3600 : continue
-            r = devList.MinMaxTH(module=m)
-            result[m] = (r[0], lastD[m]['Temperature'], r[1])
+        # All the modules in one concurrent round
+        minMax = devList.allMinMaxTH(frames=("last24",))
+        for m,r in minMax.items():
+            if m not in lastD or time.time()-lastD[m]['When'] > 3600 or not r["last24"] : continue
+            result[m] = (r["last24"][0], lastD[m]['Temperature'], r["last24"][1])
     else:
         if time.time()-lastD[module]['When'] > 3600 : result = ["-", "-"]
         else : 
@@ -839,7 +3178,7 @@ if __name__ == "__main__":
     
     logging.basicConfig(format='%(name)s - %(levelname)s: %(message)s', level=logging.INFO)
 
-    if not _CLIENT_ID or not _CLIENT_SECRET or not _USERNAME or not _PASSWORD :
+    if not all(_credential(k) for k in ("CLIENT_ID", "CLIENT_SECRET", "USERNAME", "PASSWORD")) :
            stderr.write("Library source missing identification arguments to check lnetatmo.py (user/password/etc...)")
            exit(1)
 
@@ -0,0 +1,709 @@
+"""
+asyncio flavour of the lnetatmo API (Python 3.7+)
+
+Fetch weather station, home/camera data and measures from several endpoints and several
+accounts concurrently from a single event loop. Endpoints, parsing and lookups are the ones
+of lnetatmo: the Async classes derive from their synchronous counterparts and only replace
+the methods issuing requests by coroutines.
+
+    auth = AsyncClientAuth(clientId, clientSecret, username, password)
+    weather, homes = await asyncio.gather(AsyncWeatherStationData.create(auth),
+                                          AsyncHomeData.create(auth))
+    await auth.close()
+"""
+
+import asyncio
+import contextvars
+import time
+import ssl
+import urllib.parse
+
+import lnetatmo
+from lnetatmo import logger, ApiError, ApiUnavailable, AuthFailure, ResponseCache
+
+# Errors worth a retry, asyncio ones included
+lnetatmo._loadHttp()
+_TRANSIENT_ERRORS = lnetatmo._TRANSIENT_ERRORS + (asyncio.TimeoutError, asyncio.IncompleteReadError)
+
+# Set while a task attempts a request to the Netatmo API : requests it sends meanwhile (token
+# renewal) are part of that attempt for the circuit breaker, as in lnetatmo.postRequest
+_ATTEMPT = contextvars.ContextVar("attempt", default=False)
+
+
+class AsyncResponse:
+    """
+    Fully read HTTP response
+    """
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers      # lower case name : value
+        self.body = body
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+
+class AsyncConnectionPool:
+    """
+    Keep-alive HTTP(S) connections per host for asyncio streams, with a bound on the number
+    of connections opened concurrently to the same host (extra requests wait for a free one).
+    A pool belongs to the event loop it is first used from.
+
+    Args:
+        maxsize (int): Maximum number of connections per host
+        idleTimeout (float): Seconds after which an idle connection is closed instead of reused
+        context (Optional[ssl.SSLContext]): TLS context used for https connections
+    """
+    def __init__(self, maxsize=lnetatmo._POOL_MAXSIZE, idleTimeout=lnetatmo._POOL_IDLE_TIMEOUT, context=None):
+        self.maxsize = maxsize
+        self.idleTimeout = idleTimeout
+        self.context = context or ssl.create_default_context()
+        self._idle = dict()         # (scheme, host, port) : [ (reader, writer, last use time), ... ]
+        self._slots = dict()        # (scheme, host, port) : asyncio.Semaphore
+
+    async def urlopen(self, url, body=None, headers=None, timeout=10):
+        """
+        Send a request (POST if a body is given, GET otherwise) and return an AsyncResponse
+        """
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query : path += "?" + parts.query
+        lines = [ "%s %s HTTP/1.1" % ("POST" if body is not None else "GET", path),
+                  "Host: %s" % parts.netloc,
+                  "Connection: keep-alive",
+                  "Accept-Encoding: identity" ]
+        for k,v in (headers or {}).items():
+            lines.append("%s: %s" % (k, v))
+        if body is not None:
+            lines.append("Content-Length: %d" % len(body))
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (body or b"")
+        slot = self._slots.get(key)
+        if slot is None : slot = self._slots[key] = asyncio.Semaphore(self.maxsize)
+        async with slot:
+            return await asyncio.wait_for(self._exchange(key, request), timeout)
+
+    async def close(self):
+        """
+        Close all idle connections
+        """
+        idle, self._idle = self._idle, dict()
+        for conns in idle.values():
+            for _,writer,_ in conns:
+                writer.close()
+
+    async def _exchange(self, key, request):
+        idempotent = request.startswith(b"GET ")
+        while True:
+            reader, writer, reused = await self._acquire(key)
+            sent = False
+            try:
+                writer.write(request)
+                await writer.drain()
+                sent = True
+                resp, willClose = await _readResponse(reader)
+            except (asyncio.IncompleteReadError, ConnectionError) :
+                writer.close()
+                # The server silently dropped an idle connection, try again with a fresh one unless
+                # a POST already went through it (it may have been processed)
+                if reused and (idempotent or not sent) : continue
+                raise
+            except BaseException :
+                writer.close()
+                raise
+            if willClose:
+                writer.close()
+            else:
+                self._idle.setdefault(key, []).append( (reader, writer, time.time()) )
+            return resp
+
+    async def _acquire(self, key):
+        now = time.time()
+        conns = self._idle.get(key, [])
+        while conns:
+            reader, writer, lastUse = conns.pop()
+            if now - lastUse < self.idleTimeout and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        reader, writer = await asyncio.open_connection(host, port, ssl=self.context if scheme == "https" else None)
+        return reader, writer, False
+
+
+async def _readResponse(reader):
+    statusLine = await reader.readline()
+    if not statusLine : raise asyncio.IncompleteReadError(b"", None)
+    version, status, reason = (statusLine.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+    headers = dict()
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b"") : break
+        k,v = line.decode("latin-1").split(":", 1)
+        headers[k.strip().lower()] = v.strip()
+    willClose = headers.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if not size : break
+            body += await reader.readexactly(size)
+            await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b"") : pass    # Trailers
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        willClose = True
+    return AsyncResponse(int(status), reason, headers, body), willClose
+
+
+async def acquire(limiter, priority=lnetatmo.PRIORITY_POLL):
+    """
+    Wait for the turn of a request in a lnetatmo.RateLimiter, queued with the synchronous requests
+    """
+    ticket = limiter.enqueue(priority)
+    try:
+        while True:
+            wait = limiter.poll(ticket)
+            if not wait : return
+            await asyncio.sleep(wait)
+    except BaseException:
+        limiter.cancel(ticket)
+        raise
+
+
+async def sendRequest(url, params=None, timeout=10, pool=None):
+    """
+    Coroutine version of lnetatmo.sendRequest. Requests go through the transport set with
+    lnetatmo.setTransport if any (in a thread of the default executor), through pool otherwise
+    (a connection opened and closed for this request only without pool)
+    """
+    if lnetatmo._TRANSPORT is not lnetatmo._POOL:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lnetatmo.sendRequest, url, params, timeout)
+    headers = dict()
+    if params:
+        headers["Content-Type"] = "application/x-www-form-urlencoded;charset=utf-8"
+        params = urllib.parse.urlencode(params).encode('utf-8')
+    if pool is None:
+        pool = AsyncConnectionPool()
+        try:
+            resp = await pool.urlopen(url, params or None, headers, timeout=timeout)
+        finally:
+            await pool.close()
+    else:
+        resp = await pool.urlopen(url, params or None, headers, timeout=timeout)
+    if resp.status >= 300:   # Redirects not followed, as lnetatmo.sendRequest
+        raise ApiError(resp.status, resp.reason, lnetatmo._errorCode(resp.body))
+    # Return values in bytes if not json data to handle properly camera images
+    if "application/json" in resp.getheader("Content-Type", ""):
+        return lnetatmo._decodeJson(url, resp.body)
+    return bytes(resp.body)
+
+
+async def postRequest(url, params=None, timeout=10, pool=None, cache=None, bypassCache=False, priority=lnetatmo.PRIORITY_POLL,
+                      limiter=None, auth=None):
+    """
+    Coroutine version of lnetatmo.postRequest, with the same cache, retries, token renewal (auth
+    being an AsyncClientAuth) and circuit breaker. Requests to the Netatmo API wait for limiter
+    (the one of the account), lnetatmo._LIMITER by default
+    """
+    if cache is not None:
+        resp = None if bypassCache else cache.get(url, params)
+        if resp is not None : return resp
+        try:
+            resp = await postRequest(url, params, timeout, pool, priority=priority, limiter=limiter, auth=auth)
+        except _TRANSIENT_ERRORS + (ApiUnavailable,) as err:
+            resp = cache.get(url, params, stale=True)
+            if resp is None : raise
+            logger.warning("Request failed (%s), using cached data" % err)
+            return resp
+        if resp is not None:
+            cache.put(url, params, resp)
+            return resp
+        return cache.get(url, params, stale=True)
+    if not url.startswith(lnetatmo._BASE_URL):
+        try:
+            return await sendRequest(url, params, timeout, pool)
+        except ApiError as err:
+            logger.error(str(err))
+            return None
+    breaker = lnetatmo._BREAKER
+    guarded = not _ATTEMPT.get()
+    if guarded and not breaker.allow():
+        raise ApiUnavailable("Netatmo API calls suspended for %d s after repeated failures" % breaker.remaining())
+    limiter = limiter or lnetatmo._LIMITER
+    attempt = 0
+    renewed = False
+    while True:
+        # Same rate limiters as the synchronous requests
+        await acquire(limiter, priority)
+        # Every attempt ends with a success or a failure of the breaker, whatever happens
+        outcome = False
+        token = _ATTEMPT.set(True)
+        try:
+            try:
+                resp = await sendRequest(url, params, timeout, pool)
+            except ApiError as err:
+                if err.error not in lnetatmo._TOKEN_ERRORS or not auth or renewed or "access_token" not in (params or {}):
+                    raise
+                logger.info("Access token rejected, renewing it")
+                params = dict(params, access_token=await auth.renewToken(params["access_token"]))
+                renewed = True
+                resp = await sendRequest(url, params, timeout, pool)
+        except ApiError as err:
+            if err.code >= 500:
+                failure = err
+            else:
+                outcome = True
+                if err.error in lnetatmo._QUOTA_ERRORS or err.code == 429:
+                    # Requests would be rejected anyway, let the quota recover
+                    logger.warning("Netatmo request quota exceeded, requests deferred for %d s" % lnetatmo._QUOTA_HOLD_OFF)
+                    limiter.holdOff(lnetatmo._QUOTA_HOLD_OFF)
+                logger.error(str(err))
+                return None
+        except _TRANSIENT_ERRORS as err:
+            failure = err
+        except AuthFailure:
+            outcome = True      # The API answered, the refresh token was rejected
+            raise
+        except asyncio.CancelledError:
+            outcome = None      # Neither a success nor a failure of the API
+            raise
+        else:
+            outcome = True
+            return resp
+        finally:
+            _ATTEMPT.reset(token)
+            if guarded and outcome : breaker.success()
+            elif guarded and outcome is None : breaker.abandon()
+            elif guarded : breaker.failure()
+        if attempt >= lnetatmo._RETRIES or (guarded and not breaker.allow()):
+            if isinstance(failure, ApiError):
+                logger.error(str(failure))
+                return None
+            raise failure
+        delay = lnetatmo.backoffDelay(attempt)
+        attempt += 1
+        logger.warning("Request failed (%s), retry %d/%d in %.1f s" % (failure, attempt, lnetatmo._RETRIES, delay))
+        await asyncio.sleep(delay)
+
+
+class AsyncClientAuth:
+    """
+    Coroutine version of lnetatmo.ClientAuth. No request is sent at construction: the password
+    grant occurs on the first accessToken() call, and expired tokens are renewed by the first
+    caller while concurrent callers wait for the new one.
+
+    Args:
+        clientId (str): Application clientId delivered by Netatmo on dev.netatmo.com
+        clientSecret (str): Application Secret key delivered by Netatmo on dev.netatmo.com
+        username (str)
+        password (str)
+        scope (Optional[str]): See lnetatmo.ClientAuth
+        pool (Optional[AsyncConnectionPool]): Connections used by every request of this account
+    """
+    def __init__(self, clientId=None, clientSecret=None, username=None, password=None,
+                       scope="read_station read_camera access_camera write_camera " \
+                             "read_presence access_presence write_presence read_thermostat write_thermostat",
+                       pool=None):
+        self._clientId = clientId if clientId is not None else lnetatmo._credential("CLIENT_ID")
+        self._clientSecret = clientSecret if clientSecret is not None else lnetatmo._credential("CLIENT_SECRET")
+        self._username = username if username is not None else lnetatmo._credential("USERNAME")
+        self._password = password if password is not None else lnetatmo._credential("PASSWORD")
+        self._requestedScope = scope
+        self.pool = pool or AsyncConnectionPool()
+        self.cache = ResponseCache()
+        self.limiter = lnetatmo.accountLimiter(self._clientId, self._username)
+        self._accessToken = None
+        self.refreshToken = None
+        self.expiration = 0
+        self._lock = None
+
+    async def accessToken(self):
+        if self._accessToken and self.expiration >= time.time():
+            return self._accessToken
+        return await self.renewToken(self._accessToken)
+
+    async def renewToken(self, rejected=None):
+        """
+        Get a new access token, with the refresh token if any. If rejected is given and the current
+        token already differs from it, another caller renewed it meanwhile and it is returned as is
+        """
+        if self._lock is None : self._lock = asyncio.Lock()
+        async with self._lock:
+            if rejected is not None and rejected != self._accessToken:
+                return self._accessToken
+            if self.refreshToken:
+                postParams = {
+                        "grant_type" : "refresh_token",
+                        "refresh_token" : self.refreshToken,
+                        "client_id" : self._clientId,
+                        "client_secret" : self._clientSecret
+                        }
+            else:
+                postParams = {
+                        "grant_type" : "password",
+                        "client_id" : self._clientId,
+                        "client_secret" : self._clientSecret,
+                        "username" : self._username,
+                        "password" : self._password,
+                        "scope" : self._requestedScope
+                        }
+            resp = await self.post(lnetatmo._AUTH_REQ, postParams)
+            if not resp:
+                # Authenticate again with the password next time
+                self.refreshToken = None
+                raise AuthFailure("Authentication request rejected")
+            self._accessToken = resp['access_token']
+            self.refreshToken = resp['refresh_token']
+            self._scope = resp.get('scope', self._requestedScope)
+            self.expiration = int(resp['expire_in'] + time.time())
+        return self._accessToken
+
+    async def post(self, url, params=None, timeout=10, cache=False, bypassCache=False, priority=lnetatmo.PRIORITY_POLL):
+        """
+        Send a request through the connections of this account
+        """
+        return await postRequest(url, params, timeout, pool=self.pool,
+                                 cache=self.cache if cache else None, bypassCache=bypassCache, priority=priority,
+                                 limiter=self.limiter, auth=self)
+
+    async def close(self):
+        await self.pool.close()
+
+
+class AsyncWeatherStationData(lnetatmo.WeatherStationData):
+    """
+    Coroutine version of lnetatmo.WeatherStationData, to be built with create()
+    Lookup methods (stationByName, lastData, ...) are inherited unchanged, the measure iterators
+    are asynchronous generators. Measures are always requested, a measure store is not used
+    """
+    def __init__(self, authData, priority=lnetatmo.PRIORITY_POLL):
+        self._authData = authData
+        self.priority = priority
+
+    @classmethod
+    async def create(cls, authData, home=None, station=None, useCache=True, priority=lnetatmo.PRIORITY_POLL):
+        self = cls(authData, priority)
+        self.getAuthToken = await authData.accessToken()
+        postParams = {
+                "access_token" : self.getAuthToken
+                }
+        resp = await authData.post(lnetatmo._GETSTATIONDATA_REQ, postParams, cache=True, bypassCache=not useCache, priority=priority)
+        self._parse(resp, home, station)
+        return self
+
+    async def refresh(self, useCache=True):
+        self.getAuthToken = await self._authData.accessToken()
+        postParams = {
+                "access_token" : self.getAuthToken
+                }
+        resp = await self._authData.post(lnetatmo._GETSTATIONDATA_REQ, postParams, cache=True, bypassCache=not useCache,
+                                         priority=self.priority)
+        return self._update(resp)
+
+    async def getMeasure(self, device_id, scale, mtype, module_id=None, date_begin=None, date_end=None, limit=None, optimize=False, real_time=False, priority=None):
+        self.getAuthToken = await self._authData.accessToken()
+        postParams = self._measureParams(device_id, scale, mtype, module_id, date_begin, date_end, limit, optimize, real_time)
+        return await self._authData.post(lnetatmo._GETMEASURE_REQ, postParams,
+                                         priority=self.priority if priority is None else priority)
+
+    async def iterMeasure(self, device_id, scale, mtype, module_id=None, date_begin=None, date_end=None, real_time=False,
+                          priority=lnetatmo.PRIORITY_BACKFILL):
+        """
+        Asynchronous generator over the measures of a module, see lnetatmo.WeatherStationData.iterMeasure
+        """
+        async for times, columns in self.iterMeasureColumns(device_id, scale, mtype, module_id, date_begin, date_end,
+                                                            real_time, priority):
+            for point in zip(times, zip(*columns)):
+                yield point
+
+    async def iterMeasureColumns(self, device_id, scale, mtype, module_id=None, date_begin=None, date_end=None,
+                                 real_time=False, priority=lnetatmo.PRIORITY_BACKFILL):
+        """
+        Same as iterMeasure, yielding each page as columns (see lnetatmo.measureColumns) instead of points
+        """
+        while True:
+            resp = await self.getMeasure(device_id, scale, mtype, module_id, date_begin, date_end, lnetatmo._MEASURE_PAGE,
+                                         optimize=True, real_time=real_time, priority=priority)
+            times, columns = lnetatmo.measureColumns(resp)
+            if not times : return
+            yield times, columns
+            date_begin = lnetatmo._nextPage(times, date_end)
+            if date_begin is None : return
+
+    async def iterMeasures(self, queries, workers=lnetatmo._MEASURE_WORKERS, priority=lnetatmo.PRIORITY_BACKFILL):
+        """
+        Fetch several measure series concurrently, workers tasks at a time, and yield (query index, timestamp, values)
+        as pages arrive, see lnetatmo.WeatherStationData.iterMeasures. The tasks are cancelled once the
+        generator is closed
+        """
+        queries = list(queries)
+        pending = iter(range(len(queries)))
+        pages = asyncio.Queue()
+        slots = asyncio.Semaphore(workers)      # Pages waiting in memory
+
+        async def work():
+            try:
+                for index in pending:
+                    kwargs = dict(queries[index])
+                    kwargs.setdefault('priority', priority)
+                    async for page in self.iterMeasureColumns(**kwargs):
+                        await slots.acquire()
+                        pages.put_nowait((index, page, None))
+            except Exception as e:
+                pages.put_nowait((None, None, e))
+            finally:
+                pages.put_nowait(None)
+
+        tasks = [ asyncio.ensure_future(work()) for _ in range(min(workers, len(queries))) ]
+        running = len(tasks)
+        try:
+            while running:
+                item = await pages.get()
+                if item is None:
+                    running -= 1
+                    continue
+                index, page, error = item
+                if error : raise error
+                slots.release()
+                times, columns = page
+                for t,v in zip(times, zip(*columns)):
+                    yield index, t, v
+        finally:
+            for task in tasks : task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def MinMaxTH(self, module=None, frame="last24"):
+        resp = await self.getMeasure(**self._minMaxTHQuery(module, frame))
+        return self._minMaxTHResult(resp)
+
+    async def allMinMaxTH(self, station=None, frames=("last24", "day"), workers=lnetatmo._MEASURE_WORKERS):
+        """
+        MinMaxTH of all the modules of a station for several frames at once, each module being requested
+        once for all the frames, concurrently (see lnetatmo.WeatherStationData.allMinMaxTH)
+        """
+        s, ranges, modules = self._allMinMaxTHPlan(station, frames)
+        queries = self._allMinMaxTHQueries(s, ranges, modules)
+        acc = [ [ None for r in ranges ] for q in queries ]
+        async for index, t, (T, H) in self.iterMeasures(queries, workers, self.priority):
+            lnetatmo._addMinMaxTH(acc[index], ranges, t, T, H)
+        return self._allMinMaxTHResult(ranges, modules, acc)
+
+
+class AsyncHomeData(lnetatmo.HomeData):
+    """
+    Coroutine version of lnetatmo.HomeData, to be built with create()
+    Lookup and presence methods are inherited unchanged, the methods sending requests (pictures,
+    events, camera urls and commands) are coroutines
+    """
+    def __init__(self, authData):
+        self._authData = authData
+        self._tasks = set()         # Background urls checks
+
+    @classmethod
+    async def create(cls, authData, home=None, maxEvents=lnetatmo._EVENTS_KEPT, retention=lnetatmo._EVENTS_RETENTION,
+                     imageCache=None):
+        self = cls(authData)
+        self.maxEvents = maxEvents
+        self.eventsRetention = retention
+        self.imageCache = imageCache
+        self.getAuthToken = await authData.accessToken()
+        postParams = {
+            "access_token" : self.getAuthToken
+            }
+        resp = await authData.post(lnetatmo._GETHOMEDATA_REQ, postParams)
+        self._parse(resp, home)
+        return self
+
+    async def getCameraPicture(self, image_id, key):
+        """
+        Download a specific image (of an event or user face) from the camera
+        With an imageCache, the image is read from it when already downloaded
+        """
+        if self.imageCache is not None:
+            path, image_type = await self.cameraPicturePath(image_id, key)
+            if path is None : return None, None
+            try:
+                with open(path, "rb") as f:
+                    return f.read(), image_type
+            except (IOError, OSError):
+                # Evicted by another thread since, downloaded again
+                pass
+        return await self._downloadPicture(image_id, key)
+
+    async def _downloadPicture(self, image_id, key):
+        self.getAuthToken = await self._authData.accessToken()
+        postParams = {
+            "access_token" : self.getAuthToken,
+            "image_id" : image_id,
+            "key" : key
+            }
+        resp = await self._authData.post(lnetatmo._GETCAMERAPICTURE_REQ, postParams)
+        image_type = lnetatmo._imageType(resp)
+        return resp, image_type
+
+    async def cameraPicturePath(self, image_id, key):
+        """
+        Return the path of an image in the imageCache, downloaded only if not already there, and its type
+        """
+        cacheKey = "picture:%s:%s" % (image_id, key)
+        path = self.imageCache.get(cacheKey)
+        if path is None:
+            resp, _ = await self._downloadPicture(image_id, key)
+            if not resp or isinstance(resp, dict) : return None, None
+            path = self.imageCache.put(cacheKey, bytes(resp))
+        return path, lnetatmo._pathImageType(path)
+
+    async def getProfileImage(self, name):
+        """
+        Retrieve the face of a given person
+        """
+        p = self._personsByPseudo.get(name)
+        if p:
+            return await self.getCameraPicture(p['face']['id'], p['face']['key'])
+        return None, None
+
+    async def cameraUrls(self, camera=None, home=None, cid=None, refresh=False):
+        """
+        Return the vpn and local urls of a camera, checked again once expired (see lnetatmo.HomeData.cameraUrls)
+        """
+        camera_data = self.cameraById(cid) if cid else self.cameraByName(camera=camera, home=home)
+        if not camera_data : return None, None
+        return await self._resolveUrls(camera_data, refresh)
+
+    async def url(self, camera=None, home=None, cid=None):
+        vpn_url, local_url = await self.cameraUrls(camera, home, cid)
+        return local_url or vpn_url
+
+    async def _resolveUrls(self, camera, refresh=False):
+        with self._urlsLock:
+            known = self._urls.get(camera['id'])
+        if known and not refresh and known[0] == camera['vpn_url']:
+            if known[2] < time.time() : self._reprobe(camera)
+            return known[0], known[1]
+        return await self._probeUrls(camera)
+
+    async def _probeUrls(self, camera):
+        local_url = None
+        vpn_url = camera['vpn_url']
+        resp = await self._authData.post(vpn_url + '/command/ping')
+        if not resp : return vpn_url, None      # Not kept, checked again on next use
+        temp_local_url = resp['local_url']
+        try:
+            resp = await self._authData.post(temp_local_url + '/command/ping', timeout=1)
+            if resp and temp_local_url == resp['local_url']:
+                local_url = temp_local_url
+        except _TRANSIENT_ERRORS:
+            local_url = None
+        with self._urlsLock:
+            self._urls[camera['id']] = (vpn_url, local_url, time.time() + lnetatmo._CAMERA_URLS_TTL)
+        return vpn_url, local_url
+
+    def _reprobe(self, camera):
+        with self._urlsLock:
+            if camera['id'] in self._probing : return
+            self._probing.add(camera['id'])
+        async def probe():
+            try:
+                await self._probeUrls(camera)
+            except Exception as e:
+                logger.warning("Camera %s unreachable (%s)" % (camera['id'], e))
+                self.invalidateUrls(camera['id'])
+            finally:
+                with self._urlsLock:
+                    self._probing.discard(camera['id'])
+        task = asyncio.ensure_future(probe())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _command(self, camera, commande, parameters=None, timeout=3, local=False):
+        """
+        Send a command to a camera, as lnetatmo.HomeData._command
+        """
+        for retry in (False, True):
+            vpn_url, local_url = await self._resolveUrls(camera, refresh=retry)
+            url = local_url if local else local_url or vpn_url
+            if not url : return None
+            try:
+                resp = await self._authData.post(url + (commande % parameters if parameters else commande), timeout=timeout)
+            except _TRANSIENT_ERRORS as e:
+                if retry:
+                    self.invalidateUrls(camera['id'])
+                    raise
+                logger.info("Camera %s command failed (%s), checking its urls again" % (camera['id'], e))
+                continue
+            if resp is not None : return resp
+            self.invalidateUrls(camera['id'])
+        return None
+
+    async def presenceUrl(self, camera=None, home=None, cid=None, setting=None):
+        camera = self.cameraByName(home=home, camera=camera) or self.cameraById(cid=cid)
+        if camera["type"] != "NOC": return None # Not a presence camera
+        vpnUrl, localUrl = await self.cameraUrls(cid=camera["id"])
+        return localUrl
+
+    async def presenceLight(self, camera=None, home=None, cid=None, setting=None):
+        camera = self.cameraByName(home=home, camera=camera) or self.cameraById(cid=cid)
+        if not camera or camera["type"] != "NOC" or setting not in ("on", "off", "auto"): return None
+        if setting : return "Currently unsupported"
+        return (await self._command(camera, lnetatmo._PRES_CDE_GET_LIGHT, local=True))["mode"]
+
+    async def presenceStatus(self, mode, camera=None, home=None, cid=None):
+        camera = self.cameraByName(home=home, camera=camera) or self.cameraById(cid=cid)
+        if not camera or camera["type"] != "NOC" or mode not in ("on", "off") : return None
+        r = await self._command(camera, lnetatmo._CAM_CHANGE_STATUS, mode, local=True)
+        return mode if r and r["status"] == "ok" else None
+
+    async def getLiveSnapshot(self, camera=None, home=None, cid=None):
+        camera = self.cameraByName(home=home, camera=camera) or self.cameraById(cid=cid)
+        return await self._command(camera, lnetatmo._PRES_CDE_GET_SNAP)
+
+    async def getLiveSnapshots(self, cids=None, home=None, workers=lnetatmo._SNAPSHOT_WORKERS):
+        """
+        Take a live snapshot of several cameras concurrently, workers at a time, see lnetatmo.HomeData.getLiveSnapshots
+        """
+        if cids : cameras = [self.cameraById(c) for c in cids if self.cameraById(c)]
+        elif home : cameras = list(self.cameras.get(home, {}).values())
+        else : cameras = list(self._camerasById.values())
+        slots = asyncio.Semaphore(workers)
+        results = dict()
+
+        async def snapshot(camera):
+            async with slots:
+                try:
+                    image = await self._command(camera, lnetatmo._PRES_CDE_GET_SNAP)
+                except Exception as e:
+                    logger.warning("No snapshot of camera %s (%s)" % (camera['id'], e))
+                    image = None
+            if not image or isinstance(image, dict):
+                results[camera['id']] = (None, None)
+            elif self.imageCache is not None:
+                path = self.imageCache.put("snapshot:%s" % camera['id'], bytes(image))
+                results[camera['id']] = (path, lnetatmo._pathImageType(path))
+            else:
+                results[camera['id']] = (memoryview(image), lnetatmo._imageType(image))
+
+        await asyncio.gather(*[ snapshot(c) for c in cameras ])
+        return results
+
+    async def updateEvent(self, event=None, home=None):
+        """
+        Update the list of event with the latest ones
+        """
+        self.getAuthToken = await self._authData.accessToken()
+        resp = await self._authData.post(lnetatmo._GETEVENTSUNTIL_REQ, self._eventsUntilParams(event, home))
+        self._updatePresence(self._mergeEvents(resp['body']['events_list']))
+
+    async def syncEvents(self, home=None):
+        """
+        Fetch the events of a home newer than its latest known one, return the new ones in time order
+        """
+        self.getAuthToken = await self._authData.accessToken()
+        url, params = self._syncQuery(home)
+        resp = await self._authData.post(url, params)
+        return self._syncMerge(params['home_id'], resp)
@@ -0,0 +1,614 @@
+"""
+Local mock of the Netatmo API, to run, benchmark and load test lnetatmo and the node server
+without Netatmo credentials nor network access
+
+    server = MockNetatmoServer().start()
+    lnetatmo.setTransport(server.transport())
+    authorization = lnetatmo.ClientAuth("id", "secret", "user", "password")
+    ...
+    server.stop()
+
+Covers oauth2/token, getstationsdata, getmeasure, gethomedata, geteventsuntil and getcamerapicture,
+plus the ping and snapshot commands of the mocked cameras. Data is synthetic and deterministic.
+Standalone use : python3 lnetatmo_mock.py [port]
+Connection reuse, import time, lookup, module records and other microbenchmarks : python3 lnetatmo_mock.py bench
+"""
+
+import json, math, time, timeit
+import os, shutil, ssl, subprocess, sys, tempfile
+import tracemalloc
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import lnetatmo
+
+# Seconds between two points for each getmeasure scale
+_SCALES = { "max" : 300, "5min" : 300, "30min" : 1800, "1hour" : 3600, "3hours" : 10800, "1day" : 86400 }
+_MAX_POINTS = 1024
+
+# Smallest valid JPEG-like answer for pictures and snapshots
+_JPEG = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00\xff\xd9"
+
+
+class MockNetatmoServer:
+    """
+    Threaded HTTP server mimicking the Netatmo API
+
+    Args:
+        stations (int): Number of weather stations (each with an outdoor, indoor, wind and rain module)
+        port (int): Listening port, 0 for any free port
+        now (Optional[float]): Time of the last measures, current time by default
+        cameras (int): Number of cameras of the home (at least 2, a NACamera and a NOC)
+        certfile, keyfile (Optional[str]): Certificate and key to serve https instead of http
+    """
+    def __init__(self, stations=1, port=0, now=None, cameras=2, certfile=None, keyfile=None):
+        self.now = now or time.time()
+        self.counts = dict()        # Endpoint path : number of requests received
+        self._faults = dict()       # Endpoint path : [ HTTP status to answer, ... ]
+        self._redirects = dict()    # Endpoint path : (HTTP status, location)
+        self._tokens = set()
+        self._issued = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+        self._server.daemon_threads = True
+        scheme = "http"
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+            scheme = "https"
+        self.url = "%s://127.0.0.1:%d/" % (scheme, self._server.server_address[1])
+        self.devices = [ self._station(i) for i in range(stations) ]
+        self.homes = [ self._home(cameras) ]
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def transport(self):
+        """
+        Return a transport sending lnetatmo requests to this server (see lnetatmo.setTransport)
+        """
+        return _LocalTransport(self.url)
+
+    def inject(self, path, *codes):
+        """
+        Answer the next requests to path (eg "api/getstationsdata") with the given HTTP status codes
+        403 answers are Netatmo "access token expired" errors, 429 "user usage reached"
+        """
+        with self._lock:
+            self._faults.setdefault(path.strip("/"), []).extend(codes)
+
+    def redirect(self, path, location, status=302):
+        """
+        Answer the requests to path with a redirect to location (absolute or relative url)
+        """
+        with self._lock:
+            self._redirects[path.strip("/")] = (status, location)
+
+    def accessToken(self):
+        """
+        Issue an access token, for requests sent without a ClientAuth
+        """
+        return json.loads(self._token({ "grant_type" : "password" })[2])["access_token"]
+
+    def expireTokens(self):
+        """
+        Reject all the access tokens issued so far as expired
+        """
+        with self._lock:
+            self._tokens.clear()
+
+    def addEvent(self, cameraId=None, etype="movement", personId=None):
+        """
+        Record a new event on a camera (the first one of the first home with cameras by default), as
+        returned by gethomedata and geteventsuntil
+        """
+        home = next(h for h in self.homes if h.get("cameras") and
+                    (cameraId is None or any(c["id"] == cameraId for c in h["cameras"])))
+        cameraId = cameraId or home["cameras"][0]["id"]
+        with self._lock:
+            event = { "id" : "event-%d" % (sum(len(h.get("events", [])) for h in self.homes) + 1),
+                      "type" : etype,
+                      "time" : int(time.time()),
+                      "camera_id" : cameraId,
+                      "device_id" : cameraId,
+                      "message" : etype }
+            if personId : event["person_id"] = personId
+            home["events"].insert(0, event)
+        return event
+
+    # Synthetic data
+
+    def _station(self, i):
+        mac = lambda kind: "%s:00:00:00:00:%02x" % (kind, i)
+        t = int(self.now) - 120
+        station = { "_id" : "70:ee:50:00:00:%02x" % i,
+                    "type" : "NAMain",
+                    "station_name" : "Station %d (Indoor)" % i,
+                    "module_name" : "Indoor %d" % i,
+                    "home_id" : "home-%d" % i,
+                    "home_name" : "Home %d" % i,
+                    "wifi_status" : 50,
+                    "firmware" : 181, "last_status_store" : t, "last_upgrade" : t - 86400 * 90,
+                    "date_setup" : t - 86400 * 400, "co2_calibrating" : False, "reachable" : True,
+                    "place" : { "altitude" : 35, "city" : "Paris", "country" : "FR", "timezone" : "Europe/Paris",
+                                "location" : [ 2.35 + i / 1000, 48.85 ] },
+                    "data_type" : [ "Temperature", "CO2", "Humidity", "Noise", "Pressure" ],
+                    "dashboard_data" : { "time_utc" : t, "Temperature" : 21.3, "CO2" : 600, "Humidity" : 45,
+                                         "Noise" : 37, "Pressure" : 1015.2, "AbsolutePressure" : 1001.4,
+                                         "min_temp" : 19.8, "max_temp" : 22.1, "temp_trend" : "stable",
+                                         "pressure_trend" : "up" },
+                    "modules" : [] }
+        battery = { "battery_percent" : 80, "battery_vp" : 5200, "rf_status" : 60 }
+        modules = (
+            ("02", "NAModule1", "Outdoor %d" % i, { "Temperature" : 8.4, "Humidity" : 78, "min_temp" : 4.2,
+                                                     "max_temp" : 11.0, "temp_trend" : "down" }),
+            ("03", "NAModule4", "Bedroom %d" % i, { "Temperature" : 19.1, "CO2" : 750, "Humidity" : 50,
+                                                     "min_temp" : 18.0, "max_temp" : 20.0, "temp_trend" : "stable" }),
+            ("06", "NAModule2", "Wind %d" % i, { "WindStrength" : 12, "WindAngle" : 240, "GustStrength" : 25,
+                                                  "GustAngle" : 250, "max_wind_str" : 31, "max_wind_angle" : 245 }),
+            ("05", "NAModule3", "Rain %d" % i, { "Rain" : 0.2, "sum_rain_1" : 0.4, "sum_rain_24" : 3.1 }) )
+        for kind, mtype, name, data in modules:
+            data = dict(data, time_utc=t - 30)
+            module = dict(battery, _id=mac(kind), type=mtype, module_name=name, dashboard_data=data, firmware=50,
+                          reachable=True, last_setup=t - 86400 * 400, last_message=t - 30, last_seen=t - 30,
+                          data_type=[ k for k in data if k[0].isupper() ])
+            station["modules"].append(module)
+        return station
+
+    def _home(self, count=2):
+        vpn = lambda cid: "%svpn/%s" % (self.url, cid)
+        cameras = [ { "id" : "70:ee:50:aa:00:01", "type" : "NACamera", "name" : "Living room", "status" : "on",
+                      "vpn_url" : vpn("70:ee:50:aa:00:01"), "is_local" : True },
+                    { "id" : "70:ee:50:aa:00:02", "type" : "NOC", "name" : "Garden", "status" : "on",
+                      "vpn_url" : vpn("70:ee:50:aa:00:02"), "is_local" : True } ]
+        for n in range(3, count + 1):
+            cid = "70:ee:50:aa:%02x:%02x" % (n // 256, n % 256)
+            cameras.append({ "id" : cid, "type" : ("NACamera", "NOC")[n % 2], "name" : "Camera %d" % n, "status" : "on",
+                             "vpn_url" : vpn(cid), "is_local" : True })
+        persons = [ { "id" : "person-1", "pseudo" : "Alice", "out_of_sight" : False, "last_seen" : int(self.now) - 60,
+                      "face" : { "id" : "face-1", "key" : "key-1" } },
+                    { "id" : "person-2", "pseudo" : "Bob", "out_of_sight" : True, "last_seen" : int(self.now) - 7200,
+                      "face" : { "id" : "face-2", "key" : "key-2" } },
+                    { "id" : "person-3", "out_of_sight" : True, "last_seen" : int(self.now) - 600,
+                      "face" : { "id" : "face-3", "key" : "key-3" } } ]
+        events = []
+        for n in range(20):
+            camera = cameras[n % 2]
+            event = { "id" : "event-%d" % (20 - n), "type" : "person" if n % 3 == 0 else "movement",
+                      "time" : int(self.now) - 300 * n, "camera_id" : camera["id"], "device_id" : camera["id"],
+                      "message" : "", "video_id" : "video-%d" % n, "video_status" : "available",
+                      "snapshot" : { "id" : "snap-%d" % n, "version" : 1, "key" : "key-%d" % n },
+                      "vignette" : { "id" : "vign-%d" % n, "version" : 1, "key" : "key-%d" % n } }
+            if event["type"] == "person" : event["person_id"] = persons[n % 3]["id"]
+            events.append(event)
+        for c in cameras:
+            c.update({ "sd_status" : "on", "alim_status" : "on", "last_setup" : int(self.now) - 86400 * 400,
+                       "modules" : [], "use_pin_code" : False })
+            if c["type"] == "NOC" : c["light_mode_status"] = "auto"
+        return { "id" : "home-0", "name" : "Home 0", "cameras" : cameras, "persons" : persons, "events" : events,
+                 "place" : { "city" : "Paris", "country" : "FR", "timezone" : "Europe/Paris" }, "smokedetectors" : [] }
+
+    def _measures(self, params):
+        scale = params.get("scale", "max")
+        step = _SCALES.get(scale, 300)
+        types = params.get("type", "Temperature").split(",")
+        end = int(float(params.get("date_end") or self.now))
+        limit = min(int(params.get("limit") or _MAX_POINTS), _MAX_POINTS)
+        begin = int(float(params.get("date_begin") or end - step * limit))
+        begin -= begin % step
+        if begin < int(float(params.get("date_begin") or 0)) : begin += step
+        stamps = list(range(begin, end + 1, step))[:limit]
+        salt = sum(ord(c) for c in params.get("module_id") or params.get("device_id", ""))
+        values = [ [ _value(mtype, t, salt) for mtype in types ] for t in stamps ]
+        if params.get("optimize") == "true":
+            return [ { "beg_time" : stamps[0], "step_time" : step, "value" : values } ] if stamps else []
+        return dict( (str(t), v) for t,v in zip(stamps, values) )
+
+    # Request handling
+
+    def _answer(self, path, params):
+        """
+        Return (HTTP status, content type, body) for a request
+        """
+        with self._lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+            faults = self._faults.get(path)
+            fault = faults.pop(0) if faults else None
+        if fault == 403 : return _error(403, 3, "Access token expired")
+        if fault == 429 : return _error(403, 26, "User usage reached")
+        if fault : return _error(fault, 0, "Injected failure")
+        if path == "oauth2/token" : return self._token(params)
+        if path.startswith("vpn/") : return self._camera(path)
+        if path.startswith("api/") and params.get("access_token") not in self._tokens:
+            return _error(403, 2, "Invalid access token")
+        if path == "api/getstationsdata":
+            user = { "mail" : "user@example.com", "administrative" : { "unit" : 0, "windunit" : 0, "pressureunit" : 0,
+                                                                       "lang" : "en-US", "reg_locale" : "en-US" } }
+            return _ok({ "devices" : self.devices, "user" : user })
+        if path == "api/getmeasure" : return _ok(self._measures(params))
+        if path == "api/gethomedata":
+            return _ok({ "homes" : self.homes, "user" : { "reg_locale" : "en-US", "lang" : "en-US" } })
+        if path == "api/geteventsuntil":
+            home = next((h for h in self.homes if h["id"] == params.get("home_id")), self.homes[0])
+            events = home.get("events", [])
+            ids = [e["id"] for e in events]
+            until = ids.index(params.get("event_id")) + 1 if params.get("event_id") in ids else len(events)
+            return _ok({ "events_list" : events[:until] })
+        if path == "api/getcamerapicture" : return 200, "image/jpeg", _JPEG
+        return _error(404, 404, "Unknown endpoint")
+
+    def _token(self, params):
+        if params.get("grant_type") not in ("password", "refresh_token"):
+            return _error(400, 0, "unsupported_grant_type")
+        with self._lock:
+            self._issued += 1
+            token = "access-%d" % self._issued
+            self._tokens.add(token)
+        return 200, "application/json", json.dumps({ "access_token" : token, "refresh_token" : "refresh-%d" % self._issued,
+                                                     "scope" : (params.get("scope") or "read_station").split(),
+                                                     "expire_in" : 10800, "expires_in" : 10800 }).encode("utf-8")
+
+    def _camera(self, path):
+        cameraUrl = self.url + "/".join(path.split("/")[:2])
+        command = "/" + "/".join(path.split("/")[2:])
+        if command == "/command/ping":
+            return 200, "application/json", json.dumps({ "local_url" : cameraUrl, "product_name" : "Mock camera" }).encode("utf-8")
+        if command == lnetatmo._PRES_CDE_GET_SNAP : return 200, "image/jpeg", _JPEG
+        if command.startswith("/command/changestatus") : return 200, "application/json", b'{"status": "ok"}'
+        if command == lnetatmo._PRES_CDE_GET_LIGHT : return 200, "application/json", b'{"mode": "auto"}'
+        return _error(404, 404, "Unknown command")
+
+
+def _value(mtype, t, salt):
+    phase = 2 * math.pi * (t % 86400) / 86400
+    if mtype in ("Temperature", "min_temp", "max_temp") : return round(15 + 5 * math.sin(phase) + salt % 7, 1)
+    if mtype == "Humidity" : return int(60 + 20 * math.cos(phase))
+    if mtype == "CO2" : return 500 + (t // 300 + salt) % 400
+    if mtype == "Pressure" : return round(1010 + 5 * math.sin(phase / 3), 1)
+    if mtype == "Noise" : return 35 + (t // 300) % 10
+    if mtype == "Rain" : return round(((t // 3600) % 5) * 0.101, 3)
+    return (t // 300 + salt) % 100
+
+def _ok(body):
+    data = { "status" : "ok", "body" : body, "time_server" : int(time.time()) }
+    return 200, "application/json", json.dumps(data).encode("utf-8")
+
+def _error(status, code, message):
+    return status, "application/json", json.dumps({ "error" : { "code" : code, "message" : message } }).encode("utf-8")
+
+def _handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            parts = urllib.parse.urlsplit(self.path)
+            params = dict(urllib.parse.parse_qsl(parts.query))
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                params.update(urllib.parse.parse_qsl(self.rfile.read(length).decode("utf-8")))
+            redirect = mock._redirects.get(parts.path.strip("/"))
+            if redirect:
+                self.send_response(redirect[0])
+                self.send_header("Location", redirect[1])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status, contentType, body = mock._answer(parts.path.strip("/"), params)
+            self.send_response(status)
+            self.send_header("Content-Type", contentType)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+class _LocalTransport:
+    """
+    Transport sending the requests for the Netatmo API to a local server, others unchanged
+    """
+    def __init__(self, url):
+        self.url = url
+        self.pool = lnetatmo.ConnectionPool()
+
+    def urlopen(self, url, body=None, headers=None, timeout=10):
+        if url.startswith(lnetatmo._BASE_URL):
+            url = self.url + url[len(lnetatmo._BASE_URL):].lstrip("/")
+        return self.pool.urlopen(url, body, headers, timeout=timeout)
+
+
+def benchmarkPool(requests=200):
+    """
+    Requests per second to getstationsdata over https, opening a connection for each request with
+    urllib (as lnetatmo used to) and reusing them with lnetatmo.ConnectionPool : (urllib, pool).
+    None if no certificate can be made (openssl command missing)
+    """
+    directory = tempfile.mkdtemp()
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    try:
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-keyout", key,
+                        "-out", cert, "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1"],
+                       capture_output=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        shutil.rmtree(directory)
+        return None
+    import urllib.request
+    server = MockNetatmoServer(certfile=cert, keyfile=key).start()
+    context = ssl.create_default_context(cafile=cert)
+    url = server.url + "api/getstationsdata"
+    body = urllib.parse.urlencode({ "access_token" : server.accessToken() }).encode("utf-8")
+    headers = { "Content-Type" : "application/x-www-form-urlencoded;charset=utf-8" }
+    pool = lnetatmo.ConnectionPool(context=context)
+
+    def viaUrllib():
+        with urllib.request.urlopen(urllib.request.Request(url, body, headers), context=context) as resp:
+            resp.read()
+    def viaPool():
+        resp = pool.urlopen(url, body, headers)
+        lnetatmo.readBody(resp)
+        resp.close()
+
+    try:
+        return tuple(requests / timeit.timeit(f, number=requests) for f in (viaUrllib, viaPool))
+    finally:
+        pool.clear()
+        server.stop()
+        shutil.rmtree(directory)
+
+
+def benchmarkBody(sizes=(100 * 1024, 1024 * 1024, 10 * 1024 * 1024), number=5):
+    """
+    Read image bodies of the given sizes : { size : ((concatenation, readBody, streamBody) time in
+    milliseconds, (concatenation, readBody, streamBody) peak memory in bytes) }, concatenation being
+    how lnetatmo used to read bodies and streamBody writing to a file
+    """
+    def response(payload):
+        return lnetatmo.BufferedResponse(200, "OK", { "Content-Type" : "image/jpeg" }, payload)
+    def concatenation(payload):
+        resp = response(payload)
+        data = b""
+        for buff in iter(lambda: resp.read(65535), b''): data += buff
+        return data
+    def readBody(payload):
+        return lnetatmo.readBody(response(payload))
+    def streamBody(payload):
+        with open(os.devnull, "wb") as sink:
+            return lnetatmo.streamBody(response(payload), sink)
+
+    results = dict()
+    for size in sizes:
+        payload = os.urandom(size)
+        timings = tuple(timeit.timeit(lambda: f(payload), number=number) * 1e3 / number
+                        for f in (concatenation, readBody, streamBody))
+        memory = []
+        for f in (concatenation, readBody, streamBody):
+            tracemalloc.start()
+            f(payload)
+            memory.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        results[size] = (timings, tuple(memory))
+    return results
+
+
+def benchmarkLookups(stations=250, cameras=100, number=20000):
+    """
+    Time the station, module and camera lookups of lnetatmo against linear scans of the same data.
+    250 stations hold 1000 modules. Return { lookup : (indexed, linear) } in microseconds per call
+    """
+    server = MockNetatmoServer(stations=stations, cameras=cameras).start()
+    lnetatmo.setTransport(server.transport())
+    try:
+        authorization = lnetatmo.ClientAuth("id", "secret", "user", "password")
+        weather = lnetatmo.WeatherStationData(authorization, useCache=False)
+        homes = lnetatmo.HomeData(authorization)
+        authorization.close()
+    finally:
+        lnetatmo.setTransport()
+        server.stop()
+    last = weather.rawData[-1]
+    station, module = last["station_name"], last["modules"][-1]
+    camera = homes.rawData["homes"][0]["cameras"][-1]
+
+    def scanModuleByName():
+        for s in weather.rawData:
+            if s["station_name"] == station:
+                for m in s["modules"]:
+                    if m["module_name"] == module["module_name"] : return m
+    def scanModuleById():
+        for s in weather.rawData:
+            for m in s["modules"]:
+                if m["_id"] == module["_id"] : return m
+    def scanCameraByName():
+        for h in homes.cameras.values():
+            for c in h.values():
+                if c["name"] == camera["name"] : return c
+
+    cases = { "stationByName" : (lambda: weather.stationByName(station),
+                                 lambda: [s for s in weather.rawData if s["station_name"] == station][0]),
+              "stationById" : (lambda: weather.stationById(last["_id"]),
+                               lambda: [s for s in weather.rawData if s["_id"] == last["_id"]][0]),
+              "moduleByName" : (lambda: weather.moduleByName(module["module_name"], station), scanModuleByName),
+              "moduleById" : (lambda: weather.moduleById(module["_id"]), scanModuleById),
+              "modulesByType" : (lambda: weather.modulesByType("NAModule3"),
+                                 lambda: [m for s in weather.rawData for m in s["modules"] if m["type"] == "NAModule3"]),
+              "cameraByName" : (lambda: homes.cameraByName(camera["name"]), scanCameraByName),
+              "cameraById" : (lambda: homes.cameraById(camera["id"]),
+                              lambda: [c for h in homes.cameras.values() for c in h.values() if c["id"] == camera["id"]][0]) }
+    results = dict()
+    for name, (indexed, linear) in cases.items():
+        assert indexed() == linear() or name == "modulesByType"
+        results[name] = tuple(timeit.timeit(f, number=number) * 1e6 / number for f in (indexed, linear))
+    return results
+
+
+def benchmarkRecords(stations=250, number=20):
+    """
+    Compare the lastDataById dictionaries with the ModuleRecord of the same modules (1000 modules and
+    their 250 stations by default) : { "memory" : (records, dicts) in bytes, "read" : (records, dicts) in
+    microseconds to read the fields of all the modules the way the node server does }
+    """
+    server = MockNetatmoServer(stations=stations)
+    devices = json.loads(json.dumps(server.devices))
+    modules = [ (d, d) for d in devices ] + [ (m, d) for d in devices for m in d["modules"] ]
+    fields = dict( (t, ("When", "battery_percent", "rf_status", "wifi_status") + c._MEASURES)
+                   for t,c in lnetatmo._RECORD_TYPES.items() )
+
+    def dicts():
+        res = dict()
+        for m, s in modules:
+            data = dict(m["dashboard_data"], module_name=m["module_name"], type=m["type"], station_id=s["_id"],
+                        home_name=s["home_name"])
+            for f in ("battery_percent", "battery_vp", "rf_status", "wifi_status") :
+                if f in m : data[f] = m[f]
+            res[m["_id"]] = data
+        return res
+    def records():
+        return dict( (m["_id"], lnetatmo.moduleRecord(m, s)) for m, s in modules )
+    def readDicts(data):
+        for d in data.values():
+            for f in fields[d["type"]]:
+                try:
+                    v = d[f]
+                except KeyError:
+                    v = None
+    def readRecords(data):
+        for r in data.values():
+            for f in fields[r.type]:
+                v = getattr(r, f)
+
+    results = dict()
+    memory = []
+    for build in (records, dicts):
+        tracemalloc.start()
+        data = build()
+        memory.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+    results["memory"] = tuple(memory)
+    data = (records(), dicts())
+    results["read"] = tuple(timeit.timeit(lambda: read(d), number=number) * 1e6 / number
+                            for read, d in zip((readRecords, readDicts), data))
+    server._server.server_close()
+    return results
+
+
+def benchmarkJson(stations=250, cameras=100, number=20):
+    """
+    Decode a getstationsdata answer of stations stations and a gethomedata answer of cameras cameras :
+    { request : ((json, fast) decoding time in microseconds, (full, projected) bytes kept in memory) },
+    fast being orjson when installed (json otherwise)
+    """
+    server = MockNetatmoServer(stations=stations, cameras=cameras)
+    user = { "mail" : "user@example.com", "administrative" : { "unit" : 0 } }
+    payloads = { lnetatmo._GETSTATIONDATA_REQ : _ok({ "devices" : server.devices, "user" : user })[2],
+                 lnetatmo._GETHOMEDATA_REQ : _ok({ "homes" : server.homes })[2] }
+    results = dict()
+    try:
+        for url, data in payloads.items():
+            timings = []
+            for fast in (False, True):
+                lnetatmo.configureJson(projection=False, fast=fast)
+                lnetatmo._decodeJson(url, data)
+                timings.append(timeit.timeit(lambda: lnetatmo._decodeJson(url, data), number=number) * 1e6 / number)
+            memory = []
+            for projection in (False, True):
+                lnetatmo.configureJson(projection=projection)
+                tracemalloc.start()
+                resp = lnetatmo._decodeJson(url, data)
+                memory.append(tracemalloc.get_traced_memory()[0])
+                tracemalloc.stop()
+                del resp
+            results[url.rsplit("/", 1)[1]] = (tuple(timings), tuple(memory))
+    finally:
+        lnetatmo.configureJson(projection=False, fast=True)
+        server._server.server_close()
+    return results
+
+
+def benchmarkEvents(cameras=10, events=20000, batch=10):
+    """
+    Merge events arriving by batches on cameras cameras the way updateEvent does : { "merge" : (index, dicts)
+    in microseconds per batch, "kept" : (index, dicts) events in memory at the end }, dicts being the former
+    { camera : { time : event } } re-sorted after each batch
+    """
+    start = int(time.time()) - events * 30
+    stream = [ { "id" : "event-%d" % n, "camera_id" : "camera-%d" % (n % cameras), "time" : start + n * 30,
+                 "type" : ("person", "movement")[n % 2] } for n in range(events) ]
+    batches = [ stream[i:i + batch] for i in range(0, events, batch) ]
+
+    def dicts():
+        events, last = dict(), dict()
+        for b in batches:
+            for e in b:
+                events.setdefault(e["camera_id"], dict())[e["time"]] = e
+            for camera in events:
+                last[camera] = events[camera][sorted(events[camera])[-1]]
+        return events
+    def index():
+        home = lnetatmo.HomeData.__new__(lnetatmo.HomeData)
+        home.events, home.lastEvent = dict(), dict()
+        for b in batches:
+            home._mergeEvents(b)
+        return home.events
+
+    results = dict()
+    results["merge"] = tuple(timeit.timeit(f, number=1) * 1e6 / len(batches) for f in (index, dicts))
+    results["kept"] = tuple(sum(len(e) for e in f().values()) for f in (index, dicts))
+    return results
+
+
+def benchmarkImport(runs=5):
+    """
+    Median time to import lnetatmo in a new interpreter, in microseconds (python -X importtime),
+    and the modules it loaded that are only needed on demand
+    """
+    lazy = ("imghdr", "platform", "urllib.request")
+    code = "import sys, lnetatmo; print(','.join(m for m in %r if m in sys.modules))" % (lazy,)
+    times = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(lnetatmo.__file__)))
+        line = [l for l in proc.stderr.splitlines() if l.endswith("| lnetatmo")][0]
+        times.append(int(line.split("|")[1]))
+    return sorted(times)[runs // 2], [m for m in proc.stdout.strip().split(",") if m]
+
+
+if __name__ == "__main__":
+
+    from sys import argv
+
+    if argv[1:] == ["bench"]:
+        results = benchmarkPool()
+        if results : print("%-14s %8.0f req/s urllib %7.0f req/s pool" % (("https",) + results))
+        for size, (timings, memory) in benchmarkBody().items():
+            print("%-14s %8.1f ms concatenation %5.1f ms readBody %5.1f ms streamBody" % (("body %d kB" % (size // 1024),) + timings))
+            print("%-14s %8d B concatenation %6d B readBody %6d B streamBody" % (("",) + memory))
+        for name, (indexed, linear) in benchmarkLookups().items():
+            print("%-14s %8.2f us indexed %10.2f us linear scan" % (name, indexed, linear))
+        us, loaded = benchmarkImport()
+        print("%-14s %8d us %s" % ("import", us, "loading " + ", ".join(loaded) if loaded else ""))
+        results = benchmarkRecords()
+        print("%-14s %8d B records %11d B dicts" % (("memory",) + results["memory"]))
+        print("%-14s %8d us records %10d us dicts" % (("read",) + results["read"]))
+        for name, ((slow, fast), (full, projected)) in benchmarkJson().items():
+            print("%-18s %8d us json %13d us fast path" % (name, slow, fast))
+            print("%-18s %8d B full %14d B projected" % (name, full, projected))
+        results = benchmarkEvents()
+        print("%-14s %8.1f us index %11.1f us dicts" % (("events merge",) + results["merge"]))
+        print("%-14s %8d index %14d dicts" % (("events kept",) + results["kept"]))
+        raise SystemExit(0)
+
+    server = MockNetatmoServer(port=int(argv[1]) if len(argv) > 1 else 8080)
+    print("Mock Netatmo API listening on %s" % server.url)
+    server._server.serve_forever()
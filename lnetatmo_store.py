@@ -0,0 +1,169 @@
+"""
+Local SQLite store of the weather stations measures history
+
+The store is synchronized incrementally with getmeasure (only points newer than the last stored
+timestamp of each module are requested) and answers range, min/max and aggregate queries locally,
+including when the Netatmo API is not reachable.
+
+    store = MeasureStore("netatmo_history.db")
+    store.sync(lnetatmo.WeatherStationData(authorization))
+    store.minMax(moduleId, "Temperature", begin=time.time() - 24*3600)
+    store.close()
+
+A WeatherStationData built with a store synchronizes it by itself and answers getMeasure, MinMaxTH
+and allMinMaxTH from it when it covers the request.
+"""
+
+import sqlite3
+import threading
+import time
+from array import array
+
+import lnetatmo
+from lnetatmo import logger
+
+# Seconds of history fetched for a module never synchronized before
+_HISTORY = 7 * 24 * 3600
+
+# Values written to the database per transaction during a sync
+_BATCH = 10000
+
+# SQL functions allowed by aggregate
+_AGGREGATES = ("avg", "min", "max", "sum", "count")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS measures (
+    module TEXT NOT NULL,
+    type TEXT NOT NULL,
+    scale TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (module, type, scale, time)
+) WITHOUT ROWID
+"""
+
+
+class MeasureStore:
+    """
+    Measures of the stations and modules, by module id (the station id for its main module),
+    measure type and getmeasure scale
+
+    Args:
+        path (str): SQLite database file, ":memory:" for a store lost when closed
+        history (int): Seconds of history fetched for a module never synchronized before
+    """
+    def __init__(self, path=":memory:", history=_HISTORY):
+        self.history = history
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def sync(self, weatherStation, station=None, scale="max", workers=lnetatmo._MEASURE_WORKERS,
+             priority=lnetatmo.PRIORITY_BACKFILL):
+        """
+        Fetch the measures of a station (default station if None) and of its modules newer than the
+        last ones stored, concurrently (see WeatherStationData.iterMeasures). Return the number of values stored
+        """
+        queries = weatherStation.measureQueries(station, scale)
+        start = time.time() - self.history
+        for q in queries:
+            last = self.last(q.get('module_id') or q['device_id'], q['mtype'].split(","), scale)
+            q['date_begin'] = int(last + 1 if last is not None else start)
+            # From the API, even if the store is the one of weatherStation
+            q['useStore'] = False
+
+        count = 0
+        rows = []
+        try:
+            for index, t, values in weatherStation.iterMeasures(queries, workers, priority):
+                q = queries[index]
+                module = q.get('module_id') or q['device_id']
+                for mtype, v in zip(q['mtype'].split(","), values):
+                    # Skip missing values (NaN)
+                    if v == v : rows.append((module, mtype, scale, t, v))
+                if len(rows) >= _BATCH:
+                    count += self._insert(rows)
+                    rows = []
+        finally:
+            # Keep what was fetched before a failure, the next sync resumes from there
+            count += self._insert(rows)
+        logger.debug("Stored %d measures of station %s", count, station or weatherStation.default_station)
+        return count
+
+    def _insert(self, rows):
+        # Rows are written by batches, the lock is not held while waiting for the API
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR REPLACE INTO measures VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+            return self._db.total_changes - before
+
+    def last(self, module, mtype=None, scale="max"):
+        """
+        Return the timestamp of the last value stored for a module, of all types given (name or list), None if none
+        """
+        types = [mtype] if isinstance(mtype, str) else mtype
+        with self._lock:
+            rows = self._db.execute("SELECT type, MAX(time) FROM measures WHERE module = ? AND scale = ? GROUP BY type",
+                                    (module, scale)).fetchall()
+        last = dict(rows)
+        if types : last = [last.get(t) for t in types]
+        else : last = list(last.values())
+        return None if not last or None in last else min(last)
+
+    def measures(self, module, mtype, begin=None, end=None, scale="max"):
+        """
+        Return the values of a measure type between begin and end (included) as columns :
+        (timestamps, values) arrays, like lnetatmo.measureColumns
+        """
+        times = array(lnetatmo._TIME_TYPECODE)
+        values = array("d")
+        for t, v in self._select("time, value", module, mtype, begin, end, scale, "ORDER BY time"):
+            times.append(t)
+            values.append(v)
+        return times, values
+
+    def minMax(self, module, mtype, begin=None, end=None, scale="max"):
+        """
+        Return (min, max) of a measure type between begin and end (included), None without values
+        """
+        res = self._select("MIN(value), MAX(value)", module, mtype, begin, end, scale)[0]
+        return None if res[0] is None else res
+
+    def aggregate(self, module, mtype, step, begin=None, end=None, scale="max", func="avg"):
+        """
+        Return [(period start, value)] of a measure type aggregated by periods of step seconds,
+        func being one of avg, min, max, sum or count
+        """
+        if func not in _AGGREGATES : raise ValueError("Unsupported aggregate %s" % func)
+        step = int(step)
+        return self._select("time - time %% %d AS period, %s(value)" % (step, func.upper()),
+                            module, mtype, begin, end, scale, "GROUP BY period ORDER BY period")
+
+    def prune(self, before):
+        """
+        Remove the values older than the before timestamp, return their number
+        """
+        with self._lock:
+            count = self._db.execute("DELETE FROM measures WHERE time < ?", (int(before),)).rowcount
+            self._db.commit()
+        return count
+
+    def _select(self, columns, module, mtype, begin, end, scale, suffix=""):
+        sql = "SELECT %s FROM measures WHERE module = ? AND type = ? AND scale = ?" % columns
+        params = [module, mtype, scale]
+        if begin is not None:
+            sql += " AND time >= ?"
+            params.append(int(begin))
+        if end is not None:
+            sql += " AND time <= ?"
+            params.append(int(end))
+        with self._lock:
+            return self._db.execute(sql + " " + suffix, params).fetchall()
@@ -15,6 +15,15 @@ import lnetatmo
 
 LOGGER = udi_interface.LOGGER
 
+# Netatmo tokens are kept between restarts to skip the password authentication
+TOKEN_CACHE = 'netatmo_tokens.json'
+
+# Modules without new measure for this many seconds are reported offline (Netatmo uploads every 10 minutes)
+STALE_DELAY = 3600
+
+# Seconds between two checks of the homes events (arrivals and departures)
+EVENTS_INTERVAL = 60
+
 def round_half_up(num, decimals = 0):
     temp_dec = 10 ** decimals
     result = num * temp_dec
@@ -24,6 +33,8 @@ def round_half_up(num, decimals = 0):
     return result
 
 def get_temperature(temp_value):
+    if temp_value is None:
+        return None
     try:
         temp_value = temp_value / 5
         temp_value = temp_value * 9
@@ -35,6 +46,8 @@ def get_temperature(temp_value):
     return 0
 
 def get_pressure(pressure_value):
+    if pressure_value is None:
+        return None
     try:
         pressure_value = pressure_value * 0.02953
         pressure_value = round_half_up(pressure_value,2)
@@ -43,6 +56,29 @@ def get_pressure(pressure_value):
         LOGGER.info('Failed to convert temperature')
     return 0
 
+def get_trend(trend):
+    # stable: 0, up: 1, down: 2
+    if trend is None:
+        return None
+    return {'stable': 0, 'up': 1}.get(trend, 2)
+
+def get_when(when):
+    if when is None:
+        return None
+    return when / 10
+
+def set_drivers(node, drivers, force):
+    # Fields not reported by Netatmo are None and leave their driver unchanged
+    for driver, value in drivers:
+        if value is not None:
+            node.setDriver(driver, value, report=True, force=force)
+
+def module_record(node):
+    # Last data record of the module of a node, None if not available
+    if node.lastData is None:
+        return None
+    return node.lastData.get(node.moduleId)
+
 
 class Controller(udi_interface.Node):
     id = 'Netatmo'
@@ -60,6 +96,10 @@ class Controller(udi_interface.Node):
         self.session = None
         self.weatherStation = None
         self.lastData = None
+        self.cursor = 0
+        self.homeData = None
+        self.eventSync = None
+        self.cameraHomes = []
 
         polyglot.subscribe(polyglot.START, self.start, address)
         polyglot.subscribe(polyglot.CUSTOMPARAMS, self.parameterHandler)
@@ -95,7 +135,7 @@ class Controller(udi_interface.Node):
 
         if self.username != '' and self.password != '' and self.clientId != '' and self.clientSecret != '':
             self.configured = True
-            self.session = lnetatmo.ClientAuth(clientId=self.clientId, clientSecret=self.clientSecret, username=self.username, password=self.password)
+            self.open_session()
             self.discover()
 
     def start(self):
@@ -110,10 +150,17 @@ class Controller(udi_interface.Node):
         #self.discover()
         LOGGER.info('Node server started')
 
+    def open_session(self):
+        if self.session:
+            self.session.close()
+        self.session = None
+        self.session = lnetatmo.ClientAuth(clientId=self.clientId, clientSecret=self.clientSecret, username=self.username, password=self.password, tokenCache=TOKEN_CACHE)
+
     def connect(self):
         try:
-            self.session = lnetatmo.ClientAuth(clientId=self.clientId, clientSecret=self.clientSecret, username=self.username, password=self.password)
+            self.open_session()
             self.weatherStation = lnetatmo.WeatherStationData(self.session)
+            self.cursor = 0
             return True
         except Exception as e:
             LOGGER.error('Unable to connect to Netatmo severs:: {}'.format(str(e)))
@@ -124,19 +171,64 @@ class Controller(udi_interface.Node):
             return
 
         if 'shortPoll' in polltype:
-            try:
+            self.update_weather(False)
+
+    def update_weather(self, force):
+        changes = None
+        try:
+            if self.weatherStation is None:
                 self.weatherStation = lnetatmo.WeatherStationData(self.session)
-            except:
-                LOGGER.info('Authentication from library failed.')
-                if not self.connect():
-                    return
-
-            self.lastData = self.weatherStation.lastData()
-            for node in self.poly.nodes():
-                if node.id != 'Netatmo':
-                    node.weatherStation = self.weatherStation
-                    node.lastData = self.lastData
-                    node.get_status(False)
+                self.cursor = 0
+            else:
+                changes = self.weatherStation.refresh()
+        except lnetatmo.AuthFailure:
+            # Expired tokens are renewed by the library, only a rejected refresh needs a new login
+            LOGGER.info('Authentication from library failed.')
+            if not self.connect():
+                return
+        except Exception as e:
+            # Server errors are retried (and cached data served) by the library, try again next poll
+            LOGGER.error('Unable to get weather station data: {}'.format(e))
+            self.update_usage()
+            return
+
+        if changes is not None:
+            if changes.added or changes.removed:
+                LOGGER.info('Modules changed: {}'.format(changes))
+                self.remove_module_nodes(changes.removed)
+                self.discover()
+                return
+            if not changes and not force:
+                LOGGER.debug('No new data from Netatmo')
+                self.update_online()
+                self.update_usage()
+                return
+
+        # Only the modules with new data since the last poll are sent to their node
+        changed, self.cursor = self.weatherStation.recordChanges(0 if force else self.cursor)
+        if self.lastData is None:
+            self.lastData = dict()
+        self.lastData.update(changed)
+        for node in self.poly.nodes():
+            if node.id != 'Netatmo' and node.moduleId in changed:
+                node.weatherStation = self.weatherStation
+                node.lastData = self.lastData
+                node.get_status(force)
+        self.update_online()
+        self.update_usage()
+
+    def update_online(self):
+        # Online flag of each module node and number of modules that stopped reporting
+        stale = set(self.weatherStation.staleModules(STALE_DELAY))
+        self.setDriver('GV2', len(stale), report=True)
+        for node in self.poly.nodes():
+            if node.id != 'Netatmo' and node.moduleId:
+                node.setDriver('ST', 0 if node.moduleId in stale else 1, report=True)
+
+    def update_usage(self):
+        # Netatmo API requests of the account sent during the current rate limit windows
+        self.setDriver('GV0', lnetatmo.requestsUsed(10, self.session), report=True)
+        self.setDriver('GV1', lnetatmo.requestsUsed(3600, self.session), report=True)
 
     def query(self):
         LOGGER.info('QUERY Controller')
@@ -152,42 +244,25 @@ class Controller(udi_interface.Node):
             return
 
         try:
-            self.weatherStation = lnetatmo.WeatherStationData(self.session)
-            self.lastData = self.weatherStation.lastData()
-            LOGGER.info('Weather Station Name = ' + self.weatherStation.default_home)
-            i = 0
-            nodeAddress = ''
-            for moduleName in self.lastData.keys():
+            self.weatherStation = lnetatmo.WeatherStationData(self.session, priority=lnetatmo.PRIORITY_DISCOVERY)
+            self.lastData, self.cursor = self.weatherStation.recordChanges()
+            homes = set(m.home_name for m in self.lastData.values())
+            LOGGER.info('Weather Station homes = ' + ', '.join(sorted(homes)))
+            self.remove_legacy_nodes()
+            for moduleId, module in self.lastData.items():
+                moduleName = module.module_name
                 LOGGER.info('Module name = ' + moduleName)
-                if 'Noise' in self.lastData[moduleName]:
-                    #Master Module
-                    nodeAddress = 'netwsmain'
-                    weatherStation_node = mainModuleNode(self.poly, self.address, nodeAddress,moduleName)
-                    LOGGER.info('Master Module')
-                elif 'CO2' in self.lastData[moduleName]:
-                    #Indoor Module
-                    nodeAddress = 'netwsin' + str(i)
-                    weatherStation_node = indoorModuleNode(self.poly, self.address, nodeAddress,moduleName)
-                    LOGGER.info('Indoor Module')
-                    i = i + 1
-                elif 'Temperature' in self.lastData[moduleName]:
-                    #Outside Module
-                    nodeAddress = 'netwsout'
-                    weatherStation_node = outdoorModuleNode(self.poly, self.address, nodeAddress,moduleName)
-                    LOGGER.info('Outside Module')
-                elif 'WindStrength' in self.lastData[moduleName]:
-                    #Wind Module
-                    nodeAddress = 'netwswind'
-                    weatherStation_node = windModuleNode(self.poly, self.address, nodeAddress,moduleName)
-                    LOGGER.info('Wind Module')
-                elif 'Rain' in self.lastData[moduleName]:
-                    #Rain Module
-                    nodeAddress = 'netwsrain'
-                    weatherStation_node = rainModuleNode(self.poly, self.address, nodeAddress,moduleName)
-                    LOGGER.info('Rain Module')
-                else:
+                if module.type not in MODULE_NODES:
                     LOGGER.info('Unidentified Module')
-
+                    continue
+                # Module MAC ids are unique across stations and homes, names are not
+                nodeAddress = moduleId.replace(':', '').lower()
+                if len(homes) > 1:
+                    moduleName = module.home_name + ' ' + moduleName
+                weatherStation_node = MODULE_NODES[module.type](self.poly, self.address, nodeAddress, moduleName)
+                LOGGER.info('{} module {}'.format(module.type, nodeAddress))
+
+                weatherStation_node.moduleId = moduleId
                 weatherStation_node.lastData = self.lastData
                 weatherStation_node.name = moduleName
                 self.poly.addNode(weatherStation_node)
@@ -195,7 +270,57 @@ class Controller(udi_interface.Node):
 
         except Exception as e:
             LOGGER.error('Authentication failed or no modules found. {}'.format(e))
-            
+
+        self.connect_homes()
+
+    def connect_homes(self):
+        # Homes with cameras report their occupancy, kept up to date by the events
+        if self.eventSync:
+            self.eventSync.stop()
+        self.eventSync = None
+        self.homeData = None
+        try:
+            self.homeData = lnetatmo.HomeData(self.session)
+        except lnetatmo.NoDevice:
+            LOGGER.info('No Netatmo home with cameras, occupancy not reported')
+            return
+        except Exception as e:
+            LOGGER.error('Unable to get home data: {}'.format(e))
+            return
+        # Homes without cameras have no events, they would only cost a gethomedata every round
+        self.cameraHomes = self.homeData.homesWithCameras()
+        self.update_occupancy()
+        self.eventSync = lnetatmo.EventSync(self.homeData, interval=EVENTS_INTERVAL, homes=self.cameraHomes)
+        self.eventSync.subscribe(self.on_events)
+        self.eventSync.start()
+
+    def on_events(self, homeId, events):
+        LOGGER.debug('{} new events in home {}'.format(len(events), homeId))
+        self.update_occupancy()
+
+    def update_occupancy(self):
+        # Known persons at home, over all the homes with cameras
+        count = sum(self.homeData.occupancy(home) for home in self.cameraHomes)
+        self.setDriver('GV3', count, report=True)
+
+    def remove_module_nodes(self, moduleIds):
+        # Nodes of the modules (or stations) no longer reported by Netatmo
+        for moduleId in moduleIds:
+            nodeAddress = moduleId.replace(':', '').lower()
+            if self.poly.getNode(nodeAddress) is not None:
+                LOGGER.info('Removing node {} of removed module {}'.format(nodeAddress, moduleId))
+                self.poly.delNode(nodeAddress)
+
+    def remove_legacy_nodes(self):
+        # Nodes used to be addressed by module kind (netwsmain, netwsout...), which
+        # only worked for a single station
+        try:
+            for node in self.poly.getNodesFromDb():
+                if node['address'].startswith('netws'):
+                    LOGGER.info('Removing legacy node ' + node['address'])
+                    self.poly.delNode(node['address'])
+        except Exception as e:
+            LOGGER.debug('Legacy nodes cleanup failed: {}'.format(e))
 
     # Delete the node server from Polyglot
     def delete(self):
@@ -203,14 +328,21 @@ class Controller(udi_interface.Node):
 
     def stop(self):
         LOGGER.info('Stopping node server')
+        if self.eventSync:
+            self.eventSync.stop()
         try:
-            self.session.logout()
+            self.session.close()
         except:
-            LOGGER.debug('session logout failed')
+            LOGGER.debug('session close failed')
+        lnetatmo.closeConnections()
 
     def query_all(self, command):
         LOGGER.info('Query All')
-        self.shortPoll()
+        # Explicit user request: don't serve the cached station data
+        if self.session:
+            self.session.cache.invalidate()
+        if self.configured:
+            self.update_weather(True)
 
     commands = {
             'DISCOVER': discover,
@@ -219,11 +351,16 @@ class Controller(udi_interface.Node):
 
     drivers = [
             {'driver': 'ST', 'value': 1, 'uom': 2},   # node server status
+            {'driver': 'GV0', 'value': 0, 'uom': 56},   # API requests last 10 seconds
+            {'driver': 'GV1', 'value': 0, 'uom': 56},   # API requests last hour
+            {'driver': 'GV2', 'value': 0, 'uom': 56},   # stale modules
+            {'driver': 'GV3', 'value': 0, 'uom': 56},   # known persons at home
             ]
 
 class mainModuleNode(udi_interface.Node):
     id = 'main_netatmo'
     name = ''
+    moduleId = None
     lastData = None
     drivers = [
             {'driver': 'ST', 'value': 0, 'uom': 2},   # status
@@ -241,93 +378,34 @@ class mainModuleNode(udi_interface.Node):
             {'driver': 'GV11', 'value': 0, 'uom': 56},   # wifi status
             ]
 
-    def temp_trend(self, json):
-        try:
-            nodeStat = json['temp_trend']
-            if nodeStat == 'stable':
-                return 0
-            elif nodeStat == 'up':
-                return 1
-            else:
-                return 2
-        except:
-            LOGGER.info('failed to parse mower status type.')
-        return 99
-
-    def pressure_trend(self, json):
-        try:
-            nodeStat = json['pressure_trend']
-            if nodeStat == 'stable':
-                return 0
-            elif nodeStat == 'up':
-                return 1
-            else:
-                return 2
-        except:
-            LOGGER.info('failed to parse mower status type.')
-        return 99
-
     def get_status(self, first):
         LOGGER.info('GET STATUS Main Module')
-        try:
-            LOGGER.info('Get Staus - MainModule 1')
-            json = self.lastData[self.name]
-            LOGGER.debug(json)
-
-            n_tempTrend = self.temp_trend(json)
-            n_pressureTrend = self.pressure_trend(json)
-            n_temperature = json['Temperature']
-            n_temperature = get_temperature(n_temperature)
-            n_minTemp = json['min_temp']
-            n_minTemp = get_temperature(n_minTemp)
-            n_maxTemp = json['max_temp']
-            n_maxTemp = get_temperature(n_maxTemp)
-            n_pressure = json['Pressure']
-            n_pressure = get_pressure(n_pressure)
-            n_absolutePressure = json['AbsolutePressure']
-            n_absolutePressure = get_pressure(n_absolutePressure)
-            try:
-                n_status = 1
-                n_CO2 = json['CO2']
-                n_humidity = json['Humidity']
-                n_noise = json['Noise']
-                n_when = json['When']
-                n_when = n_when / 10
-                n_wifiStatus = json['wifi_status']
-                LOGGER.info('GET STATUS - TRY All')
-
-                try:
-                    LOGGER.info('Writting Drivers - START')
-                    self.setDriver('ST', n_status, report=True, force=first)
-                    LOGGER.info('Temperature :')
-                    LOGGER.info(n_temperature)
-                    self.setDriver('GV0', n_temperature, report=True, force=first)
-                    self.setDriver('GV1', n_CO2, report=True, force=first)
-                    self.setDriver('GV2', n_humidity, report=True, force=first)
-                    self.setDriver('GV3', n_noise, report=True, force=first)
-                    self.setDriver('GV4', n_pressure, report=True, force=first)
-                    self.setDriver('GV5', n_absolutePressure, report=True, force=first)
-                    self.setDriver('GV6', n_minTemp, report=True, force=first)
-                    self.setDriver('GV7', n_maxTemp, report=True, force=first)
-                    self.setDriver('GV8', n_tempTrend, report=True, force=first)
-                    self.setDriver('GV9', n_pressureTrend, report=True, force=first)
-                    self.setDriver('GV10', n_when, report=True, force=first)
-                    self.setDriver('GV11', n_wifiStatus, report=True, force=first)
-                    LOGGER.info('Writting Drivers - END')
-                except:
-                    LOGGER.error('Failed to update node status')
-            except:
-                LOGGER.error('Failed to parse mower status JSON')
-
-        except Exception as ex:
-            LOGGER.info('In exception handler, no data for this node')
-            LOGGER.debug('Skipping status: ' + str(ex.args[0]))
+        data = module_record(self)
+        if data is None:
+            LOGGER.info('No data for this node')
             return False
+        LOGGER.debug(data)
+        set_drivers(self, [
+            ('ST', 1),
+            ('GV0', get_temperature(data.Temperature)),
+            ('GV1', data.CO2),
+            ('GV2', data.Humidity),
+            ('GV3', data.Noise),
+            ('GV4', get_pressure(data.Pressure)),
+            ('GV5', get_pressure(data.AbsolutePressure)),
+            ('GV6', get_temperature(data.min_temp)),
+            ('GV7', get_temperature(data.max_temp)),
+            ('GV8', get_trend(data.temp_trend)),
+            ('GV9', get_trend(data.pressure_trend)),
+            ('GV10', get_when(data.When)),
+            ('GV11', data.wifi_status),
+            ], first)
         return True
 
 class indoorModuleNode(udi_interface.Node):
     id = 'in_netatmo'
     name = ''
+    moduleId = None
     lastData = None
     drivers = [
             {'driver': 'ST', 'value': 0, 'uom': 2},   # status
@@ -342,67 +420,31 @@ class indoorModuleNode(udi_interface.Node):
             {'driver': 'GV8', 'value': 0, 'uom': 56},   # rf status
             ]
 
-    def temp_trend(self, json):
-        try:
-            name = json['temp_trend']
-            if name == 'stable':
-                return 0
-            elif name == 'up':
-                return 1
-            else:
-                return 2
-        except:
-            LOGGER.info('failed to parse mower status type.')
-        return 99
-
     def get_status(self, first):
         LOGGER.info('GET STATUS Indoor Module')
-        try:
-            json = self.lastData[self.name]
-            LOGGER.debug(json)
-
-            n_tempTrend = self.temp_trend(json)
-            n_temperature = json['Temperature']
-            n_temperature = get_temperature(n_temperature)
-            n_minTemp = json['min_temp']
-            n_minTemp = get_temperature(n_minTemp)
-            n_maxTemp = json['max_temp']
-            n_maxTemp = get_temperature(n_maxTemp)
-
-            try:
-                n_status = 1
-                n_CO2 = json['CO2']
-                n_humidity = json['Humidity']
-                n_when = json['When']
-                n_when = n_when / 10
-                n_batteryPercent = json['battery_percent']
-                n_rfStatus = json['rf_status']
-
-                try:
-                    self.setDriver('ST', n_status, report=True, force=first)
-                    self.setDriver('GV0', n_temperature, report=True, force=first)
-                    self.setDriver('GV1', n_CO2, report=True, force=first)
-                    self.setDriver('GV2', n_humidity, report=True, force=first)
-                    self.setDriver('GV3', n_minTemp, report=True, force=first)
-                    self.setDriver('GV4', n_maxTemp, report=True, force=first)
-                    self.setDriver('GV5', n_tempTrend, report=True, force=first)
-                    self.setDriver('GV6', n_when, report=True, force=first)
-                    self.setDriver('GV7', n_batteryPercent, report=True, force=first)
-                    self.setDriver('GV8', n_rfStatus, report=True, force=first)
-                except:
-                    LOGGER.error('Failed to update node status')
-            except:
-                LOGGER.error('Failed to parse mower status JSON')
-
-        except Exception as ex:
-            LOGGER.info('In exception handler, node data not found')
-            LOGGER.debug('Skipping status: ' + str(ex.args[0]))
+        data = module_record(self)
+        if data is None:
+            LOGGER.info('No data for this node')
             return False
+        LOGGER.debug(data)
+        set_drivers(self, [
+            ('ST', 1),
+            ('GV0', get_temperature(data.Temperature)),
+            ('GV1', data.CO2),
+            ('GV2', data.Humidity),
+            ('GV3', get_temperature(data.min_temp)),
+            ('GV4', get_temperature(data.max_temp)),
+            ('GV5', get_trend(data.temp_trend)),
+            ('GV6', get_when(data.When)),
+            ('GV7', data.battery_percent),
+            ('GV8', data.rf_status),
+            ], first)
         return True
 
 class outdoorModuleNode(udi_interface.Node):
     id = 'out_netatmo'
     name = ''
+    moduleId = None
     lastData = None
     drivers = [
             {'driver': 'ST', 'value': 0, 'uom': 2},   # status
@@ -416,65 +458,30 @@ class outdoorModuleNode(udi_interface.Node):
             {'driver': 'GV7', 'value': 0, 'uom': 56},   # rf status
             ]
 
-    def temp_trend(self, json):
-        try:
-            name = json['temp_trend']
-            if name == 'stable':
-                return 0
-            elif name == 'up':
-                return 1
-            else:
-                return 2
-        except:
-            LOGGER.info('failed to parse mower status type.')
-        return 99
-
     def get_status(self, first):
         LOGGER.info('GET STATUS Outdoor Module')
-        try:
-            json = self.lastData[self.name]
-            LOGGER.debug(json)
-
-            n_tempTrend = self.temp_trend(json)
-            n_temperature = json['Temperature']
-            n_temperature = get_temperature(n_temperature)
-            n_minTemp = json['min_temp']
-            n_minTemp = get_temperature(n_minTemp)
-            n_maxTemp = json['max_temp']
-            n_maxTemp = get_temperature(n_maxTemp)
-
-            try:
-                n_status = 1
-                n_humidity = json['Humidity']
-                n_when = json['When']
-                n_when = n_when / 10
-                n_batteryPercent = json['battery_percent']
-                n_rfStatus = json['rf_status']
-
-                try:
-                    self.setDriver('ST', n_status, report=True, force=first)
-                    self.setDriver('GV0', n_temperature, report=True, force=first)
-                    self.setDriver('GV1', n_humidity, report=True, force=first)
-                    self.setDriver('GV2', n_minTemp, report=True, force=first)
-                    self.setDriver('GV3', n_maxTemp, report=True, force=first)
-                    self.setDriver('GV4', n_tempTrend, report=True, force=first)
-                    self.setDriver('GV5', n_when, report=True, force=first)
-                    self.setDriver('GV6', n_batteryPercent, report=True, force=first)
-                    self.setDriver('GV7', n_rfStatus, report=True, force=first)
-                except:
-                    LOGGER.error('Failed to update node status')
-            except:
-                LOGGER.error('Failed to parse mower status JSON')
-
-        except Exception as ex:
-            LOGGER.info('In exception handler, node data not found')
-            LOGGER.debug('Skipping status: ' + str(ex.args[0]))
+        data = module_record(self)
+        if data is None:
+            LOGGER.info('No data for this node')
             return False
+        LOGGER.debug(data)
+        set_drivers(self, [
+            ('ST', 1),
+            ('GV0', get_temperature(data.Temperature)),
+            ('GV1', data.Humidity),
+            ('GV2', get_temperature(data.min_temp)),
+            ('GV3', get_temperature(data.max_temp)),
+            ('GV4', get_trend(data.temp_trend)),
+            ('GV5', get_when(data.When)),
+            ('GV6', data.battery_percent),
+            ('GV7', data.rf_status),
+            ], first)
         return True
 
 class windModuleNode(udi_interface.Node):
     id = 'wind_netatmo'
     name = ''
+    moduleId = None
     lastData = None
     drivers = [
             {'driver': 'ST', 'value': 0, 'uom': 2},   # status
@@ -491,48 +498,29 @@ class windModuleNode(udi_interface.Node):
 
     def get_status(self, first):
         LOGGER.info('GET STATUS Wind Module')
-        try:
-            json = self.lastData[self.name]
-            LOGGER.debug(json)
-
-            try:
-                n_status = 1
-                n_windStrength = json['WindStrength']
-                n_windAngle = json['WindAngle']
-                n_gustStrength = json['GustStrength']
-                n_gustAngle = json['GustAngle']
-                n_maxWindStrength = json['max_wind_str']
-                n_maxWindAngle = json['max_wind_angle']
-                n_when = json['When']
-                n_when = n_when / 10
-                n_batteryPercent = json['battery_percent']
-                n_rfStatus = json['rf_status']
-
-                try:
-                    self.setDriver('ST', n_status, report=True, force=first)
-                    self.setDriver('GV0', n_windStrength, report=True, force=first)
-                    self.setDriver('GV1', n_windAngle, report=True, force=first)
-                    self.setDriver('GV2', n_gustStrength, report=True, force=first)
-                    self.setDriver('GV3', n_gustAngle, report=True, force=first)
-                    self.setDriver('GV4', n_maxWindStrength, report=True, force=first)
-                    self.setDriver('GV5', n_maxWindAngle, report=True, force=first)
-                    self.setDriver('GV6', n_when, report=True, force=first)
-                    self.setDriver('GV7', n_batteryPercent, report=True, force=first)
-                    self.setDriver('GV8', n_rfStatus, report=True, force=first)
-                except:
-                    LOGGER.error('Failed to update node status')
-            except:
-                LOGGER.error('Failed to parse mower status JSON')
-
-        except Exception as ex:
-            LOGGER.info('In exception handler, node data not found')
-            LOGGER.debug('Skipping status: ' + str(ex.args[0]))
+        data = module_record(self)
+        if data is None:
+            LOGGER.info('No data for this node')
             return False
+        LOGGER.debug(data)
+        set_drivers(self, [
+            ('ST', 1),
+            ('GV0', data.WindStrength),
+            ('GV1', data.WindAngle),
+            ('GV2', data.GustStrength),
+            ('GV3', data.GustAngle),
+            ('GV4', data.max_wind_str),
+            ('GV5', data.max_wind_angle),
+            ('GV6', get_when(data.When)),
+            ('GV7', data.battery_percent),
+            ('GV8', data.rf_status),
+            ], first)
         return True
 
 class rainModuleNode(udi_interface.Node):
     id = 'rain_netatmo'
     name = ''
+    moduleId = None
     lastData = None
     drivers = [
             {'driver': 'ST', 'value': 0, 'uom': 2},   # status
@@ -546,44 +534,39 @@ class rainModuleNode(udi_interface.Node):
 
     def get_status(self, first):
         LOGGER.info('GET STATUS Rain Module')
-        try:
-            json = self.lastData[self.name]
-            LOGGER.debug(json)
-
-            try:
-                n_status = 1
-                n_rain = json['Rain']
-                n_rain1h = json['sum_rain_1']
-                n_rain24h = json['sum_rain_24']
-                n_when = json['When']
-                n_when = n_when / 10
-                n_batteryPercent = json['battery_percent']
-                n_rfStatus = json['rf_status']
-
-                try:
-                    self.setDriver('ST', n_status, report=True, force=first)
-                    self.setDriver('GV0', n_rain, report=True, force=first)
-                    self.setDriver('GV1', n_rain1h, report=True, force=first)
-                    self.setDriver('GV2', n_rain24h, report=True, force=first)
-                    self.setDriver('GV3', n_when, report=True, force=first)
-                    self.setDriver('GV4', n_batteryPercent, report=True, force=first)
-                    self.setDriver('GV5', n_rfStatus, report=True, force=first)
-                except:
-                    LOGGER.error('Failed to update node status')
-            except:
-                LOGGER.error('Failed to parse mower status JSON')
-
-        except Exception as ex:
-            LOGGER.info('In exception handler, node data not found')
-            LOGGER.debug('Skipping status: ' + str(ex.args[0]))
+        data = module_record(self)
+        if data is None:
+            LOGGER.info('No data for this node')
             return False
+        LOGGER.debug(data)
+        set_drivers(self, [
+            ('ST', 1),
+            ('GV0', data.Rain),
+            ('GV1', data.sum_rain_1),
+            ('GV2', data.sum_rain_24),
+            ('GV3', get_when(data.When)),
+            ('GV4', data.battery_percent),
+            ('GV5', data.rf_status),
+            ], first)
         return True
 
 
+# Node class for each Netatmo module type
+MODULE_NODES = {
+        'NAMain': mainModuleNode,
+        'NAModule4': indoorModuleNode,
+        'NAModule1': outdoorModuleNode,
+        'NAModule2': windModuleNode,
+        'NAModule3': rainModuleNode,
+        }
+
+
 if __name__ == "__main__":
     try:
         polyglot = udi_interface.Interface([])
         polyglot.start('2.0.4')
+        # The nodes only use the dashboard, battery and radio data of the modules
+        lnetatmo.configureJson(projection=True)
         Controller(polyglot, 'controller', 'controller', 'Netatmo')
         polyglot.runForever()
     except (KeyboardInterrupt, SystemExit):
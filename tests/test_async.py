@@ -0,0 +1,126 @@
+"""
+asyncio flavour : concurrent requests, transport hook, retries and camera coroutines, against the mock server
+"""
+import asyncio
+import time
+import unittest
+
+import lnetatmo
+import lnetatmo_async
+import lnetatmo_mock
+
+
+class AsyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = lnetatmo._BREAKER
+        lnetatmo._LIMITERS.clear()
+        lnetatmo._BREAKER = lnetatmo.CircuitBreaker()
+        self.server = lnetatmo_mock.MockNetatmoServer().start()
+        lnetatmo.setTransport(self.server.transport())
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        lnetatmo._BREAKER = self.saved
+        lnetatmo._LIMITERS.clear()
+
+    def loop(self, coroutine):
+        return asyncio.run(coroutine)
+
+    async def session(self, work):
+        auth = lnetatmo_async.AsyncClientAuth("id", "secret", "user", "password")
+        try:
+            return await work(auth)
+        finally:
+            await auth.close()
+
+    def test_fan_out_through_transport(self):
+        async def work(auth):
+            weather = await lnetatmo_async.AsyncWeatherStationData.create(auth)
+            sid = weather.stationsIds()[0]
+            return await asyncio.gather(*[ weather.getMeasure(sid, "1hour", "Temperature", limit=n + 1)
+                                           for n in range(50) ])
+        answers = self.loop(self.session(work))
+        self.assertEqual([ len(a["body"]) for a in answers ], list(range(1, 51)))
+        self.assertEqual(self.server.counts["api/getmeasure"], 50)
+
+    def test_fan_out_through_pool(self):
+        lnetatmo.setTransport()
+        cid = self.server.homes[0]["cameras"][0]["id"]
+        url = "%svpn/%s/command/ping" % (self.server.url, cid)
+
+        async def work():
+            pool = lnetatmo_async.AsyncConnectionPool(maxsize=10)
+            try:
+                return await asyncio.gather(*[ lnetatmo_async.postRequest(url, pool=pool) for _ in range(50) ])
+            finally:
+                await pool.close()
+        answers = self.loop(work())
+        self.assertTrue(all(a["product_name"] == "Mock camera" for a in answers))
+        self.assertEqual(self.server.counts["vpn/%s/command/ping" % cid], 50)
+
+    def test_retries_and_token_renewal(self):
+        async def work(auth):
+            await auth.accessToken()
+            self.server.expireTokens()
+            self.server.inject("api/getstationsdata", 500)
+            lnetatmo._RANDOM.seed(0)
+            return await lnetatmo_async.AsyncWeatherStationData.create(auth, useCache=False)
+        lnetatmo._BACKOFF_BASE, base = 0.01, lnetatmo._BACKOFF_BASE
+        try:
+            weather = self.loop(self.session(work))
+        finally:
+            lnetatmo._BACKOFF_BASE = base
+        self.assertTrue(weather.stations)
+        self.assertEqual(self.server.counts["api/getstationsdata"], 3)
+        self.assertEqual(self.server.counts["oauth2/token"], 2)
+        self.assertEqual(lnetatmo._BREAKER.failures, 0)
+
+    def test_circuit_open(self):
+        lnetatmo._BREAKER.failures = lnetatmo._BREAKER.threshold
+        lnetatmo._BREAKER._openUntil = time.time() + 60
+        self.assertRaises(lnetatmo.ApiUnavailable, self.loop,
+                          self.session(lnetatmo_async.AsyncWeatherStationData.create))
+        self.assertNotIn("api/getstationsdata", self.server.counts)
+
+    def test_camera_coroutines(self):
+        async def work(auth):
+            home = await lnetatmo_async.AsyncHomeData.create(auth)
+            snapshots = await home.getLiveSnapshots()
+            face = await home.getProfileImage("Alice")
+            nobody = await home.getProfileImage("Nobody")
+            status = await home.presenceStatus("on", camera="Garden")
+            url = await home.presenceUrl(camera="Garden")
+            return snapshots, face, nobody, status, url
+        snapshots, face, nobody, status, url = self.loop(self.session(work))
+        self.assertEqual(len(snapshots), 2)
+        self.assertTrue(all(kind == "jpeg" for _, kind in snapshots.values()))
+        self.assertIsInstance(face[0], bytes)
+        self.assertEqual(nobody, (None, None))
+        self.assertEqual(status, "on")
+        self.assertTrue(url.startswith(self.server.url))
+
+    def test_measure_iterators(self):
+        async def work(auth):
+            weather = await lnetatmo_async.AsyncWeatherStationData.create(auth)
+            queries = weather.measureQueries(date_begin=self.server.now - 86400 * 10)
+            points = [ p async for p in weather.iterMeasures(queries, workers=2) ]
+            first = [ p async for p in weather.iterMeasure(**queries[0]) ]
+            # Closed early, the pending pages requests are cancelled
+            partial = weather.iterMeasures(queries, workers=2)
+            await partial.__anext__()
+            await partial.aclose()
+            return points, first, await weather.allMinMaxTH(), len(asyncio.all_tasks())
+        points, first, minMax, tasks = self.loop(self.session(work))
+        weather = lnetatmo.WeatherStationData(lnetatmo.ClientAuth("id", "secret", "user", "password", refreshAhead=None))
+        queries = weather.measureQueries(date_begin=self.server.now - 86400 * 10)
+        self.assertGreater(len(first), lnetatmo._MEASURE_PAGE)
+        self.assertEqual(first, list(weather.iterMeasure(**queries[0])))
+        self.assertEqual(sorted(points), sorted(weather.iterMeasures(queries)))
+        self.assertEqual(minMax, weather.allMinMaxTH())
+        self.assertEqual(tasks, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
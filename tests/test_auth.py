@@ -0,0 +1,69 @@
+"""
+Tokens : cache between runs, single renewal for concurrent callers, background renewal, against the mock server
+"""
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import lnetatmo
+import lnetatmo_mock
+
+
+class ClientAuthTest(unittest.TestCase):
+
+    def setUp(self):
+        lnetatmo._LIMITERS.clear()
+        self.directory = tempfile.mkdtemp()
+        self.tokenCache = os.path.join(self.directory, "tokens.json")
+        self.server = lnetatmo_mock.MockNetatmoServer().start()
+        lnetatmo.setTransport(self.server.transport())
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+        lnetatmo._LIMITERS.clear()
+
+    def auth(self, **kwargs):
+        kwargs.setdefault("refreshAhead", None)
+        return lnetatmo.ClientAuth("id", "secret", "user", "password", tokenCache=self.tokenCache, **kwargs)
+
+    def test_token_cache_reused(self):
+        first = self.auth()
+        self.assertEqual(stat.S_IMODE(os.stat(self.tokenCache).st_mode), 0o600)
+        second = self.auth()
+        self.assertEqual(self.server.counts["oauth2/token"], 1)
+        self.assertEqual(second.accessToken, first.accessToken)
+        self.assertTrue(lnetatmo.WeatherStationData(second).stations)
+
+    def test_concurrent_renewals(self):
+        auth = self.auth()
+        rejected = auth.accessToken
+        tokens = []
+        threads = [ threading.Thread(target=lambda: tokens.append(auth.renewToken(rejected))) for _ in range(8) ]
+        for t in threads : t.start()
+        for t in threads : t.join()
+        self.assertEqual(self.server.counts["oauth2/token"], 2)
+        self.assertEqual(set(tokens), { auth.accessToken })
+        self.assertNotEqual(auth.accessToken, rejected)
+
+    def test_rejected_background_renewal_stops(self):
+        with mock.patch("lnetatmo._TOKEN_RETRY_DELAY", 0.05):
+            auth = self.auth(refreshAhead=10800 - 0.2)
+            self.server.inject("oauth2/token", 400, 400, 400, 400, 400)
+            time.sleep(0.8)
+        self.assertEqual(self.server.counts["oauth2/token"], 2)
+        self.assertFalse(auth._timer.is_alive())
+        # The refresh token being rejected, a renewal in the foreground fails
+        auth.expiration = 0
+        self.assertRaises(lnetatmo.AuthFailure, lambda: auth.accessToken)
+        auth.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
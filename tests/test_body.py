@@ -0,0 +1,45 @@
+"""
+Response bodies : read in one buffer, streamed to sinks, returned as bytes
+"""
+import io
+import unittest
+
+import lnetatmo
+import lnetatmo_mock
+
+
+class BodyTest(unittest.TestCase):
+
+    def response(self, payload, length=True):
+        resp = lnetatmo.BufferedResponse(200, "OK", { "Content-Type" : "image/jpeg" }, payload)
+        if not length : del resp.headers["content-length"]
+        return resp
+
+    def test_read_body(self):
+        payload = bytes(range(256)) * 1000
+        self.assertEqual(lnetatmo.readBody(self.response(payload)), payload)
+        self.assertEqual(lnetatmo.readBody(self.response(payload, length=False)), payload)
+
+    def test_stream_body(self):
+        payload = b"x" * (3 * lnetatmo._READ_CHUNK + 7)
+        sink = io.BytesIO()
+        self.assertEqual(lnetatmo.streamBody(self.response(payload), sink), len(payload))
+        self.assertEqual(sink.getvalue(), payload)
+
+    def test_images_are_bytes(self):
+        server = lnetatmo_mock.MockNetatmoServer().start()
+        lnetatmo.setTransport(server.transport())
+        try:
+            auth = lnetatmo.ClientAuth("id", "secret", "user", "password", refreshAhead=None)
+            home = lnetatmo.HomeData(auth)
+            image, imageType = home.getCameraPicture("image", "key")
+            self.assertIsInstance(image, bytes)
+            self.assertEqual(imageType, "jpeg")
+            self.assertIsInstance(home.getLiveSnapshot(), bytes)
+        finally:
+            lnetatmo.setTransport()
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Response cache of the station data : expiration from the measures time, invalidation and bypass, against the mock server
+"""
+import time
+import unittest
+from unittest import mock
+
+import lnetatmo
+import lnetatmo_mock
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        lnetatmo._LIMITERS.clear()
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        lnetatmo._LIMITERS.clear()
+
+    def start(self, **kwargs):
+        self.server = lnetatmo_mock.MockNetatmoServer(**kwargs).start()
+        lnetatmo.setTransport(self.server.transport())
+        self.auth = lnetatmo.ClientAuth("id", "secret", "user", "password", refreshAhead=None)
+
+    def sent(self):
+        return self.server.counts.get("api/getstationsdata", 0)
+
+    def later(self, delay):
+        # Clock of the cache moved delay seconds ahead
+        return mock.patch("lnetatmo.time.time", return_value=time.time() + delay)
+
+    def test_expiration_after_next_upload(self):
+        # Last measures 2 minutes old : next upload expected 8 minutes from now
+        self.start()
+        lnetatmo.WeatherStationData(self.auth)
+        lnetatmo.WeatherStationData(self.auth)
+        self.assertEqual(self.sent(), 1)
+        with self.later(lnetatmo._CACHE_CADENCE - 180):
+            lnetatmo.WeatherStationData(self.auth)
+        self.assertEqual(self.sent(), 1)
+        with self.later(lnetatmo._CACHE_CADENCE - 60):
+            lnetatmo.WeatherStationData(self.auth)
+        self.assertEqual(self.sent(), 2)
+
+    def test_overdue_upload_kept_min_ttl(self):
+        self.start(now=time.time() - 3600)
+        lnetatmo.WeatherStationData(self.auth)
+        with self.later(lnetatmo._CACHE_MIN_TTL - 10):
+            lnetatmo.WeatherStationData(self.auth)
+        self.assertEqual(self.sent(), 1)
+        with self.later(lnetatmo._CACHE_MIN_TTL + 10):
+            lnetatmo.WeatherStationData(self.auth)
+        self.assertEqual(self.sent(), 2)
+
+    def test_invalidate(self):
+        self.start()
+        lnetatmo.WeatherStationData(self.auth)
+        self.auth.cache.invalidate(lnetatmo._GETHOMEDATA_REQ)
+        lnetatmo.WeatherStationData(self.auth)
+        self.assertEqual(self.sent(), 1)
+        self.auth.cache.invalidate(lnetatmo._GETSTATIONDATA_REQ)
+        lnetatmo.WeatherStationData(self.auth)
+        self.assertEqual(self.sent(), 2)
+        self.auth.cache.invalidate()
+        lnetatmo.WeatherStationData(self.auth)
+        self.assertEqual(self.sent(), 3)
+
+    def test_bypass_refreshes_cache(self):
+        self.start()
+        weather = lnetatmo.WeatherStationData(self.auth)
+        weather.refresh(useCache=False)
+        lnetatmo.WeatherStationData(self.auth, useCache=False)
+        self.assertEqual(self.sent(), 3)
+        # The answer of the last bypass is cached
+        self.server.devices[0]["station_name"] = "Renamed"
+        self.assertNotIn("Renamed", lnetatmo.WeatherStationData(self.auth).stations)
+        self.assertEqual(self.sent(), 3)
+        self.assertIn("Renamed", lnetatmo.WeatherStationData(self.auth, useCache=False).stations)
+
+
+if __name__ == "__main__":
+    unittest.main()
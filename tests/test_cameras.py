@@ -0,0 +1,69 @@
+"""
+Camera urls : reused during their lifetime, checked again once expired, after a failed command or a vpn_url change,
+against the mock server
+"""
+import time
+import unittest
+from unittest import mock
+
+import lnetatmo
+import lnetatmo_mock
+
+
+class CameraUrlsTest(unittest.TestCase):
+
+    def setUp(self):
+        lnetatmo._LIMITERS.clear()
+        self.server = lnetatmo_mock.MockNetatmoServer().start()
+        lnetatmo.setTransport(self.server.transport())
+        auth = lnetatmo.ClientAuth("id", "secret", "user", "password", refreshAhead=None)
+        self.homes = lnetatmo.HomeData(auth)
+        self.camera = self.homes.cameraByName("Garden")
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        lnetatmo._LIMITERS.clear()
+
+    def pings(self, cid=None):
+        # The vpn and local urls of the mock cameras are the same : two pings per check
+        return self.server.counts.get("vpn/%s/command/ping" % (cid or self.camera["id"]), 0)
+
+    def test_urls_lifetime(self):
+        urls = self.homes.cameraUrls(cid=self.camera["id"])
+        self.assertEqual(urls[0], self.camera["vpn_url"])
+        self.homes.cameraUrls(cid=self.camera["id"])
+        self.homes.url(camera="Garden")
+        self.assertEqual(self.pings(), 2)
+        # Expired : still returned while checked again in background
+        with mock.patch("lnetatmo.time.time", return_value=time.time() + lnetatmo._CAMERA_URLS_TTL + 1):
+            self.assertEqual(self.homes.cameraUrls(cid=self.camera["id"]), urls)
+            deadline = time.time() + 3
+            while self.pings() < 4 and time.time() < deadline:
+                time.sleep(0.02)
+            self.assertEqual(self.pings(), 4)
+            self.homes.cameraUrls(cid=self.camera["id"])
+        self.assertEqual(self.pings(), 4)
+        self.homes.cameraUrls(cid=self.camera["id"], refresh=True)
+        self.assertEqual(self.pings(), 6)
+
+    def test_failed_command_checks_urls(self):
+        self.homes.cameraUrls(cid=self.camera["id"])
+        self.server.inject("vpn/%s%s" % (self.camera["id"], lnetatmo._PRES_CDE_GET_SNAP), 500)
+        self.assertIsInstance(self.homes.getLiveSnapshot(camera="Garden"), bytes)
+        self.assertEqual(self.pings(), 4)
+        self.homes.getLiveSnapshot(camera="Garden")
+        self.assertEqual(self.pings(), 4)
+
+    def test_vpn_url_change(self):
+        self.homes.cameraUrls(cid=self.camera["id"])
+        other = self.homes.cameraByName("Living room")["id"]
+        self.camera["vpn_url"] = self.camera["vpn_url"].replace(self.camera["id"], other)
+        self.assertEqual(self.homes.cameraUrls(cid=self.camera["id"])[0], self.camera["vpn_url"])
+        self.assertEqual((self.pings(), self.pings(other)), (2, 2))
+        self.homes.cameraUrls(cid=self.camera["id"])
+        self.assertEqual(self.pings(other), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Camera events : ordering, replacement and retention, background synchronization
+"""
+import unittest
+
+import lnetatmo
+import lnetatmo_mock
+
+
+class FailingHomes:
+    """
+    Homes of which the first one fails to answer
+    """
+    homes = { "h1" : { "id" : "h1", "name" : "Home" }, "h2" : { "id" : "h2", "name" : "Cottage" } }
+
+    def syncEvents(self, home):
+        if home == "Home" : raise lnetatmo.ApiUnavailable("Netatmo API unavailable")
+        return [ { "id" : "e1", "time" : 1000, "type" : "movement" } ]
+
+    def homeByName(self, home):
+        return [ h for h in self.homes.values() if h["name"] == home ][0]
+
+
+class CameraEventsTest(unittest.TestCase):
+
+    def test_rejected_time_change_keeps_event(self):
+        events = lnetatmo.CameraEvents(retention=100)
+        for n, t in enumerate((1120, 1150, 1200)):
+            events.add({ "id" : "e%d" % n, "time" : t, "type" : "movement" })
+        self.assertFalse(events.add({ "id" : "e1", "time" : 1050, "type" : "movement" }))
+        self.assertEqual(events[1150]["id"], "e1")
+        self.assertEqual(len(events), 3)
+        # The latest event moved back, the retention applies from the other ones
+        self.assertFalse(events.add({ "id" : "e2", "time" : 900, "type" : "movement" }))
+        self.assertEqual(events.keys(), [1120, 1150, 1200])
+        self.assertFalse(events.add({ "id" : "e2", "time" : 1100, "type" : "movement" }))
+        self.assertEqual(events.keys(), [1100, 1120, 1150])
+        self.assertEqual(events.last("movement")["id"], "e1")
+
+
+
+class EventSyncTest(unittest.TestCase):
+
+    def test_failing_home_skipped(self):
+        sync = lnetatmo.EventSync(FailingHomes())
+        notified = []
+        sync.subscribe(lambda homeId, events: notified.append(homeId))
+        with self.assertLogs("lnetatmo", "WARNING"):
+            self.assertEqual(sync.sync(), 1)
+        self.assertEqual(notified, ["h2"])
+
+
+class HomeDataTest(unittest.TestCase):
+
+    def setUp(self):
+        lnetatmo._LIMITERS.clear()
+        self.server = lnetatmo_mock.MockNetatmoServer().start()
+        lnetatmo.setTransport(self.server.transport())
+        self.auth = lnetatmo.ClientAuth("id", "secret", "user", "password", refreshAhead=None)
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        lnetatmo._LIMITERS.clear()
+
+    def test_default_home_with_cameras(self):
+        self.server.homes.insert(0, { "id" : "home-t", "name" : "Thermostat", "persons" : [], "events" : [] })
+        homes = lnetatmo.HomeData(self.auth)
+        self.assertEqual(homes.default_home, "Home 0")
+        self.assertEqual(homes.default_camera["home_id"], "home-0")
+        self.assertRaises(lnetatmo.NoDevice, lnetatmo.HomeData, self.auth, home="Thermostat")
+
+    def test_occupancy_first_home_without_cameras(self):
+        self.server.homes.insert(0, { "id" : "home-t", "name" : "Thermostat", "persons" : [], "events" : [] })
+        homes = lnetatmo.HomeData(self.auth)
+        cameraHomes = homes.homesWithCameras()
+        occupancy = lambda: sum(homes.occupancy(h) for h in cameraHomes)
+        self.assertEqual(cameraHomes, ["Home 0"])
+        self.assertEqual(occupancy(), 1)
+        self.assertEqual(homes.personsAtHome("Home 0"), ["Alice"])
+        # Bob arrives, Alice leaves : only the home with cameras is synchronized, from its last event
+        sync = lnetatmo.EventSync(homes, homes=cameraHomes)
+        arrival = self.server.addEvent(etype="person", personId="person-2")
+        self.assertEqual(sync.sync(), 1)
+        self.assertEqual(occupancy(), 2)
+        self.assertEqual(homes.personLastSeen("Bob"), arrival["time"])
+        self.server.addEvent(etype="person_away", personId="person-1")
+        self.assertEqual(sync.sync(), 1)
+        self.assertEqual(homes.personsAtHome("Home 0"), ["Bob"])
+        self.assertEqual(self.server.counts["api/gethomedata"], 1)
+        self.assertEqual(self.server.counts["api/geteventsuntil"], 2)
+        # Events older than the last sighting don't change the presence
+        homes._updatePresence([ { "id" : "old", "type" : "person_away", "person_id" : "person-2", "time" : arrival["time"] - 60 } ])
+        self.assertEqual(occupancy(), 1)
+        self.assertEqual(homes.personsAtHome("Home 0"), ["Bob"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Image cache : concurrent puts, files evicted while read, against the mock server
+"""
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import lnetatmo
+import lnetatmo_async
+import lnetatmo_mock
+
+
+class EvictingCache(lnetatmo.ImageCache):
+    """
+    Cache whose files are evicted by another thread right after being found
+    """
+    def get(self, key):
+        path = lnetatmo.ImageCache.get(self, key)
+        if path : self._delete(os.path.basename(path))
+        return path
+
+
+class EvictingLock:
+    """
+    Lock of a cache whose file is evicted by another thread right before the lock is taken
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        if self.path and os.path.exists(self.path) : os.remove(self.path)
+        self.path = None
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc):
+        return self.lock.__exit__(*exc)
+
+
+class ImageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        lnetatmo._LIMITERS.clear()
+        self.directory = tempfile.mkdtemp()
+        self.server = lnetatmo_mock.MockNetatmoServer().start()
+        lnetatmo.setTransport(self.server.transport())
+        self.auth = lnetatmo.ClientAuth("id", "secret", "user", "password", refreshAhead=None)
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+        lnetatmo._LIMITERS.clear()
+
+    def test_concurrent_puts(self):
+        cache = lnetatmo.ImageCache(self.directory)
+        data = b"\xff\xd8\xff\xe0" + os.urandom(4 * 1024 * 1024)
+        paths, errors = [], []
+        start = threading.Barrier(16)
+
+        def put(n):
+            start.wait()
+            try:
+                paths.append(cache.put("key%d" % n, data))
+            except Exception as e:
+                errors.append(e)
+        threads = [ threading.Thread(target=put, args=(n,)) for n in range(16) ]
+        for t in threads : t.start()
+        for t in threads : t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(paths)), 1)
+        with open(paths[0], "rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual([ n for n in os.listdir(self.directory) if n.endswith(".tmp") ], [])
+
+    def test_evicted_before_put(self):
+        cache = lnetatmo.ImageCache(self.directory)
+        data = b"\xff\xd8\xff\xe0" + os.urandom(1024)
+        path = cache.put("face", data)
+        cache._lock = EvictingLock(path)
+        self.assertEqual(cache.put("face", data), path)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(cache.size(), len(data))
+
+    def test_evicted_picture_downloaded(self):
+        home = lnetatmo.HomeData(self.auth, imageCache=EvictingCache(self.directory))
+        face, kind = home.getProfileImage("Alice")
+        self.assertEqual(kind, "jpeg")
+        sent = self.server.counts["api/getcamerapicture"]
+        self.assertEqual(home.getProfileImage("Alice"), (face, kind))
+        self.assertEqual(self.server.counts["api/getcamerapicture"], sent + 1)
+
+    def test_async_pictures_cached(self):
+        async def work():
+            auth = lnetatmo_async.AsyncClientAuth("id", "secret", "user", "password")
+            try:
+                home = await lnetatmo_async.AsyncHomeData.create(auth, imageCache=lnetatmo.ImageCache(self.directory))
+                face = await home.getProfileImage("Alice")
+                sent = self.server.counts["api/getcamerapicture"]
+                return face, await home.getProfileImage("Alice"), sent
+            finally:
+                await auth.close()
+        face, again, sent = asyncio.run(work())
+        self.assertEqual(face[1], "jpeg")
+        self.assertEqual(again, face)
+        self.assertEqual(sent, 1)
+        self.assertEqual(self.server.counts["api/getcamerapicture"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
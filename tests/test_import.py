@@ -0,0 +1,39 @@
+"""
+Import of lnetatmo : no credentials nor file read, slow modules loaded with the first request
+"""
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Records the files opened by the import, the modules sources excepted
+SCRIPT = """
+import sys
+opened = []
+def audit(event, args):
+    if event == "open" and isinstance(args[0], str) and not args[0].endswith((".py", ".pyc")):
+        opened.append(args[0])
+sys.addaudithook(audit)
+import lnetatmo
+print(repr((opened, lnetatmo._CREDENTIALS is None)))
+"""
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_import_time(self):
+        run = subprocess.run([sys.executable, "-X", "importtime", "-c", SCRIPT], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        opened, noCredentials = eval(run.stdout.strip().splitlines()[-1])
+        self.assertEqual(opened, [])
+        self.assertTrue(noCredentials)
+        modules = { line.split("|")[-1].strip() for line in run.stderr.splitlines() if line.startswith("import time:") }
+        self.assertIn("lnetatmo", modules)
+        for slow in ("ssl", "urllib.request", "imghdr", "numpy", "base64"):
+            self.assertNotIn(slow, modules)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Json decoding : fields kept by the projection, json module fallback without orjson, against the mock server
+"""
+import sys
+import unittest
+from unittest import mock
+
+import lnetatmo
+import lnetatmo_mock
+
+
+def recordFields(record):
+    return { f : getattr(record, f) for f in lnetatmo.ModuleRecord.__slots__ + record._MEASURES }
+
+
+class JsonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = lnetatmo._PROJECTION, lnetatmo._JSON_LOADS
+        lnetatmo._LIMITERS.clear()
+        self.server = lnetatmo_mock.MockNetatmoServer(stations=2).start()
+        lnetatmo.setTransport(self.server.transport())
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        lnetatmo._PROJECTION, lnetatmo._JSON_LOADS = self.saved
+        lnetatmo._LIMITERS.clear()
+
+    def read(self):
+        # What WeatherStationData, HomeData and the node server nodes read
+        lnetatmo._LIMITERS.clear()
+        auth = lnetatmo.ClientAuth("id", "secret", "user", "password", refreshAhead=None)
+        weather = lnetatmo.WeatherStationData(auth)
+        homes = lnetatmo.HomeData(auth)
+        records, cursor = weather.recordChanges()
+        home = homes.default_home
+        return { "records" : { i : recordFields(r) for i,r in records.items() },
+                 "lastData" : weather.lastDataChanges()[0],
+                 "stale" : weather.staleModules(),
+                 "names" : weather.modulesNamesList(),
+                 "user" : vars(weather.user),
+                 "cameras" : { h : sorted(c) for h,c in homes.cameras.items() },
+                 "homes" : sorted(h['name'] for h in homes.homes.values()),
+                 "occupancy" : homes.occupancy(home),
+                 "persons" : homes.personsAtHome(home),
+                 "events" : [ (t, e['type']) for c in homes.events.values() for t,e in c.items() ],
+                 "url" : homes.url(camera="Garden") }
+
+    def test_projection_keeps_used_fields(self):
+        lnetatmo.configureJson(projection=False)
+        full = self.read()
+        lnetatmo.configureJson(projection=True)
+        projected = self.read()
+        self.assertTrue(full["records"] and full["events"] and full["persons"])
+        self.assertEqual(projected, full)
+
+    def test_without_orjson(self):
+        fast = self.read()
+        with mock.patch.dict(sys.modules, { "orjson" : None }), mock.patch("lnetatmo._JSON_LOADS", None):
+            self.assertEqual(self.read(), fast)
+            self.assertIs(lnetatmo._JSON_LOADS, lnetatmo.json.loads)
+        self.assertEqual(lnetatmo._decodeJson(None, b'{"value": NaN, "big": 123456789012345678901234567890}')["big"],
+                         123456789012345678901234567890)
+
+
+if __name__ == "__main__":
+    unittest.main()
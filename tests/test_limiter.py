@@ -0,0 +1,107 @@
+"""
+Rate limiters : one per account, asyncio requests queued with the blocking ones
+"""
+import asyncio
+import threading
+import time
+import unittest
+
+import lnetatmo
+import lnetatmo_async
+import lnetatmo_mock
+
+
+class AccountLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        lnetatmo._LIMITERS.clear()
+        self.server = lnetatmo_mock.MockNetatmoServer().start()
+        lnetatmo.setTransport(self.server.transport())
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        lnetatmo._LIMITERS.clear()
+
+    def test_quota_of_one_account(self):
+        first = lnetatmo.ClientAuth("id", "secret", "first", "password", refreshAhead=None)
+        second = lnetatmo.ClientAuth("id", "secret", "second", "password", refreshAhead=None)
+        self.assertIs(first.limiter, lnetatmo.ClientAuth("id", "secret", "first", "password", refreshAhead=None).limiter)
+        self.server.inject("api/getstationsdata", 429)
+        params = { "access_token" : first.accessToken }
+        self.assertIsNone(lnetatmo.postRequest(lnetatmo._GETSTATIONDATA_REQ, params, auth=first))
+        self.assertGreater(first.limiter.tryAcquire(), 0)
+        start = time.time()
+        self.assertTrue(lnetatmo.WeatherStationData(second).stations)
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(lnetatmo.requestsUsed(3600, second), 2)
+
+
+class QueueTest(unittest.TestCase):
+
+    def test_priority_order(self):
+        limiter = lnetatmo.RateLimiter()
+        limiter.holdOff(0.2)
+        backfill = limiter.enqueue(lnetatmo.PRIORITY_BACKFILL)
+        poll = limiter.enqueue(lnetatmo.PRIORITY_POLL)
+        self.assertEqual(limiter.poll(backfill), lnetatmo._LIMITER_POLL)
+        time.sleep(0.25)
+        self.assertEqual(limiter.poll(backfill), lnetatmo._LIMITER_POLL)
+        self.assertEqual(limiter.poll(poll), 0)
+        self.assertEqual(limiter.poll(backfill), 0)
+
+    def test_async_not_starved(self):
+        # An asyncio request queued first is served before the blocking ones queued after it
+        limiter = lnetatmo.RateLimiter()
+        limiter.holdOff(0.2)
+        served = []
+
+        def blocking(n):
+            limiter.acquire()
+            served.append(n)
+
+        async def queued():
+            await lnetatmo_async.acquire(limiter)
+            served.append("async")
+
+        async def main():
+            task = asyncio.ensure_future(queued())
+            await asyncio.sleep(0)
+            threads = [ threading.Thread(target=blocking, args=(n,)) for n in range(3) ]
+            for t in threads : t.start()
+            await task
+            for t in threads : t.join()
+
+        asyncio.run(main())
+        self.assertEqual(served[0], "async")
+        self.assertEqual(sorted(served[1:]), [0, 1, 2])
+
+    def test_cancelled_wait(self):
+        limiter = lnetatmo.RateLimiter()
+        limiter.holdOff(60)
+        cancel = threading.Event()
+        granted = []
+        thread = threading.Thread(target=lambda: granted.append(limiter.acquire(cancel=cancel)))
+        thread.start()
+        cancel.set()
+        limiter.wake()
+        thread.join(1)
+        self.assertEqual(granted, [False])
+        self.assertEqual(limiter._waiting, [])
+
+    def test_cancelled_ticket(self):
+        limiter = lnetatmo.RateLimiter()
+        limiter.holdOff(10)
+
+        async def main():
+            task = asyncio.ensure_future(lnetatmo_async.acquire(limiter))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        asyncio.run(main())
+        self.assertEqual(limiter._waiting, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+ConnectionPool against local servers : redirects and requests not replayed on a dropped connection
+"""
+import http.client
+import socket
+import threading
+import unittest
+
+import lnetatmo
+import lnetatmo_mock
+
+
+class DroppingServer:
+    """
+    Answer the first request of a connection, then read the second one and close without answering
+    """
+    def __init__(self):
+        self.requests = 0
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(5)
+        self.url = "http://127.0.0.1:%d/" % self._sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with conn:
+                for answer in (True, False):
+                    data = b""
+                    while b"\r\n\r\n" not in data:
+                        chunk = conn.recv(65536)
+                        if not chunk : break
+                        data += chunk
+                    if not data : break
+                    self.requests += 1
+                    if answer:
+                        conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}")
+
+    def close(self):
+        self._sock.close()
+
+
+class PoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = lnetatmo_mock.MockNetatmoServer().start()
+        self.pool = lnetatmo.ConnectionPool()
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.stop()
+
+    def test_connection_reused(self):
+        for _ in range(3):
+            resp = self.pool.urlopen(self.server.url + "vpn/x/command/ping")
+            lnetatmo.readBody(resp)
+            resp.close()
+        self.assertEqual(sum(len(c) for c in self.pool._idle.values()), 1)
+
+    def test_post_redirect_followed_as_get(self):
+        self.server.redirect("old/command/ping", "/vpn/x/command/ping", 302)
+        resp = self.pool.urlopen(self.server.url + "old/command/ping", b"a=1",
+                                 { "Content-Type" : "application/x-www-form-urlencoded" })
+        self.assertEqual(resp.status, 200)
+        self.assertIn(b"local_url", lnetatmo.readBody(resp))
+        resp.close()
+
+    def test_post_not_redirected_by_307(self):
+        self.server.redirect("old/command/ping", "/vpn/x/command/ping", 307)
+        resp = self.pool.urlopen(self.server.url + "old/command/ping", b"a=1")
+        self.assertEqual(resp.status, 307)
+        resp.close()
+
+    def test_post_not_replayed_after_drop(self):
+        server = DroppingServer()
+        try:
+            resp = self.pool.urlopen(server.url, b"a=1")
+            lnetatmo.readBody(resp)
+            resp.close()
+            with self.assertRaises((http.client.RemoteDisconnected, ConnectionResetError)):
+                self.pool.urlopen(server.url, b"a=2")
+            self.assertEqual(server.requests, 2)
+        finally:
+            server.close()
+
+    def test_get_replayed_after_drop(self):
+        server = DroppingServer()
+        try:
+            for _ in range(2):
+                resp = self.pool.urlopen(server.url)
+                lnetatmo.readBody(resp)
+                resp.close()
+            self.assertEqual(server.requests, 3)
+        finally:
+            server.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
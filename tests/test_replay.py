@@ -0,0 +1,53 @@
+"""
+Recorded sessions : secrets scrubbed from the recording, replayed without the server
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import lnetatmo
+import lnetatmo_mock
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        lnetatmo._LIMITERS.clear()
+        self.directory = tempfile.mkdtemp()
+        self.server = lnetatmo_mock.MockNetatmoServer().start()
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        shutil.rmtree(self.directory)
+        lnetatmo._LIMITERS.clear()
+
+    def session(self):
+        auth = lnetatmo.ClientAuth("id", "client-secret", "someone@example.com", "hunter2", refreshAhead=None)
+        weather = lnetatmo.WeatherStationData(auth)
+        homes = lnetatmo.HomeData(auth)
+        return auth, weather.stations, homes.getProfileImage("Alice")
+
+    def test_record_and_replay(self):
+        recording = lnetatmo.RecordingTransport(self.server.transport())
+        lnetatmo.setTransport(recording)
+        auth, stations, face = self.session()
+        path = os.path.join(self.directory, "session.json")
+        recording.save(path)
+        with open(path, "r") as f:
+            saved = f.read()
+        for secret in ("client-secret", "someone@example.com", "someone%40example.com", "hunter2", auth.accessToken, auth.refreshToken):
+            self.assertNotIn(secret, saved)
+        # Offline
+        self.server.stop()
+        lnetatmo._LIMITERS.clear()
+        lnetatmo.setTransport(lnetatmo.ReplayTransport(path))
+        auth, replayedStations, replayedFace = self.session()
+        self.assertEqual(replayedStations, stations)
+        self.assertEqual(bytes(replayedFace[0]), bytes(face[0]))
+        self.assertEqual(replayedFace[1], "jpeg")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+Retries, token renewal, quota deferral and circuit breaker of postRequest, against the mock server
+"""
+import time
+import unittest
+from unittest import mock
+
+import lnetatmo
+import lnetatmo_mock
+
+# Retry delays are recorded instead of slept, the tests wait for the breaker cooldown with this one
+_sleep = time.sleep
+
+
+class FailingTransport:
+    """
+    Transport raising the given exceptions on the next requests, then sending them to the mock server
+    """
+    def __init__(self, transport, *errors):
+        self.transport = transport
+        self.errors = list(errors)
+
+    def urlopen(self, url, body=None, headers=None, timeout=10):
+        if self.errors : raise self.errors.pop(0)
+        return self.transport.urlopen(url, body, headers, timeout=timeout)
+
+
+class ResilienceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = lnetatmo._LIMITER, lnetatmo._BREAKER
+        lnetatmo._LIMITERS.clear()
+        lnetatmo._LIMITER = lnetatmo.RateLimiter()
+        lnetatmo._BREAKER = lnetatmo.CircuitBreaker(threshold=3, cooldown=0.2)
+        self.server = lnetatmo_mock.MockNetatmoServer().start()
+        lnetatmo.setTransport(self.server.transport())
+        self.auth = lnetatmo.ClientAuth("id", "secret", "user", "password", refreshAhead=None)
+        self.delays = []
+        patcher = mock.patch("lnetatmo.time.sleep", self.delays.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        lnetatmo._LIMITER, lnetatmo._BREAKER = self.saved
+        lnetatmo._LIMITERS.clear()
+
+    def stations(self):
+        return lnetatmo.WeatherStationData(self.auth, useCache=False)
+
+    def request(self):
+        params = { "access_token" : self.auth.accessToken }
+        return lnetatmo.postRequest(lnetatmo._GETSTATIONDATA_REQ, params, auth=self.auth)
+
+    def openCircuit(self):
+        # Retries stop as soon as the circuit opens
+        self.server.inject("api/getstationsdata", 500, 500, 500)
+        self.assertIsNone(self.request())
+        self.assertEqual(len(self.delays), 2)
+        self.assertFalse(lnetatmo._BREAKER.allow())
+
+    def test_server_errors_retried_with_backoff(self):
+        self.server.inject("api/getstationsdata", 500, 502)
+        self.assertTrue(self.stations().stations)
+        self.assertEqual(self.server.counts["api/getstationsdata"], 3)
+        self.assertEqual(len(self.delays), 2)
+        self.assertTrue(0.5 <= self.delays[0] <= 1 and 1 <= self.delays[1] <= 2)
+
+    def test_expired_token_renewed(self):
+        self.server.expireTokens()
+        self.assertTrue(self.stations().stations)
+        self.assertEqual(self.server.counts["oauth2/token"], 2)
+        self.assertEqual(self.server.counts["api/getstationsdata"], 2)
+
+    def test_quota_error_defers_requests(self):
+        self.server.inject("api/getstationsdata", 429)
+        self.assertIsNone(self.request())
+        self.assertEqual(self.server.counts["api/getstationsdata"], 1)
+        self.assertGreater(self.auth.limiter.tryAcquire(), lnetatmo._QUOTA_HOLD_OFF - 5)
+        self.assertTrue(lnetatmo._BREAKER.allow())
+
+    def test_circuit_opens_and_closes(self):
+        self.openCircuit()
+        sent = self.server.counts["api/getstationsdata"]
+        self.assertRaises(lnetatmo.ApiUnavailable, self.stations)
+        self.assertEqual(self.server.counts["api/getstationsdata"], sent)
+        _sleep(0.25)
+        self.assertTrue(self.stations().stations)
+        self.assertEqual(lnetatmo._BREAKER.failures, 0)
+
+    def test_cached_data_while_open(self):
+        lnetatmo.WeatherStationData(self.auth)
+        self.openCircuit()
+        sent = self.server.counts["api/getstationsdata"]
+        self.assertTrue(self.stations().stations)
+        self.assertEqual(self.server.counts["api/getstationsdata"], sent)
+
+    def test_trial_ended_by_unexpected_error(self):
+        self.openCircuit()
+        _sleep(0.25)
+        lnetatmo.setTransport(FailingTransport(self.server.transport(), ValueError("malformed answer")))
+        self.assertRaises(ValueError, self.stations)
+        self.assertFalse(lnetatmo._BREAKER._trial)
+        _sleep(0.25)
+        self.assertTrue(self.stations().stations)
+
+    def test_token_renewed_during_trial(self):
+        self.openCircuit()
+        _sleep(0.25)
+        self.server.expireTokens()
+        self.assertTrue(self.stations().stations)
+        self.assertFalse(lnetatmo._BREAKER._trial)
+        self.assertEqual(lnetatmo._BREAKER.failures, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
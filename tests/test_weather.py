@@ -0,0 +1,152 @@
+"""
+Weather station measures : MinMaxTH queries and results, against the mock server
+"""
+import copy
+import itertools
+import threading
+import time
+import unittest
+
+import lnetatmo
+import lnetatmo_mock
+import lnetatmo_store
+
+
+class WeatherTest(unittest.TestCase):
+
+    def setUp(self):
+        lnetatmo._LIMITERS.clear()
+        self.server = lnetatmo_mock.MockNetatmoServer(stations=2).start()
+        lnetatmo.setTransport(self.server.transport())
+        self.auth = lnetatmo.ClientAuth("id", "secret", "user", "password", refreshAhead=None)
+        self.weather = lnetatmo.WeatherStationData(self.auth)
+
+    def tearDown(self):
+        lnetatmo.setTransport()
+        self.server.stop()
+        lnetatmo._LIMITERS.clear()
+
+    def test_min_max_query_of_other_station(self):
+        second = self.server.devices[1]
+        outdoor = second["modules"][0]
+        for module in (outdoor["_id"], outdoor["module_name"]):
+            query = self.weather._minMaxTHQuery(module)
+            self.assertEqual((query["device_id"], query["module_id"]), (second["_id"], outdoor["_id"]))
+        query = self.weather._minMaxTHQuery(second["_id"])
+        self.assertEqual(query["device_id"], second["_id"])
+        self.assertNotIn("module_id", query)
+        self.assertNotIn("module_id", self.weather._minMaxTHQuery())
+        self.assertRaises(lnetatmo.NoDevice, self.weather._minMaxTHQuery, "Nowhere")
+        minT, maxT, minH, maxH = self.weather.MinMaxTH(outdoor["module_name"])
+        self.assertTrue(minT <= maxT and minH <= maxH)
+
+    def test_closed_iteration_stops_workers(self):
+        queries = self.weather.measureQueries(date_begin=self.server.now - 86400 * 30)
+        workers = lambda: [ t for t in threading.enumerate() if t.name.endswith("(work)") ]
+        points = self.weather.iterMeasures(queries, workers=2)
+        next(points)
+        self.assertEqual(len(workers()), 2)
+        # Let the workers fill the pages queue, then make them wait for the rate limiter
+        time.sleep(0.5)
+        self.auth.limiter.holdOff(60)
+        for _ in itertools.islice(points, 3 * lnetatmo._MEASURE_PAGE - 1) : pass
+        time.sleep(0.3)
+        points.close()
+        deadline = time.time() + 3
+        while workers() and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(workers(), [])
+
+    def test_refresh_changes(self):
+        answer = self.weather._resp
+        before = copy.deepcopy(answer)
+        station = self.server.devices[0]
+        outdoor, rain = station["modules"][0], station["modules"][1]
+        data = self.weather.stationById(station["_id"])
+        self.assertFalse(self.weather.refresh(useCache=False))
+        # Measures of a module changed : the known dictionaries are updated in place, the answer is left as is
+        outdoor["dashboard_data"] = dict(outdoor["dashboard_data"], Temperature=-5, time_utc=outdoor["dashboard_data"]["time_utc"] + 300)
+        changes = self.weather.refresh(useCache=False)
+        self.assertEqual((changes.added, changes.removed, changes.updated), ([], [], [outdoor["_id"]]))
+        self.assertIs(self.weather.stationById(station["_id"]), data)
+        self.assertEqual(self.weather.moduleById(outdoor["_id"])["dashboard_data"]["Temperature"], -5)
+        self.assertEqual(answer, before)
+        # Module removed, then added back
+        station["modules"].remove(rain)
+        changes = self.weather.refresh(useCache=False)
+        self.assertEqual((changes.added, changes.removed, changes.updated), ([], [rain["_id"]], []))
+        self.assertIsNone(self.weather.moduleById(rain["_id"]))
+        station["modules"].append(rain)
+        changes = self.weather.refresh(useCache=False)
+        self.assertEqual((changes.added, changes.removed, changes.updated), ([rain["_id"]], [], []))
+        self.assertEqual(self.weather.moduleById(rain["_id"])["_id"], rain["_id"])
+
+    def test_changes_since_cursor(self):
+        station = self.server.devices[0]
+        outdoor, rain = station["modules"][0], station["modules"][1]
+        data, cursor = self.weather.lastDataChanges()
+        records, recordCursor = self.weather.recordChanges()
+        self.assertEqual(set(data), set(records))
+        self.assertEqual(len(data), 10)
+        self.assertEqual(self.weather.lastDataChanges(cursor), ({}, cursor))
+        # Only the modules changed since the cursor
+        outdoor["dashboard_data"] = dict(outdoor["dashboard_data"], Temperature=-5, time_utc=outdoor["dashboard_data"]["time_utc"] + 300)
+        self.weather.refresh(useCache=False)
+        data, later = self.weather.lastDataChanges(cursor)
+        records, _ = self.weather.recordChanges(recordCursor)
+        self.assertEqual(list(data), [outdoor["_id"]])
+        self.assertEqual(data[outdoor["_id"]]["Temperature"], -5)
+        self.assertEqual(list(records), [outdoor["_id"]])
+        self.assertEqual(records[outdoor["_id"]].Temperature, -5)
+        self.assertEqual(self.weather.lastDataChanges(later), ({}, later))
+        # Removed modules drop out of the changes and of the full list
+        station["modules"].remove(rain)
+        self.weather.refresh(useCache=False)
+        data, cursor = self.weather.lastDataChanges(later)
+        self.assertNotIn(rain["_id"], data)
+        self.assertNotIn(rain["_id"], self.weather.lastDataChanges()[0])
+        self.assertNotIn(rain["_id"], self.weather.recordChanges()[0])
+        self.assertNotIn(rain["_id"], self.weather.recordChanges(later)[0])
+
+    def test_lost_modules_without_record(self):
+        lost = [ self.server.devices[0]["modules"][1]["_id"], self.server.devices[1]["_id"] ]
+        del self.server.devices[0]["modules"][1]["dashboard_data"]
+        del self.server.devices[1]["dashboard_data"]
+        self.weather.refresh(useCache=False)
+        records, cursor = self.weather.recordChanges()
+        self.assertFalse(set(lost) & set(records))
+        self.assertEqual(len(records), 10 - len(lost))
+        self.assertEqual(self.weather.staleModules(), lost)
+
+    def test_min_max_result_without_values(self):
+        answer = lambda values: { "body" : [ { "beg_time" : 1000, "step_time" : 300, "value" : values } ] }
+        self.assertEqual(self.weather._minMaxTHResult(answer([ [20, 50], [None, 60], [18, 55] ])), (18, 20, 50, 60))
+        self.assertIsNone(self.weather._minMaxTHResult(answer([ [None, 50], [None, 60] ])))
+        self.assertIsNone(self.weather._minMaxTHResult(answer([ [20], [18] ])))
+        self.assertIsNone(self.weather._minMaxTHResult({ "body" : [] }))
+
+    def test_store_consulted_after_sync(self):
+        store = lnetatmo_store.MeasureStore()
+        weather = lnetatmo.WeatherStationData(self.auth, store=store)
+        outdoor = self.server.devices[0]["modules"][0]
+        self.assertEqual(weather.MinMaxTH(outdoor["module_name"]), self.weather.MinMaxTH(outdoor["module_name"]))
+        sent = self.server.counts["api/getmeasure"]
+        weather.MinMaxTH(outdoor["module_name"], "day")
+        weather.allMinMaxTH()
+        begin = int(time.time()) - 7200
+        station = self.server.devices[0]["_id"]
+        query = dict(device_id=station, scale="max", mtype="Temperature,Humidity", module_id=outdoor["_id"], date_begin=begin)
+        stored = [ weather.getMeasure(optimize=optimize, **query) for optimize in (True, False) ]
+        self.assertEqual(self.server.counts["api/getmeasure"], sent)
+        for optimize, answer in zip((True, False), stored):
+            self.assertEqual(lnetatmo.measureColumns(answer),
+                             lnetatmo.measureColumns(self.weather.getMeasure(optimize=optimize, **query)))
+        # Not covered by the store : other scale, or older than its history
+        weather.getMeasure(station, "1hour", "Temperature", date_begin=begin)
+        weather.getMeasure(station, "max", "Temperature", date_begin=begin - 86400 * 30)
+        self.assertEqual(self.server.counts["api/getmeasure"], sent + 4)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()